@@ -0,0 +1,31 @@
+"""Benchmarks of post-processing dipoles."""
+
+import numpy as np
+
+from hnn_core.dipole import Dipole, average_dipoles
+
+
+def _make_dipoles(n_trials, n_times=6801, dt=0.025):
+    """Create random dipoles of the length of a default simulation."""
+    rng = np.random.RandomState(0)
+    times = np.arange(n_times) * dt
+    return [Dipole(times, rng.randn(n_times, 3)) for _ in range(n_trials)]
+
+
+class TimeDipole(object):
+    """Smoothing and averaging dipoles."""
+    params = [10, 100]
+    param_names = ['n_trials']
+
+    def setup(self, n_trials):
+        self.dpls = _make_dipoles(n_trials)
+
+    def time_smooth(self, n_trials):
+        # smoothing is in place, so smooth new dipoles with the same data
+        for dpl in self.dpls:
+            dpl_data = np.c_[dpl.data['agg'], dpl.data['L2'], dpl.data['L5']]
+            # the default 30 ms window at dt=0.025 ms
+            Dipole(dpl.times, dpl_data).smooth(1200)
+
+    def time_average_dipoles(self, n_trials):
+        average_dipoles(self.dpls)
@@ -0,0 +1,33 @@
+"""Benchmarks of generating the event times of external feeds."""
+
+from hnn_core.feed import ExtFeed
+from hnn_core.params import create_pext
+
+from .common import get_params
+
+
+class TimeExtFeed(object):
+    """Generating the event times of each type of feed."""
+    params = ['extpois', 'extgauss', 'evprox1', 'evdist1', 'common']
+    param_names = ['feed_type']
+
+    def setup(self, feed_type):
+        params = get_params()
+        # make every feed type generate events
+        params.update({'t0_input_prox': 50., 't0_input_dist': 50.,
+                       'input_prox_A_weight_L2Pyr_ampa': 5.4e-5,
+                       'input_dist_A_weight_L2Pyr_ampa': 5.4e-5,
+                       'L2Pyr_Pois_A_weight_ampa': 1e-3,
+                       'L2Pyr_Pois_lamtha': 100.,
+                       'L2Pyr_Gauss_A_weight': 1e-3})
+        p_common, p_unique = create_pext(params, params['tstop'])
+        if feed_type == 'common':
+            self.feed_params = p_common[0]
+            self.target_cell_type = None
+        else:
+            self.feed_params = p_unique[feed_type]
+            self.target_cell_type = 'L2_pyramidal'
+
+    def time_event_times(self, feed_type):
+        for gid in range(100):
+            ExtFeed(feed_type, self.target_cell_type, self.feed_params, gid)
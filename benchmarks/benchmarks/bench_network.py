@@ -0,0 +1,86 @@
+"""Benchmarks of building and simulating the network."""
+
+from hnn_core import Network
+from hnn_core.cell import _get_pt3d, _get_segment_coords
+from hnn_core.neuron import NeuronNetwork, _simulate_single_trial
+
+from .common import get_params
+
+
+class TimeNetwork(object):
+    """Creating the Network object, without NEURON."""
+    params = [3, 10, 20]
+    param_names = ['n_pyr']
+
+    def setup(self, n_pyr):
+        self.params = get_params()
+        self.params.update({'N_pyr_x': n_pyr, 'N_pyr_y': n_pyr})
+
+    def time_network(self, n_pyr):
+        Network(self.params)
+
+
+class TimeBuild(object):
+    """Building the network in NEURON."""
+    params = [3, 10, 20]
+    param_names = ['n_pyr']
+    number = 1
+    repeat = 3
+    timeout = 300
+
+    def setup(self, n_pyr):
+        params = get_params()
+        params.update({'N_pyr_x': n_pyr, 'N_pyr_y': n_pyr})
+        self.net = Network(params)
+
+    def time_build(self, n_pyr):
+        NeuronNetwork(self.net)
+
+    def peakmem_build(self, n_pyr):
+        NeuronNetwork(self.net)
+
+
+class TimeGeometry(object):
+    """Positioning the cells and extracting their 3D geometry."""
+    params = [3, 10, 20]
+    param_names = ['n_pyr']
+    timeout = 300
+
+    def setup(self, n_pyr):
+        params = get_params()
+        params.update({'N_pyr_x': n_pyr, 'N_pyr_y': n_pyr})
+        self.neuron_net = NeuronNetwork(Network(params))
+
+    def time_move_cells_to_pos(self, n_pyr):
+        self.neuron_net.move_cells_to_pos()
+
+    def time_get_pt3d(self, n_pyr):
+        _get_pt3d(self.neuron_net.cells)
+
+    def time_get_segment_coords(self, n_pyr):
+        _get_segment_coords(self.neuron_net.cells)
+
+
+class TimeSimulate(object):
+    """Simulating a single trial of the parameter sets shipped with hnn-core.
+
+    The network is built once in setup so that only the simulation is timed.
+    """
+    params = ['default', 'alpha', 'gamma', 'N20']
+    param_names = ['params']
+    number = 1
+    repeat = 3
+    timeout = 1200
+
+    def setup(self, name):
+        self.neuron_net = NeuronNetwork(Network(get_params(name)))
+
+    def time_simulate_single_trial(self, name):
+        _simulate_single_trial(self.neuron_net)
+
+    def track_psolve(self, name):
+        """The time spent by NEURON in psolve alone."""
+        _simulate_single_trial(self.neuron_net)
+        return self.neuron_net._timings['simulate']['psolve']['max']
+
+    track_psolve.unit = 'seconds'
@@ -0,0 +1,25 @@
+"""Benchmarks of creating, copying and indexing parameters."""
+
+from hnn_core import Params
+
+from .common import get_params
+
+
+class TimeParams(object):
+    """Handling the parameters in a parameter sweep."""
+
+    def setup(self):
+        self.params = get_params()
+        self.params_dict = dict(self.params)
+
+    def time_create(self):
+        Params(self.params_dict)
+
+    def time_copy(self):
+        self.params.copy()
+
+    def time_get_wildcard(self):
+        self.params['L2Pyr*']
+
+    def time_set_wildcard(self):
+        self.params['prng_*'] = 0
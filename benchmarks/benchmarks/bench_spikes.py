@@ -0,0 +1,120 @@
+"""Benchmarks of the Spikes object and its input and output."""
+
+import os.path as op
+import shutil
+import tempfile
+
+import numpy as np
+
+from hnn_core import Network, Spikes, read_spikes
+from hnn_core.analysis import (cross_correlograms, spike_time_tiling,
+                               synchrony_index)
+
+from .common import get_params
+
+
+def _make_spikes(n_trials, n_spikes, gid_dict):
+    """Create random spikes of all the sources of a network."""
+    rng = np.random.RandomState(0)
+    n_gids = max(gids.stop for gids in gid_dict.values())
+    times = [np.sort(rng.uniform(0, 170., n_spikes)).tolist()
+             for _ in range(n_trials)]
+    gids = [rng.randint(0, n_gids, n_spikes).tolist()
+            for _ in range(n_trials)]
+    spikes = Spikes(times=times, gids=gids,
+                    types=[list() for _ in range(n_trials)])
+    spikes.update_types(gid_dict)
+    return spikes
+
+
+class TimeSpikes(object):
+    """Assigning types to spikes, and writing and reading spike files."""
+    params = [1000, 100000]
+    param_names = ['n_spikes']
+
+    def setup(self, n_spikes):
+        self.gid_dict = Network(get_params()).gid_dict
+        self.spikes = _make_spikes(5, n_spikes, self.gid_dict)
+        self.tempdir = tempfile.mkdtemp()
+        self.fname = op.join(self.tempdir, 'spk_%d.txt')
+        self.spikes.write(self.fname)
+
+    def teardown(self, n_spikes):
+        shutil.rmtree(self.tempdir)
+
+    def time_update_types(self, n_spikes):
+        self.spikes.update_types(self.gid_dict)
+
+    def time_write(self, n_spikes):
+        self.spikes.write(self.fname)
+
+    def time_read_spikes(self, n_spikes):
+        read_spikes(op.join(self.tempdir, 'spk_*.txt'))
+
+
+class TimeSpikeRates(object):
+    """Counting spikes and computing firing rates over all trials."""
+    params = [100000, 1000000]
+    param_names = ['n_spikes']
+
+    def setup(self, n_spikes):
+        self.gid_dict = Network(get_params()).gid_dict
+        self.spikes = _make_spikes(10, n_spikes // 10, self.gid_dict)
+
+    def time_count(self, n_spikes):
+        self.spikes.count()
+
+    def time_rates(self, n_spikes):
+        self.spikes.rates(self.gid_dict, 0., 170.)
+
+    def time_psth_smooth(self, n_spikes):
+        self.spikes.psth(self.gid_dict, 0., 170., bin_width=0.5, sigma=2.)
+
+
+class TimeSpikeIndex(object):
+    """Querying the spikes of cells and cell types over many trials."""
+    params = [100000, 1000000]
+    param_names = ['n_spikes']
+
+    def setup(self, n_spikes):
+        self.gid_dict = Network(get_params()).gid_dict
+        self.spikes = _make_spikes(100, n_spikes // 100, self.gid_dict)
+        self.spikes.get_spikes(cell_type='L5Pyr')
+
+    def time_build_index(self, n_spikes):
+        self.spikes._index = None
+        self.spikes.get_spikes(gid=0)
+
+    def time_get_spikes_gid(self, n_spikes):
+        for gid in range(100):
+            self.spikes.get_spikes(gid=gid, tmin=50., tmax=80.)
+
+    def time_get_spikes_cell_type(self, n_spikes):
+        self.spikes.get_spikes(cell_type='L5Pyr', tmin=50., tmax=80.)
+
+    def time_interspike_intervals(self, n_spikes):
+        self.spikes.interspike_intervals()
+
+
+class TimeSpikeSynchrony(object):
+    """Synchrony measures of all pairs of cells over many trials."""
+    params = [100, 1000]
+    param_names = ['n_cells']
+
+    def setup(self, n_cells):
+        self.gid_dict = Network(get_params()).gid_dict
+        self.spikes = _make_spikes(20, 20000, self.gid_dict)
+        self.gids = list(range(n_cells))
+
+    def time_cross_correlograms(self, n_cells):
+        cross_correlograms(self.spikes, self.gids[:100], self.gids,
+                           tmax=170.)
+
+    def time_cross_correlograms_average(self, n_cells):
+        cross_correlograms(self.spikes, self.gids, tmax=170., average=True)
+
+    def time_spike_time_tiling(self, n_cells):
+        spike_time_tiling(self.spikes, self.gids, tmax=170.)
+
+    def time_synchrony_index(self, n_cells):
+        synchrony_index(self.spikes, self.gid_dict, 0., 170.)
@@ -0,0 +1,52 @@
+"""Parameters shared by the benchmarks."""
+
+import os.path as op
+
+import hnn_core
+from hnn_core import read_params
+
+# the updates of plot_simulate_alpha.py to the default parameters
+_ALPHA_UPDATES = {
+    'dipole_scalefctr': 150000.0,
+    'dipole_smooth_win': 0,
+    'tstop': 310.0,
+    't0_input_prox': 2000.0,
+    'tstop_input_prox': 310.0,
+    't0_input_dist': 50.0,
+    'tstop_input_dist': 1001.0,
+    't_evprox_1': 1000,
+    'sigma_t_evprox_1': 2.5,
+    't_evprox_2': 2000.0,
+    'sigma_t_evprox_2': 7.0,
+    't_evdist_1': 2000.0,
+    'sigma_t_evdist_1': 6.0,
+    'input_dist_A_weight_L2Pyr_ampa': 5.4e-5,
+    'input_dist_A_weight_L5Pyr_ampa': 5.4e-5,
+    'sync_evinput': 1,
+    'prng_seedcore_input_dist': 3
+}
+
+_PARAM_FNAMES = {'default': 'default.json', 'alpha': 'default.json',
+                 'gamma': 'gamma_L5weak_L2weak.json', 'N20': 'N20.json'}
+
+
+def get_params(name='default'):
+    """Read the parameters shipped with hnn-core.
+
+    Parameters
+    ----------
+    name : str
+        Can be 'default', 'alpha', 'gamma' or 'N20'.
+
+    Returns
+    -------
+    params : instance of Params
+        The parameters.
+    """
+    params_fname = op.join(op.dirname(hnn_core.__file__), 'param',
+                           _PARAM_FNAMES[name])
+    params = read_params(params_fname)
+    if name == 'alpha':
+        params.update(_ALPHA_UPDATES)
+        params['gbar_ev*'] = 0.0
+    return params
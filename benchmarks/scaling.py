@@ -0,0 +1,324 @@
+"""Strong and weak scaling of the parallel backends.
+
+Each configuration of backend, grid size, number of trials and number of
+workers is simulated in a fresh Python process. The wall time, the CPU
+time and the peak resident memory of the whole process tree are
+measured. The report lists the speedup and parallel efficiency of each
+configuration and recommends the settings for this machine.
+
+Example::
+
+    $ python scaling.py --grid 3 10 --trials 1 4 --workers 1 2 4 \\
+          --backends joblib mpi --tstop 50 --out scaling.json
+
+Configurations that use more workers than the cores available to this
+process are marked as oversubscribed and never recommended.
+"""
+
+import argparse
+import json
+import os
+import os.path as op
+import subprocess
+import sys
+import threading
+from time import perf_counter
+
+
+def _get_n_cores():
+    """The number of cores this process is allowed to run on."""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count()
+
+
+class _TreeMonitor(object):
+    """Sample the memory and CPU time of a process and its children."""
+
+    def __init__(self, interval=0.05):
+        import psutil
+
+        self._process = psutil.Process()
+        self._interval = interval
+        self._stop = threading.Event()
+        self._cpu_children = dict()
+        self.peak_rss = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _sample(self):
+        import psutil
+
+        rss = self._process.memory_info().rss
+        for child in self._process.children(recursive=True):
+            try:
+                rss += child.memory_info().rss
+                times = child.cpu_times()
+                self._cpu_children[child.pid] = times.user + times.system
+            except psutil.Error:  # the child exited in the meantime
+                pass
+        self.peak_rss = max(self.peak_rss, rss)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._sample()
+            self._stop.wait(self._interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._sample()
+        self._stop.set()
+        self._thread.join()
+
+    @property
+    def cpu_children(self):
+        """The CPU time (s) of the children that were sampled."""
+        return sum(self._cpu_children.values())
+
+
+def run_config(backend, grid, n_trials, n_workers, tstop):
+    """Simulate one configuration and measure its resource usage.
+
+    Parameters
+    ----------
+    backend : str
+        'joblib' or 'mpi'.
+    grid : int
+        The number of pyramidal cells along each side of the grid.
+    n_trials : int
+        The number of trials.
+    n_workers : int
+        The number of joblib jobs or MPI processes.
+    tstop : float
+        The duration of each trial (ms).
+
+    Returns
+    -------
+    result : dict
+        The configuration with its wall time ('wall_time', s), CPU time
+        ('cpu_time', s), peak resident memory of the process tree
+        ('peak_rss', MB) and the number of workers the backend actually
+        used ('n_workers_used').
+    """
+    import hnn_core
+    from hnn_core import (read_params, Network, simulate_dipole,
+                          JoblibBackend, MPIBackend)
+
+    params = read_params(op.join(op.dirname(hnn_core.__file__), 'param',
+                                 'default.json'))
+    params.update({'N_pyr_x': grid, 'N_pyr_y': grid, 'tstop': tstop})
+    net = Network(params)
+
+    if backend == 'joblib':
+        parallel = JoblibBackend(n_jobs=n_workers)
+        n_workers_used = n_workers
+    else:
+        parallel = MPIBackend(n_procs=n_workers)
+        n_workers_used = parallel.n_procs
+
+    try:
+        monitor = _TreeMonitor()
+    except ImportError:
+        monitor = None
+
+    times_start = os.times()
+    start = perf_counter()
+    if monitor is not None:
+        monitor.__enter__()
+    with parallel:
+        simulate_dipole(net, n_trials=n_trials)
+    if monitor is not None:
+        monitor.__exit__()
+    wall_time = perf_counter() - start
+    times_stop = os.times()
+
+    # children that were waited for are accounted by os.times, the
+    # workers that joblib keeps alive only by sampling them
+    cpu_time = sum(stop - start for start, stop in
+                   zip(times_start[:4], times_stop[:4]))
+    if monitor is not None:
+        cpu_time = max(cpu_time, sum(times_stop[:2]) - sum(times_start[:2]) +
+                       monitor.cpu_children)
+        peak_rss = monitor.peak_rss / 1e6
+    else:
+        import resource
+        # without psutil, the largest of this process and its children
+        peak_rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                       resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+        # ru_maxrss is in kB on Linux and in bytes on macOS
+        peak_rss /= 1e6 if sys.platform == 'darwin' else 1e3
+
+    return dict(backend=backend, grid=grid, n_trials=n_trials,
+                n_workers=n_workers, n_workers_used=n_workers_used,
+                tstop=tstop, wall_time=wall_time, cpu_time=cpu_time,
+                peak_rss=peak_rss)
+
+
+def _run_in_subprocess(backend, grid, n_trials, n_workers, tstop):
+    """Run a configuration in a fresh Python process."""
+    cmd = [sys.executable, op.abspath(__file__), '--run', backend,
+           str(grid), str(n_trials), str(n_workers), str(tstop)]
+    proc = subprocess.run(cmd, stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE, universal_newlines=True)
+    if proc.returncode != 0:
+        raise RuntimeError('Configuration %s failed:\n%s'
+                           % (cmd[3:], proc.stderr[-2000:]))
+    # the result is the last line, after the output of the simulation
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def make_report(results, n_cores, tolerance=0.1):
+    """Compute the scaling of the measured configurations.
+
+    Parameters
+    ----------
+    results : list of dict
+        The results of run_config.
+    n_cores : int
+        The number of cores available.
+    tolerance : float
+        A configuration is recommended if it uses the fewest workers among
+        those within this fraction of the shortest wall time.
+
+    Returns
+    -------
+    report : dict
+        The results, augmented with the CPU efficiency, speedup and
+        parallel efficiency (strong scaling relative to the fewest workers
+        of the same problem) and the weak scaling efficiency (relative to
+        the fewest workers with the same number of trials per worker), and
+        the recommended configuration of each problem size.
+    """
+    for result in results:
+        n_workers = result['n_workers_used']
+        result['oversubscribed'] = n_workers > n_cores
+        result['cpu_efficiency'] = (result['cpu_time'] /
+                                    (result['wall_time'] * n_workers))
+
+    # strong scaling: same problem, more workers
+    problems = dict()
+    for result in results:
+        key = (result['backend'], result['grid'], result['n_trials'])
+        problems.setdefault(key, list()).append(result)
+    for group in problems.values():
+        base = min(group, key=lambda result: result['n_workers_used'])
+        for result in group:
+            speedup = base['wall_time'] / result['wall_time']
+            ratio = result['n_workers_used'] / base['n_workers_used']
+            result['speedup'] = speedup
+            result['parallel_efficiency'] = speedup / ratio
+
+    # weak scaling: the same number of trials per worker
+    weak = dict()
+    for result in results:
+        key = (result['backend'], result['grid'],
+               result['n_trials'] / result['n_workers_used'])
+        weak.setdefault(key, list()).append(result)
+    for group in weak.values():
+        base = min(group, key=lambda result: result['n_workers_used'])
+        for result in group:
+            result['weak_efficiency'] = base['wall_time'] / result['wall_time']
+
+    # recommend the fewest workers close to the shortest wall time
+    recommendations = list()
+    sizes = sorted({(result['grid'], result['n_trials'])
+                    for result in results})
+    for grid, n_trials in sizes:
+        candidates = [result for result in results
+                      if (result['grid'], result['n_trials']) ==
+                      (grid, n_trials) and not result['oversubscribed']]
+        if len(candidates) == 0:
+            continue
+        fastest = min(result['wall_time'] for result in candidates)
+        good = [result for result in candidates
+                if result['wall_time'] <= fastest * (1 + tolerance)]
+        best = min(good, key=lambda result: (result['n_workers_used'],
+                                             result['wall_time']))
+        recommendations.append(dict(
+            grid=grid, n_trials=n_trials, backend=best['backend'],
+            n_workers=best['n_workers_used'], wall_time=best['wall_time'],
+            peak_rss=best['peak_rss']))
+
+    return dict(n_cores=n_cores, results=results,
+                recommendations=recommendations)
+
+
+def print_report(report):
+    """Print the report as tables."""
+    print('\nCores available: %d\n' % report['n_cores'])
+    header = ('%-7s %5s %7s %5s %8s %9s %8s %8s %8s %8s %9s'
+              % ('backend', 'grid', 'trials', 'req', 'workers', 'wall (s)',
+                 'cpu eff', 'speedup', 'par eff', 'weak eff', 'RSS (MB)'))
+    print(header)
+    print('-' * len(header))
+    for result in sorted(report['results'], key=lambda result: (
+            result['backend'], result['grid'], result['n_trials'],
+            result['n_workers_used'])):
+        workers = '%d%s' % (result['n_workers_used'],
+                            '*' if result['oversubscribed'] else '')
+        print('%-7s %5d %7d %5d %8s %9.2f %8.2f %8.2f %8.2f %8.2f %9.0f'
+              % (result['backend'], result['grid'], result['n_trials'],
+                 result['n_workers'], workers,
+                 result['wall_time'], result['cpu_efficiency'],
+                 result['speedup'], result['parallel_efficiency'],
+                 result['weak_efficiency'], result['peak_rss']))
+    print('req: requested workers, which MPIBackend limits to the cores '
+          'available')
+    print('* oversubscribed: more workers than available cores\n')
+
+    print('Recommended settings:')
+    for rec in report['recommendations']:
+        print('  grid %dx%d, %d trials: %s with %d workers (%.2f s, %.0f MB)'
+              % (rec['grid'], rec['grid'], rec['n_trials'], rec['backend'],
+                 rec['n_workers'], rec['wall_time'], rec['peak_rss']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--grid', type=int, nargs='+', default=[3, 10],
+                        help='Number of pyramidal cells along each side')
+    parser.add_argument('--trials', type=int, nargs='+', default=[1, 4],
+                        help='Number of trials')
+    parser.add_argument('--workers', type=int, nargs='+',
+                        default=sorted({1, max(_get_n_cores() // 2, 1),
+                                        _get_n_cores()}),
+                        help='Number of joblib jobs or MPI processes')
+    parser.add_argument('--backends', nargs='+', default=['joblib', 'mpi'],
+                        choices=['joblib', 'mpi'])
+    parser.add_argument('--tstop', type=float, default=50.,
+                        help='Duration of each trial (ms)')
+    parser.add_argument('--out', default=None,
+                        help='JSON file to write the report to')
+    parser.add_argument('--run', nargs=5, default=None,
+                        metavar=('BACKEND', 'GRID', 'TRIALS', 'WORKERS',
+                                 'TSTOP'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run is not None:
+        backend, grid, n_trials, n_workers, tstop = args.run
+        result = run_config(backend, int(grid), int(n_trials),
+                            int(n_workers), float(tstop))
+        print(json.dumps(result))
+        return
+
+    results = list()
+    for backend in args.backends:
+        for grid in args.grid:
+            for n_trials in args.trials:
+                for n_workers in args.workers:
+                    print('Running %s, grid %d, %d trials, %d workers'
+                          % (backend, grid, n_trials, n_workers))
+                    results.append(_run_in_subprocess(
+                        backend, grid, n_trials, n_workers, args.tstop))
+
+    report = make_report(results, _get_n_cores())
+    print_report(report)
+    if args.out is not None:
+        with open(args.out, 'w') as fid:
+            json.dump(report, fid, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -64,15 +64,10 @@ dpl[0].plot()
 ###############################################################################
 # We can confirm that what we simulate is indeed 10 Hz activity.
 import matplotlib.pyplot as plt
-from scipy.signal import spectrogram
-import numpy as np
-sfreq = 1000. / params['dt']
-n_fft = 1024 * 8
-freqs, _, psds = spectrogram(
-    dpl[0].data['agg'], sfreq, window='hamming', nfft=n_fft,
-    nperseg=n_fft, noverlap=0)
+from hnn_core.analysis import psd_welch
+psds, freqs = psd_welch(dpl, fmax=40., n_fft=1024 * 8)
 plt.figure()
-plt.plot(freqs, np.mean(psds, axis=-1))
+plt.plot(freqs, psds[0, 0])
 plt.xlim((0, 40))
 plt.xlabel('Frequency (Hz)')
 plt.ylabel('PSD')
@@ -34,29 +34,41 @@ net = Network(params)
 dpls = simulate_dipole(net, n_trials=1)
 
 ###############################################################################
-# We can plot the time-frequency response using MNE
+# We can plot the time-frequency response using Morlet wavelets
 import numpy as np
 import matplotlib.pyplot as plt
-from mne.time_frequency import tfr_array_multitaper
+from hnn_core.analysis import tfr_morlet
 
 fig, axes = plt.subplots(2, 1, sharex=True, figsize=(6, 6))
 dpls[0].plot(ax=axes[0], layer='agg', show=False)
 
-sfreq = 1000. / params['dt']
-time_bandwidth = 4.0
 freqs = np.arange(20., 100., 1.)
-n_cycles = freqs / 4.
-
-# MNE expects an array of shape (n_trials, n_channels, n_times)
-data = dpls[0].data['agg'][None, None, :]
-power = tfr_array_multitaper(data, sfreq=sfreq, freqs=freqs,
-                             n_cycles=n_cycles,
-                             time_bandwidth=time_bandwidth,
-                             output='power')
-# stop = params['tstop'] + params['dt'] so last point is included
-times = np.arange(0, params['tstop'] + params['dt'], params['dt'])
-axes[1].pcolormesh(times, freqs, power[0, 0, ...], cmap='RdBu_r')
+n_cycles = freqs / 8.
+
+# power has shape (n_trials, n_layers, n_freqs, n_times)
+power = tfr_morlet(dpls, freqs=freqs, n_cycles=n_cycles, layers=['agg'])
+axes[1].pcolormesh(dpls[0].times, freqs, power[0, 0, ...], cmap='RdBu_r')
 axes[1].set_xlabel('Time (ms)')
 axes[1].set_ylabel('Frequency (Hz)')
 plt.xlim((0, params['tstop']))
 plt.show()
+
+###############################################################################
+# The gamma rhythm arises from the synchronous firing of the cells. We can
+# measure the synchrony of each cell type and the average cross-correlogram
+# of the pairs of L5 pyramidal cells
+from hnn_core.analysis import synchrony_index, cross_correlograms
+
+cell_types = ['L2_pyramidal', 'L2_basket', 'L5Pyr', 'L5_basket']
+sync = synchrony_index(net.spikes, net.gid_dict, 0., params['tstop'],
+                       cell_types=cell_types)
+print(dict(zip(cell_types, sync[0])))
+
+ccg, lags = cross_correlograms(net.spikes, net.gid_dict['L5Pyr'],
+                               tmax=params['tstop'], max_lag=50.,
+                               average=True)
+plt.figure()
+plt.plot(lags, ccg)
+plt.xlabel('Lag (ms)')
+plt.ylabel('Coincidences per pair')
+plt.show()
@@ -1,7 +1,17 @@
-from .dipole import simulate_dipole, read_dipole, average_dipoles
+from .dipole import simulate_dipole, read_dipole, average_dipoles, reprocess
 from .feed import ExtFeed
 from .params import Params, read_params
-from .network import Network, Spikes, read_spikes
-from .pyramidal import L2Pyr, L5Pyr
-from .basket import L2Basket, L5Basket
-from .parallel_backends import MPIBackend, JoblibBackend
\ No newline at end of file
+from .network import Network, Spikes, read_spikes, read_snapshot
+from .parallel_backends import MPIBackend, JoblibBackend, AutoBackend
+
+# the cell classes need NEURON, so they are imported on first use
+_LAZY_CELLS = {'L2Pyr': 'pyramidal', 'L5Pyr': 'pyramidal',
+               'L2Basket': 'basket', 'L5Basket': 'basket'}
+
+
+def __getattr__(name):
+    if name in _LAZY_CELLS:
+        from importlib import import_module
+        module = import_module('.' + _LAZY_CELLS[name], __name__)
+        return getattr(module, name)
+    raise AttributeError('module %r has no attribute %r' % (__name__, name))
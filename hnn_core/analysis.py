@@ -0,0 +1,632 @@
+"""Spectral analysis of simulated dipoles, synchrony of spikes and current
+source density of extracellular potentials."""
+
+from functools import lru_cache
+
+import numpy as np
+
+
+def _next_pow2(n):
+    """Return the smallest power of 2 that is greater than or equal to n."""
+    return int(2 ** np.ceil(np.log2(n)))
+
+
+def _get_sfreq(times):
+    """Sampling frequency (in Hz) of a time vector in ms."""
+    times = np.asarray(times)
+    if times.size < 2:
+        raise ValueError('Need at least two time samples to compute the '
+                         'sampling frequency. Got %d' % times.size)
+    return 1000. / np.mean(np.diff(times))
+
+
+def _stack_dipoles(dpls, layers):
+    """Stack the layers of a list of dipoles into a single array.
+
+    Parameters
+    ----------
+    dpls : instance of Dipole | list of Dipole
+        The dipoles. All dipoles must share the same time vector.
+    layers : list of str | None
+        The layers to stack. If None, defaults to ['agg', 'L2', 'L5'].
+
+    Returns
+    -------
+    data : array, shape (n_trials, n_layers, n_times)
+        The stacked dipole time courses.
+    sfreq : float
+        The sampling frequency in Hz.
+    """
+    from .dipole import Dipole
+
+    if isinstance(dpls, Dipole):
+        dpls = [dpls]
+    if len(dpls) == 0:
+        raise ValueError('Need at least one Dipole object')
+    if layers is None:
+        layers = ['agg', 'L2', 'L5']
+    if isinstance(layers, str):
+        layers = [layers]
+
+    n_times = len(dpls[0].times)
+    for dpl_idx, dpl in enumerate(dpls):
+        if len(dpl.times) != n_times:
+            raise ValueError('Dipole at index %d has %d time samples. '
+                             'Expected %d' % (dpl_idx, len(dpl.times),
+                                              n_times))
+        for layer in layers:
+            if layer not in dpl.data:
+                raise ValueError('layer must be one of %s. Got %s'
+                                 % (list(dpl.data.keys()), layer))
+
+    data = np.empty((len(dpls), len(layers), n_times))
+    for trial_idx, dpl in enumerate(dpls):
+        for layer_idx, layer in enumerate(layers):
+            data[trial_idx, layer_idx] = dpl.data[layer]
+
+    return data, _get_sfreq(dpls[0].times)
+
+
+@lru_cache(maxsize=32)
+def _morlet_bank(sfreq, freqs, n_cycles):
+    """Compute a bank of complex Morlet wavelets.
+
+    Parameters
+    ----------
+    sfreq : float
+        The sampling frequency in Hz.
+    freqs : tuple of float
+        The frequencies of the wavelets in Hz.
+    n_cycles : tuple of float
+        The number of cycles of each wavelet.
+
+    Returns
+    -------
+    wavelets : tuple of array
+        The wavelets, each normalized to unit energy.
+    """
+    wavelets = list()
+    for freq, n_cycle in zip(freqs, n_cycles):
+        sigma_t = n_cycle / (2. * np.pi * freq)
+        # the wavelet spans 5 standard deviations of its Gaussian envelope
+        # on either side of 0 and is symmetric around its center sample
+        n_half = int(np.ceil(5. * sigma_t * sfreq))
+        t = np.arange(-n_half, n_half + 1) / sfreq
+        oscillation = np.exp(2. * 1j * np.pi * freq * t)
+        envelope = np.exp(-t ** 2 / (2. * sigma_t ** 2))
+        wavelet = oscillation * envelope
+        wavelet /= np.sqrt(0.5) * np.linalg.norm(wavelet)
+        wavelet.setflags(write=False)
+        wavelets.append(wavelet)
+    return tuple(wavelets)
+
+
+@lru_cache(maxsize=32)
+def _morlet_bank_fft(sfreq, freqs, n_cycles, n_fft):
+    """Fourier transforms of a bank of Morlet wavelets.
+
+    Each wavelet is circularly shifted so that its center sample lies at
+    index 0. Multiplying by the FFT of a zero-padded signal then yields the
+    'same'-mode convolution in the first n_times samples of the inverse FFT.
+
+    Returns
+    -------
+    wavelets_fft : array, shape (n_freqs, n_fft)
+        The Fourier transforms of the wavelets.
+    """
+    wavelets = _morlet_bank(sfreq, freqs, n_cycles)
+    wavelets_fft = np.empty((len(wavelets), n_fft), dtype=np.complex128)
+    for freq_idx, wavelet in enumerate(wavelets):
+        padded = np.zeros(n_fft, dtype=np.complex128)
+        padded[:wavelet.size] = wavelet
+        padded = np.roll(padded, -(wavelet.size // 2))
+        wavelets_fft[freq_idx] = np.fft.fft(padded)
+    wavelets_fft.setflags(write=False)
+    return wavelets_fft
+
+
+def tfr_morlet(dpls, freqs, n_cycles=7., layers=None, output='power'):
+    """Compute the Morlet wavelet time-frequency representation of dipoles.
+
+    All trials and layers are transformed at once using FFT-based
+    convolution. The wavelet banks are cached for each combination of
+    sampling frequency, frequencies and number of cycles.
+
+    Parameters
+    ----------
+    dpls : instance of Dipole | list of Dipole
+        The dipoles. All dipoles must share the same time vector.
+    freqs : array-like of float, shape (n_freqs,)
+        The frequencies of interest in Hz.
+    n_cycles : float | array-like of float, shape (n_freqs,)
+        The number of cycles of each wavelet.
+    layers : list of str | None
+        The dipole layers to transform. If None, defaults to
+        ['agg', 'L2', 'L5'].
+    output : str
+        Can be 'power' for the squared magnitude or 'complex' for the
+        complex wavelet coefficients.
+
+    Returns
+    -------
+    tfr : array, shape (n_trials, n_layers, n_freqs, n_times)
+        The time-frequency representation.
+    """
+    if output not in ('power', 'complex'):
+        raise ValueError("output must be one of 'power', 'complex'. "
+                         "Got %s" % output)
+
+    data, sfreq = _stack_dipoles(dpls, layers)
+    n_trials, n_layers, n_times = data.shape
+
+    freqs = np.atleast_1d(np.asarray(freqs, dtype=float))
+    if freqs.ndim != 1 or np.any(freqs <= 0):
+        raise ValueError('freqs must be a 1D array of positive values')
+    n_cycles = np.broadcast_to(np.asarray(n_cycles, dtype=float),
+                               freqs.shape)
+
+    sfreq = float(sfreq)
+    freqs = tuple(freqs.tolist())
+    n_cycles = tuple(n_cycles.tolist())
+    wavelets = _morlet_bank(sfreq, freqs, n_cycles)
+    max_len = max(wavelet.size for wavelet in wavelets)
+    if max_len > n_times:
+        raise ValueError('At least one of the wavelets (%d samples) is '
+                         'longer than the signal (%d samples). Use fewer '
+                         'cycles or higher frequencies.' % (max_len, n_times))
+
+    n_fft = _next_pow2(n_times + max_len - 1)
+    wavelets_fft = _morlet_bank_fft(sfreq, freqs, n_cycles, n_fft)
+    data_fft = np.fft.fft(data, n_fft, axis=-1)
+
+    dtype = np.complex128 if output == 'complex' else np.float64
+    tfr = np.empty((n_trials, n_layers, len(freqs), n_times), dtype=dtype)
+    # loop over frequencies so that memory scales with the output size
+    for freq_idx in range(len(freqs)):
+        coefs = np.fft.ifft(data_fft * wavelets_fft[freq_idx],
+                            axis=-1)[..., :n_times]
+        if output == 'power':
+            tfr[:, :, freq_idx] = coefs.real ** 2 + coefs.imag ** 2
+        else:
+            tfr[:, :, freq_idx] = coefs
+    return tfr
+
+
+def psd_welch(dpls, fmin=0., fmax=np.inf, n_fft=256, n_overlap=0,
+              layers=None):
+    """Compute the power spectral density of dipoles with Welch's method.
+
+    Segments of all trials and layers are windowed and transformed at once.
+
+    Parameters
+    ----------
+    dpls : instance of Dipole | list of Dipole
+        The dipoles. All dipoles must share the same time vector.
+    fmin : float
+        The lower frequency of interest in Hz.
+    fmax : float
+        The upper frequency of interest in Hz.
+    n_fft : int
+        The length of each segment (and FFT). It is truncated to the
+        number of time samples if the signal is shorter.
+    n_overlap : int
+        The number of samples that overlap between segments.
+    layers : list of str | None
+        The dipole layers to analyze. If None, defaults to
+        ['agg', 'L2', 'L5'].
+
+    Returns
+    -------
+    psds : array, shape (n_trials, n_layers, n_freqs)
+        The power spectral densities.
+    freqs : array, shape (n_freqs,)
+        The frequencies in Hz.
+    """
+    data, sfreq = _stack_dipoles(dpls, layers)
+    n_times = data.shape[-1]
+
+    n_fft = min(int(n_fft), n_times)
+    if not 0 <= n_overlap < n_fft:
+        raise ValueError('n_overlap must be non-negative and smaller than '
+                         'n_fft (%d). Got %d' % (n_fft, n_overlap))
+    step = n_fft - n_overlap
+    n_segments = (n_times - n_fft) // step + 1
+
+    # view the data as (n_trials, n_layers, n_segments, n_fft) without copy
+    strides = data.strides[:-1] + (data.strides[-1] * step,
+                                   data.strides[-1])
+    segments = np.lib.stride_tricks.as_strided(
+        data, shape=data.shape[:-1] + (n_segments, n_fft), strides=strides,
+        writeable=False)
+
+    # periodic Hann window
+    window = 0.5 - 0.5 * np.cos(2 * np.pi * np.arange(n_fft) / n_fft)
+    segments = segments - segments.mean(axis=-1, keepdims=True)
+    spectrum = np.fft.rfft(segments * window, axis=-1)
+    psds = (spectrum.real ** 2 + spectrum.imag ** 2).mean(axis=-2)
+    psds /= sfreq * np.sum(window ** 2)
+    # one-sided spectrum: double all but DC (and Nyquist for even n_fft)
+    if n_fft % 2:
+        psds[..., 1:] *= 2
+    else:
+        psds[..., 1:-1] *= 2
+
+    freqs = np.fft.rfftfreq(n_fft, 1. / sfreq)
+    mask = (freqs >= fmin) & (freqs <= fmax)
+    return psds[..., mask], freqs[mask]
+
+
+def csd(lfp, spacing, sigma=0.3, vaknin=True):
+    """Compute the current source density along a laminar electrode array.
+
+    The CSD is estimated from the negative second spatial difference of the
+    potential along the array, for all trials and time samples at once.
+
+    Parameters
+    ----------
+    lfp : array, shape (..., n_electrodes, n_times)
+        The potentials (uV) of equally spaced electrodes, in their order
+        along the array, e.g., an element of Network.lfp.
+    spacing : float
+        The distance (um) between neighboring electrodes.
+    sigma : float
+        The conductivity (S/m) of the extracellular medium.
+    vaknin : bool
+        If True, the potentials of the first and last electrodes are
+        repeated beyond the ends of the array (Vaknin et al., 1988) so that
+        the CSD is estimated at every electrode. If False, it is only
+        estimated at the inner electrodes.
+
+    Returns
+    -------
+    csd : array, shape (..., n_electrodes, n_times)
+        The current source density (uA/mm^3). Current sinks are negative.
+        There are n_electrodes - 2 rows if vaknin is False.
+    """
+    lfp = np.asarray(lfp, dtype=float)
+    if lfp.ndim < 2:
+        raise ValueError('lfp must have at least 2 dimensions. Got %d'
+                         % lfp.ndim)
+    n_min = 2 if vaknin else 3
+    if lfp.shape[-2] < n_min:
+        raise ValueError('Need at least %d electrodes. Got %d'
+                         % (n_min, lfp.shape[-2]))
+    if spacing <= 0:
+        raise ValueError('spacing must be positive. Got %s' % spacing)
+
+    if vaknin:
+        lfp = np.concatenate((lfp[..., :1, :], lfp, lfp[..., -1:, :]),
+                             axis=-2)
+    diff2 = lfp[..., 2:, :] - 2 * lfp[..., 1:-1, :] + lfp[..., :-2, :]
+    # S/m * uV / um^2 is 1e3 uA/mm^3
+    return -1e3 * sigma * diff2 / spacing ** 2
+
+
+def _bin_spikes(spikes, gids, tmin, tmax, bin_width, n_pad):
+    """Bin the spikes of cells as a sparse matrix in coordinate format.
+
+    The trials are concatenated along the columns, each preceded by n_pad
+    empty bins so that shifts and windows of up to n_pad bins do not cross
+    trials.
+
+    Returns
+    -------
+    rows : array of int, shape (n_spikes,)
+        The index in gids of the cell of each spike, in increasing order.
+    cols : array of int, shape (n_spikes,)
+        The column of each spike.
+    n_cols : int
+        The number of columns.
+    valid : array of bool, shape (n_cols,)
+        Whether each column is a bin of a trial rather than padding.
+    """
+    gids = np.asarray(gids, dtype=int)
+    n_bins = int(np.ceil((tmax - tmin) / bin_width))
+    n_trials = len(spikes.times)
+    n_cols = n_trials * (n_bins + n_pad) + n_pad
+
+    times, spike_gids, trial_idxs = spikes._get_flat(tmin, tmax)
+    n_gids = max(gids.max(initial=-1), spike_gids.max(initial=-1)) + 1
+    lookup = np.full(n_gids, -1)
+    lookup[gids] = np.arange(len(gids))
+    rows = lookup[spike_gids]
+    bins = np.minimum(((times - tmin) / bin_width).astype(int), n_bins - 1)
+    cols = trial_idxs * (n_bins + n_pad) + n_pad + bins
+    order = np.argsort(rows[rows >= 0], kind='stable')
+    rows, cols = rows[rows >= 0][order], cols[rows >= 0][order]
+
+    valid = np.zeros(n_cols, dtype=bool)
+    valid[n_pad:].reshape(n_trials, n_bins + n_pad)[:, :n_bins] = True
+    return rows, cols, n_cols, valid
+
+
+def _iter_dense(rows, cols, n_rows, n_cols, chunk_size):
+    """Iterate over dense blocks of rows of a sparse matrix of counts.
+
+    The blocks are single precision, which represents counts exactly and
+    halves the time of their products.
+    """
+    for start in range(0, n_rows, chunk_size):
+        stop = min(start + chunk_size, n_rows)
+        first, last = np.searchsorted(rows, [start, stop])
+        block = np.zeros((stop - start, n_cols), dtype=np.float32)
+        np.add.at(block, (rows[first:last] - start, cols[first:last]), 1.)
+        yield start, stop, block
+
+
+def _check_spike_args(tmin, tmax, bin_width, chunk_size):
+    """Check the time window, bins and chunks of the spike measures."""
+    if tmax <= tmin:
+        raise ValueError('tmax must be larger than tmin. Got tmin=%s and '
+                         'tmax=%s' % (tmin, tmax))
+    if bin_width <= 0:
+        raise ValueError('bin_width must be positive. Got %s' % bin_width)
+    if chunk_size < 1:
+        raise ValueError('chunk_size must be a positive integer. Got %s'
+                         % chunk_size)
+
+
+def _get_lag_slices(lag, n_cols):
+    """The columns of two matrices whose products sum to a lag."""
+    return (slice(max(-lag, 0), n_cols - max(lag, 0)),
+            slice(max(lag, 0), n_cols - max(-lag, 0)))
+
+
+def cross_correlograms(spikes, gids1, gids2=None, tmin=0., tmax=None,
+                       bin_width=1., max_lag=20., average=False,
+                       chunk_size=256, out=None):
+    """Compute the cross-correlograms of pairs of cells over all trials.
+
+    The spikes are binned into a sparse matrix of cells by time bins. Dense
+    blocks of at most chunk_size cells are multiplied for each lag. The
+    average over pairs is computed from the correlogram of the summed
+    activity of the cells, so that it does not grow with the number of
+    pairs. The correlograms of all pairs take 4 * n_gids1 * n_gids2 * n_lags
+    bytes, e.g., 4 GB for 5000 cells and 41 lags, and can be written to a
+    memory-mapped array with out.
+
+    Parameters
+    ----------
+    spikes : instance of Spikes
+        The spikes.
+    gids1 : array-like of int, shape (n_gids1,)
+        The unique cell IDs of the reference cells.
+    gids2 : array-like of int, shape (n_gids2,) | None
+        The unique cell IDs of the target cells. If None, gids1.
+    tmin : float
+        The start of the time window (in ms).
+    tmax : float | None
+        The end (excluded) of the time window (in ms). If None, the last
+        spike.
+    bin_width : float
+        The width of the time bins (in ms).
+    max_lag : float
+        The largest lag (in ms).
+    average : bool
+        If True, average the correlograms of all pairs of distinct cells.
+    chunk_size : int
+        The number of cells in each dense block.
+    out : array, shape (n_gids1, n_gids2, n_lags) | None
+        The array into which the correlograms of all pairs are written,
+        e.g., a numpy.memmap. If None, a new float32 array. Cannot be used
+        with average.
+
+    Returns
+    -------
+    ccg : array, shape (n_gids1, n_gids2, n_lags) | (n_lags,)
+        The number of pairs of a spike of a reference cell at time t and of a
+        spike of a target cell in the bin of time t + lag, summed over the
+        trials. The counts of all pairs are float32, which holds them
+        exactly up to 2 ** 24.
+    lags : array, shape (n_lags,)
+        The lags (in ms).
+    """
+    times = spikes._get_flat()[0]
+    if tmax is None:
+        tmax = times.max(initial=tmin) + bin_width
+    _check_spike_args(tmin, tmax, bin_width, chunk_size)
+    gids1 = np.asarray(gids1, dtype=int)
+    gids2 = gids1 if gids2 is None else np.asarray(gids2, dtype=int)
+    n_lags = int(round(max_lag / bin_width))
+    lags = np.arange(-n_lags, n_lags + 1) * bin_width
+    shape = (len(gids1), len(gids2), len(lags))
+    if out is not None:
+        if average:
+            raise ValueError('out cannot be used with average')
+        if out.shape != shape:
+            raise ValueError('out must be of shape %s. Got %s'
+                             % (shape, out.shape))
+
+    rows1, cols1, n_cols, _ = _bin_spikes(spikes, gids1, tmin, tmax,
+                                          bin_width, n_lags)
+    rows2, cols2, _, _ = _bin_spikes(spikes, gids2, tmin, tmax,
+                                     bin_width, n_lags)
+    if average:
+        # the padding between trials absorbs the shifted bins
+        pop1 = np.bincount(cols1, minlength=n_cols).astype(float)
+        pop2 = np.bincount(cols2, minlength=n_cols).astype(float)
+        ccg = np.array([pop1[sl1] @ pop2[sl2] for sl1, sl2 in
+                        (_get_lag_slices(lag, n_cols)
+                         for lag in range(-n_lags, n_lags + 1))])
+        # remove the pairs of a cell with itself
+        common = np.intersect1d(gids1, gids2)
+        rows, cols, _, _ = _bin_spikes(spikes, common, tmin, tmax,
+                                       bin_width, n_lags)
+        for _, _, block in _iter_dense(rows, cols, len(common), n_cols,
+                                       chunk_size):
+            for lag_idx, lag in enumerate(range(-n_lags, n_lags + 1)):
+                sl1, sl2 = _get_lag_slices(lag, n_cols)
+                ccg[lag_idx] -= np.sum(block[:, sl1] * block[:, sl2])
+        n_pairs = len(gids1) * len(gids2) - len(common)
+        return ccg / max(n_pairs, 1), lags
+
+    ccg = np.zeros(shape, dtype=np.float32) if out is None else out
+    for start1, stop1, block1 in _iter_dense(rows1, cols1, len(gids1),
+                                             n_cols, chunk_size):
+        for start2, stop2, block2 in _iter_dense(rows2, cols2, len(gids2),
+                                                 n_cols, chunk_size):
+            # each block of pairs is written at once, in the layout of ccg
+            block = np.empty((stop1 - start1, stop2 - start2, len(lags)),
+                             dtype=np.float32)
+            for lag_idx, lag in enumerate(range(-n_lags, n_lags + 1)):
+                sl1, sl2 = _get_lag_slices(lag, n_cols)
+                block[:, :, lag_idx] = block1[:, sl1] @ block2[:, sl2].T
+            ccg[start1:stop1, start2:stop2] = block
+    return ccg, lags
+
+
+def spike_time_tiling(spikes, gids1, gids2=None, tmin=0., tmax=None, dt=5.,
+                      bin_width=0.5, chunk_size=256):
+    """Compute the spike time tiling coefficients of pairs of cells.
+
+    The spike time tiling coefficient (STTC) of Cutts and Eglen (2014)
+    measures the correlation of two spike trains independently of their
+    firing rates. The spikes of all trials are binned, and the spikes of a
+    cell are within dt of a spike of another cell if their bins are at most
+    dt / bin_width bins apart.
+
+    Parameters
+    ----------
+    spikes : instance of Spikes
+        The spikes.
+    gids1 : array-like of int, shape (n_gids1,)
+        The cell IDs of the first cells.
+    gids2 : array-like of int, shape (n_gids2,) | None
+        The cell IDs of the second cells. If None, gids1.
+    tmin : float
+        The start of the time window (in ms).
+    tmax : float | None
+        The end (excluded) of the time window (in ms). If None, the last
+        spike.
+    dt : float
+        The synchrony window (in ms).
+    bin_width : float
+        The width of the time bins (in ms).
+    chunk_size : int
+        The number of cells in each dense block.
+
+    Returns
+    -------
+    sttc : array, shape (n_gids1, n_gids2)
+        The coefficients, between -1 and 1. They are NaN for the pairs in
+        which a cell did not spike.
+    """
+    times = spikes._get_flat()[0]
+    if tmax is None:
+        tmax = times.max(initial=tmin) + bin_width
+    _check_spike_args(tmin, tmax, bin_width, chunk_size)
+    gids1 = np.asarray(gids1, dtype=int)
+    gids2 = gids1 if gids2 is None else np.asarray(gids2, dtype=int)
+    n_win = int(round(dt / bin_width))
+    n_pad = max(n_win, 1)
+
+    def _get_tiling(block):
+        # the fraction of the bins within n_win bins of a spike
+        cumsum = np.zeros((len(block), block.shape[1] + 1))
+        np.cumsum(block > 0, axis=1, out=cumsum[:, 1:])
+        idxs = np.arange(block.shape[1])
+        stops = np.minimum(idxs + n_win + 1, block.shape[1])
+        starts = np.maximum(idxs - n_win, 0)
+        tiled = (cumsum[:, stops] - cumsum[:, starts]) > 0
+        tiled &= valid
+        return (tiled.astype(np.float32),
+                tiled.sum(axis=1) / valid.sum())
+
+    rows1, cols1, n_cols, valid = _bin_spikes(spikes, gids1, tmin, tmax,
+                                              bin_width, n_pad)
+    rows2, cols2, _, _ = _bin_spikes(spikes, gids2, tmin, tmax, bin_width,
+                                     n_pad)
+    n_spikes1 = np.bincount(rows1, minlength=len(gids1))
+    n_spikes2 = np.bincount(rows2, minlength=len(gids2))
+    sttc = np.empty((len(gids1), len(gids2)))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for start1, stop1, block1 in _iter_dense(rows1, cols1, len(gids1),
+                                                 n_cols, chunk_size):
+            tiled1, tiling1 = _get_tiling(block1)
+            for start2, stop2, block2 in _iter_dense(
+                    rows2, cols2, len(gids2), n_cols, chunk_size):
+                tiled2, tiling2 = _get_tiling(block2)
+                # the fraction of the spikes of each cell that are within
+                # dt of a spike of the other cell
+                prop1 = (block1 @ tiled2.T) / n_spikes1[start1:stop1, None]
+                prop2 = (tiled1 @ block2.T) / n_spikes2[None, start2:stop2]
+                terms = list()
+                for prop, tiling in ((prop1, tiling2[None, :]),
+                                     (prop2, tiling1[:, None])):
+                    denom = 1. - prop * tiling
+                    terms.append(np.where(denom == 0, 1.,
+                                          (prop - tiling) / denom))
+                sttc[start1:stop1, start2:stop2] = 0.5 * (terms[0] +
+                                                          terms[1])
+    return sttc
+
+
+def synchrony_index(spikes, gid_dict, tmin, tmax, bin_width=5.,
+                    cell_types=None):
+    """Compute the population synchrony index of each cell type.
+
+    The index of Golomb (2007) is the square root of the ratio of the
+    variance over time of the binned population activity and of the mean
+    over cells of the variance of their binned spike counts. It is 1 for
+    fully synchronous cells and close to 0 for asynchronous ones. It is
+    computed from the sparse spike counts, without binning each cell.
+
+    Parameters
+    ----------
+    spikes : instance of Spikes
+        The spikes.
+    gid_dict : dict of range
+        The cell IDs of each cell type, e.g., net.gid_dict.
+    tmin : float
+        The start of the time window (in ms).
+    tmax : float
+        The end (excluded) of the time window (in ms).
+    bin_width : float
+        The width of the time bins (in ms).
+    cell_types : list of str | None
+        The cell types. If None, all the keys of gid_dict.
+
+    Returns
+    -------
+    sync : array, shape (n_trials, n_types)
+        The synchrony index of each cell type in each trial. It is NaN if
+        no cell of a type spiked.
+    """
+    _check_spike_args(tmin, tmax, bin_width, 1)
+    times, gids, trial_idxs = spikes._get_flat(tmin, tmax)
+    type_idxs, n_cells = spikes._get_type_idxs(gids, gid_dict, cell_types)
+    mask = type_idxs >= 0
+    times, gids = times[mask], gids[mask]
+    trial_idxs, type_idxs = trial_idxs[mask], type_idxs[mask]
+    n_bins = int(np.ceil((tmax - tmin) / bin_width))
+    n_trials, n_types = len(spikes.times), len(n_cells)
+    bins = np.minimum(((times - tmin) / bin_width).astype(int), n_bins - 1)
+
+    # variance over time of the mean activity of each type
+    shape = (n_trials, n_types, n_bins)
+    pop = np.bincount(np.ravel_multi_index((trial_idxs, type_idxs, bins),
+                                           shape),
+                      minlength=np.prod(shape)).reshape(shape)
+    pop = pop / n_cells[:, None]
+    pop_var = pop.var(axis=-1)
+
+    # mean over cells of the variance over time of their counts, from
+    # the non-zero counts only
+    n_gids = gids.max(initial=-1) + 1
+    keys, counts = np.unique(
+        np.ravel_multi_index((trial_idxs, gids, bins),
+                             (n_trials, n_gids, n_bins)), return_counts=True)
+    cells, cell_idxs = np.unique(keys // n_bins, return_inverse=True)
+    means = np.bincount(cell_idxs, counts) / n_bins
+    cell_vars = np.bincount(cell_idxs, counts ** 2.) / n_bins - means ** 2
+    cell_trials, cell_gids = np.divmod(cells, n_gids)
+    gid_types = np.zeros(n_gids, dtype=int)
+    gid_types[gids] = type_idxs
+    mean_var = np.zeros((n_trials, n_types))
+    np.add.at(mean_var, (cell_trials, gid_types[cell_gids]), cell_vars)
+    mean_var /= n_cells
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        sync = np.sqrt(pop_var / mean_var)
+    sync[mean_var == 0] = np.nan
+    return sync
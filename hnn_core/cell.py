@@ -6,13 +6,192 @@
 import numpy as np
 from neuron import h, nrn
 
-# global variables, should be node-independent
-h("dp_total_L2 = 0.")
-h("dp_total_L5 = 0.")  # put here since these variables used in cells
-
 # Units for e: mV
 # Units for gbar: S/cm^2
 
+# The number of 3D points from which a section is set in bulk
+_PT3D_BULK_MIN = 32
+
+
+def _get_pt3d(cells):
+    """Extract the 3D points of all the sections of cells in one pass.
+
+    Parameters
+    ----------
+    cells : list of _Cell
+        The cells.
+
+    Returns
+    -------
+    sections : list of h.Section
+        The sections of all the cells, in the order of get_sections.
+    pts : array, shape (n_points, 4)
+        The x, y, z coordinates (um) and diameter (um) of each point.
+    sec_offsets : array of int, shape (n_sections + 1,)
+        The points of section k are pts[sec_offsets[k]:sec_offsets[k + 1]].
+    cell_offsets : array of int, shape (n_cells + 1,)
+        The sections of cell k are sections[cell_offsets[k]:
+        cell_offsets[k + 1]]. The first one is the soma.
+    """
+    sections = list()
+    cell_offsets = [0]
+    for cell in cells:
+        sections.extend(cell.get_sections())
+        cell_offsets.append(len(sections))
+    n3d = [int(sect.n3d()) for sect in sections]
+    sec_offsets = np.concatenate([[0], np.cumsum(n3d, dtype=int)])
+
+    # a single flat list converted at once, 4 values per point
+    values = list()
+    for sect, n_pts in zip(sections, n3d):
+        x3d, y3d, z3d, diam3d = sect.x3d, sect.y3d, sect.z3d, sect.diam3d
+        for i in range(n_pts):
+            values += (x3d(i), y3d(i), z3d(i), diam3d(i))
+    pts = np.array(values, dtype=float).reshape(-1, 4)
+    return sections, pts, sec_offsets, np.array(cell_offsets, dtype=int)
+
+
+def _set_pt3d(sections, pts, sec_offsets):
+    """Set the 3D points of sections from arrays.
+
+    Parameters
+    ----------
+    sections : list of h.Section
+        The sections.
+    pts : array, shape (n_points, 4)
+        The x, y, z coordinates (um) and diameter (um) of each point. The
+        sections must already have as many points.
+    sec_offsets : array of int, shape (n_sections + 1,)
+        The points of section k are pts[sec_offsets[k]:sec_offsets[k + 1]].
+    """
+    # pt3dchange updates the section after each point, so its cost grows
+    # with the square of the number of points. Long sections are replaced
+    # at once by Vectors of their points, which costs about as much as
+    # changing _PT3D_BULK_MIN points one by one.
+    rows = pts.tolist()
+    cols = pts.T.tolist()
+    vecs = [h.Vector() for _ in range(4)]
+    for sect, start, stop in zip(sections, sec_offsets[:-1].tolist(),
+                                 sec_offsets[1:].tolist()):
+        if stop - start >= _PT3D_BULK_MIN:
+            for vec, col in zip(vecs, cols):
+                vec.from_python(col[start:stop])
+            sect.pt3dclear(stop - start)
+            h.pt3dadd(*vecs, sec=sect)
+        else:
+            pt3dchange = sect.pt3dchange
+            for i, row in enumerate(rows[start:stop]):
+                pt3dchange(i, *row)
+
+
+def _get_bboxes(pts, sec_offsets, cell_offsets):
+    """Compute the bounding box of each cell.
+
+    Parameters
+    ----------
+    pts, sec_offsets, cell_offsets
+        As returned by _get_pt3d.
+
+    Returns
+    -------
+    bboxes : array, shape (n_cells, 3, 2)
+        The minimum and maximum of the x, y and z coordinates of each cell.
+    """
+    starts = sec_offsets[cell_offsets[:-1]]
+    mins = np.minimum.reduceat(pts[:, :3], starts, axis=0)
+    maxs = np.maximum.reduceat(pts[:, :3], starts, axis=0)
+    return np.stack((mins, maxs), axis=-1)
+
+
+def _translate_pt3d(pts, sec_offsets, cell_offsets, shifts):
+    """Translate the points of each cell in place.
+
+    Parameters
+    ----------
+    pts, sec_offsets, cell_offsets
+        As returned by _get_pt3d.
+    shifts : array, shape (n_cells, 3)
+        The translation of each cell along x, y and z.
+    """
+    n_pts = np.diff(sec_offsets[cell_offsets])
+    pts[:, :3] += np.repeat(shifts, n_pts, axis=0)
+
+
+def _move_cells_to_pos(cells):
+    """Move the 3D points of cells to the positions used for wiring.
+
+    The soma of each cell starts at (100 * x, z, 100 * y) for a
+    position (x, y, z).
+    """
+    if len(cells) == 0:
+        return
+    sections, pts, sec_offsets, cell_offsets = _get_pt3d(cells)
+    pos = np.array([cell.pos for cell in cells], dtype=float)
+    targets = np.c_[pos[:, 0] * 100, pos[:, 2], pos[:, 1] * 100]
+    somas = pts[sec_offsets[cell_offsets[:-1]], :3]
+    _translate_pt3d(pts, sec_offsets, cell_offsets, targets - somas)
+    _set_pt3d(sections, pts, sec_offsets)
+
+
+def _get_segment_coords(cells):
+    """Compute the end points of all the segments of cells.
+
+    The segments of each section split the path along its 3D points into
+    nseg parts of equal length.
+
+    Parameters
+    ----------
+    cells : list of _Cell
+        The cells.
+
+    Returns
+    -------
+    starts : array, shape (n_segments, 3)
+        The x, y, z coordinates (um) of the start of each segment, in the
+        order of the sections of get_sections and of the segments along
+        each section.
+    ends : array, shape (n_segments, 3)
+        The coordinates of the end of each segment.
+    seg_offsets : array of int, shape (n_cells + 1,)
+        The segments of cell k are those between seg_offsets[k] and
+        seg_offsets[k + 1].
+    """
+    sections, pts, sec_offsets, cell_offsets = _get_pt3d(cells)
+    n_pts = np.diff(sec_offsets)
+    nseg = np.array([sect.nseg for sect in sections], dtype=int)
+
+    # the normalized path length of each point along its section
+    sec_idx = np.repeat(np.arange(len(sections)), n_pts)
+    dist = np.linalg.norm(np.diff(pts[:, :3], axis=0), axis=1)
+    dist = np.concatenate([[0.], dist])
+    dist[sec_offsets[:-1][n_pts > 0]] = 0.
+    arc = np.cumsum(dist)
+    arc -= np.repeat(arc[sec_offsets[:-1][n_pts > 0]], n_pts[n_pts > 0])
+    length = np.zeros(len(sections))
+    length[n_pts > 0] = arc[sec_offsets[1:][n_pts > 0] - 1]
+    arc /= np.repeat(np.where(length > 0, length, 1.), n_pts)
+
+    # sections are spaced 2 apart on one increasing axis so that a single
+    # interpolation finds the boundaries of all the segments
+    xp = 2 * sec_idx + arc
+    bound_sec = np.repeat(np.arange(len(sections)), nseg + 1)
+    bound_offsets = np.concatenate([[0], np.cumsum(nseg + 1)])
+    frac = np.arange(bound_offsets[-1]) - np.repeat(bound_offsets[:-1],
+                                                    nseg + 1)
+    frac = frac / np.repeat(nseg, nseg + 1)
+    bounds = np.column_stack([np.interp(2 * bound_sec + frac, xp, pts[:, col])
+                              for col in range(3)])
+
+    is_end = np.zeros(len(bounds), dtype=bool)
+    is_end[bound_offsets[1:] - 1] = True
+    starts = bounds[~is_end]
+    is_start = np.zeros(len(bounds), dtype=bool)
+    is_start[bound_offsets[:-1]] = True
+    ends = bounds[~is_start]
+
+    seg_offsets = np.concatenate([[0], np.cumsum(nseg)])[cell_offsets]
+    return starts, ends, seg_offsets
+
 
 class _ArtificialCell:
     """The ArtificialCell class for initializing a NEURON feed source.
@@ -114,38 +293,97 @@ class _Cell(object):
         """Get sections."""
         return [self.soma]
 
+    def get_section_names(self):
+        """Get section names."""
+        return ['soma']
+
+    def _get_record_refs(self, var, section, loc):
+        """Get the references to a variable to record.
+
+        Parameters
+        ----------
+        var : str
+            The variable. Can be 'v', 'i' or 'Qsum'.
+        section : str | None
+            The name of the section. If None, all the sections (for 'Qsum').
+        loc : float
+            The location (0 to 1) along the section for 'v' and 'i'.
+
+        Returns
+        -------
+        refs : list of hoc references
+            The references. The values recorded from each should be summed.
+        """
+        sections = dict(zip(self.get_section_names(), self.get_sections()))
+        if section is not None and section not in sections:
+            raise ValueError('section must be one of %s for %s. Got %s'
+                             % (list(sections), self.name, section))
+
+        if var == 'Qsum':
+            if not hasattr(self, 'dipole_pp'):
+                raise ValueError('No dipole was inserted in %s'
+                                 % (self.name,))
+            return [dpp._ref_Qsum for sect, dpp in
+                    zip(self.list_all, self.dipole_pp)
+                    if section is None or sect == sections[section]]
+
+        seg = sections[section](loc)
+        if var == 'v':
+            return [seg._ref_v]
+        # needs cvode.use_fast_imem(1)
+        return [seg._ref_i_membrane_]
+
+    def _get_dipole_terms(self):
+        """Get the terms of the current dipole of each section.
+
+        As in dipole.mod and dipole_pp.mod, the dipole of a section is the
+        sum over its segments, and its end, of (pv - v) * ztan / ri, where
+        v is the voltage at the segment and pv the voltage at the previous
+        one.
+
+        Returns
+        -------
+        terms : list of tuple
+            The name of the section, the references to pv and v and the
+            weight ztan / ri of each term.
+        """
+        names = dict((sect.name(), name) for name, sect in
+                     zip(self.get_section_names(), self.get_sections()))
+        terms = list()
+        for sect, dpp in zip(self.list_all, self.dipole_pp):
+            name = names[sect.name()]
+            pv_ref = sect(0)._ref_v
+            for seg in sect:
+                terms.append((name, pv_ref, seg._ref_v,
+                              seg.dipole.ztan / seg.dipole.ri))
+                pv_ref = seg._ref_v
+            terms.append((name, sect(0.99)._ref_v, sect(1)._ref_v,
+                          dpp.ztan / dpp.ri))
+        return terms
+
     def get3dinfo(self):
-        """Get 3d info."""
-        ls = self.get_sections()
-        lx, ly, lz, ldiam = [], [], [], []
-        for s in ls:
-            for i in range(s.n3d()):
-                lx.append(s.x3d(i))
-                ly.append(s.y3d(i))
-                lz.append(s.z3d(i))
-                ldiam.append(s.diam3d(i))
-        return lx, ly, lz, ldiam
+        """Get 3d info.
+
+        Returns
+        -------
+        x, y, z, diam : array, shape (n_points,)
+            The coordinates (um) and diameter (um) of the 3D points of all
+            the sections of the cell.
+        """
+        pts = _get_pt3d([self])[1]
+        return pts[:, 0], pts[:, 1], pts[:, 2], pts[:, 3]
 
     def getbbox(self):
         """Get cell's bounding box."""
-        lx, ly, lz, ldiam = self.get3dinfo()
-        minx, miny, minz = 1e9, 1e9, 1e9
-        maxx, maxy, maxz = -1e9, -1e9, -1e9
-        for x, y, z in zip(lx, ly, lz):
-            minx = min(x, minx)
-            miny = min(y, miny)
-            minz = min(z, minz)
-            maxx = max(x, maxx)
-            maxy = max(y, maxy)
-            maxz = max(z, maxz)
-        return ((minx, maxx), (miny, maxy), (minz, maxz))
+        _, pts, sec_offsets, cell_offsets = _get_pt3d([self])
+        bbox = _get_bboxes(pts, sec_offsets, cell_offsets)[0]
+        return tuple(tuple(lims) for lims in bbox.tolist())
 
     def translate3d(self, dx, dy, dz):
         """Translate 3d."""
-        for s in self.get_sections():
-            for i in range(s.n3d()):
-                h.pt3dchange(i, s.x3d(i) + dx, s.y3d(i) + dy,
-                             s.z3d(i) + dz, s.diam3d(i), sec=s)
+        sections, pts, sec_offsets, cell_offsets = _get_pt3d([self])
+        _translate_pt3d(pts, sec_offsets, cell_offsets, [[dx, dy, dz]])
+        _set_pt3d(sections, pts, sec_offsets)
 
     def translate_to(self, x, y, z):
         """Translate to position."""
@@ -160,7 +398,7 @@ class _Cell(object):
 
     def move_to_pos(self):
         """Move cell to position."""
-        self.translate_to(self.pos[0] * 100, self.pos[2], self.pos[1] * 100)
+        _move_cells_to_pos([self])
 
     def _connect_feed_at_loc(self, feed_loc, receptor, gid_src, nc_dict,
                              nc_list):
@@ -228,6 +466,11 @@ class _Cell(object):
     def dipole_insert(self, yscale):
         """Insert dipole into each section of this cell."""
         # dends must have already been created!!
+        # the layer totals the dipoles point to, which are reset before
+        # each simulation
+        if not hasattr(h, 'dp_total_L2'):
+            h("dp_total_L2 = 0.")
+            h("dp_total_L5 = 0.")
         # it's easier to use wholetree here, this includes soma
         seclist = h.SectionList()
         seclist.wholetree(sec=self.soma)
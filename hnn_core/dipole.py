@@ -17,6 +17,147 @@ def _hammfilt(x, winsz):
     return convolve(x, win, 'same')
 
 
+def _lowpass_decimate(x, decim):
+    """Low-pass filter with a hamming window and keep every decim-th sample.
+
+    The window is 4 * decim + 1 samples long so that its main lobe ends at
+    the Nyquist frequency of the decimated signal. The edges are padded
+    with the first and last values to avoid attenuating the baseline.
+    Operates along the last axis and only computes the samples that are kept.
+    """
+    if decim == 1:
+        return x
+    win = hamming(4 * decim + 1)
+    win /= sum(win)
+    n_pad = len(win) // 2
+    pad_width = [(0, 0)] * (np.ndim(x) - 1) + [(n_pad, n_pad)]
+    x_padded = np.pad(x, pad_width, mode='edge')
+    n_times = (np.shape(x)[-1] - 1) // decim + 1
+    x_decim = np.zeros(np.shape(x)[:-1] + (n_times,))
+    for tap, weight in enumerate(win):
+        stop = tap + decim * (n_times - 1) + 1
+        x_decim += weight * x_padded[..., tap:stop:decim]
+    return x_decim
+
+
+def _get_baseline(times, n_pyr):
+    """The baseline of the L2 and L5 dipoles (in fAm) of a network.
+
+    Parameters
+    ----------
+    times : array, shape (n_times,)
+        The time vector (in ms).
+    n_pyr : int
+        The number of pyramidal cells in each layer.
+
+    Returns
+    -------
+    baseline_L2 : float
+        The baseline of the L2 dipole.
+    baseline_L5 : array, shape (n_times,)
+        The baseline of the L5 dipole at each time.
+    """
+    # dipole offset calculation: increasing number of pyr
+    # cells (L2 and L5, simultaneously)
+    # with no inputs resulted in an aggregate dipole over the
+    # interval [50., 1000.] ms that
+    # eventually plateaus at -48 fAm. The range over this interval
+    # is something like 3 fAm
+    # so the resultant correction is here, per dipole
+    # dpl_offset = N_pyr * 50.207
+    # L2 dipole offset can be roughly baseline shifted over
+    # the entire range of t
+    baseline_L2 = n_pyr * 0.0443
+    # L5 dipole offset should be different for interval [50., 500.]
+    # and then it can be offset
+    # slope (m) and intercept (b) params for L5 dipole offset
+    # uncorrected for N_cells
+    # these values were fit over the range [37., 750.)
+    m = 3.4770508e-3
+    b = -51.231085
+    # these values were fit over the range [750., 5000]
+    t1 = 750.
+    m1 = 1.01e-4
+    b1 = -48.412078
+    # piecewise normalization
+    baseline_L5 = np.empty(len(times))
+    baseline_L5[times <= 37.] = n_pyr * -49.0502
+    mask = (times > 37.) & (times < t1)
+    baseline_L5[mask] = n_pyr * (m * times[mask] + b)
+    mask = times >= t1
+    baseline_L5[mask] = n_pyr * (m1 * times[mask] + b1)
+    return baseline_L2, baseline_L5
+
+
+def reprocess(dpls, params, record_dt=None):
+    """Compute the dipoles from the raw simulated dipoles.
+
+    The raw dipoles of all trials are baseline renormalized, converted to
+    nAm, scaled by params['dipole_scalefctr'] and smoothed with a Hamming
+    window of params['dipole_smooth_win'] ms at once, as at the end of a
+    simulation. This avoids simulating the network again when only these
+    parameters change.
+
+    Parameters
+    ----------
+    dpls : instance of Dipole | list of Dipole
+        The simulated dipoles. All dipoles must share the same time vector
+        and have raw data.
+    params : dict
+        The parameters. Only 'N_pyr_x', 'N_pyr_y', 'dipole_scalefctr' and
+        'dipole_smooth_win' are used.
+    record_dt : float | None
+        The sampling interval (in ms) of the dipoles. If None, it is
+        inferred from their time vector.
+
+    Returns
+    -------
+    dpls : list of Dipole
+        The processed dipoles. They share the time vector and the raw data
+        of the input dipoles.
+    """
+    if isinstance(dpls, Dipole):
+        dpls = [dpls]
+    if len(dpls) == 0:
+        raise ValueError('Need at least one Dipole object')
+    times = dpls[0].times
+    for dpl_idx, dpl in enumerate(dpls):
+        if dpl.raw_data is None:
+            raise ValueError('Dipole at index %d has no raw data. Only '
+                             'simulated dipoles can be reprocessed'
+                             % dpl_idx)
+        if len(dpl.times) != len(times):
+            raise ValueError('Dipole at index %d has %d time samples. '
+                             'Expected %d' % (dpl_idx, len(dpl.times),
+                                              len(times)))
+    if record_dt is None:
+        record_dt = round(float(np.mean(np.diff(times))), 10)
+
+    # shape (n_trials, 3, n_times)
+    data = np.array([[dpl.raw_data[layer] for layer in ('agg', 'L2', 'L5')]
+                     for dpl in dpls])
+    baseline_L2, baseline_L5 = _get_baseline(
+        times, params['N_pyr_x'] * params['N_pyr_y'])
+    data[:, 1] -= baseline_L2
+    data[:, 2] -= baseline_L5
+    data[:, 0] = data[:, 1] + data[:, 2]
+    # fAm to nAm
+    data *= 1e-6
+    data *= params['dipole_scalefctr']
+    winsz = params['dipole_smooth_win'] / record_dt
+    if winsz > 1:
+        for signal in data.reshape(-1, data.shape[-1]):
+            signal[:] = _hammfilt(signal, winsz)
+
+    dpls_processed = list()
+    for dpl, dpl_data in zip(dpls, data):
+        dpl_processed = Dipole(times, dpl_data.T, nave=dpl.nave)
+        dpl_processed.units = 'nAm'
+        dpl_processed.raw_data = dpl.raw_data
+        dpls_processed.append(dpl_processed)
+    return dpls_processed
+
+
 def simulate_dipole(net, n_trials=None):
     """Simulate a dipole given the experiment parameters.
 
@@ -109,6 +250,12 @@ def average_dipoles(dpls):
     # set nave to the number of trials averaged in this dipole
     avg_dpl.nave = len(dpls)
 
+    # the processing is linear, so the average can be reprocessed
+    if all(dpl.raw_data is not None for dpl in dpls):
+        avg_dpl.raw_data = {layer: np.mean([dpl.raw_data[layer] for dpl in
+                                            dpls], axis=0)
+                            for layer in ('agg', 'L2', 'L5')}
+
     return avg_dpl
 
 
@@ -134,6 +281,10 @@ class Dipole(object):
         The dipole with keys 'agg', 'L2' and 'L5'
     nave : int
         Number of trials that were averaged to produce this Dipole
+    raw_data : dict of array | None
+        For simulated dipoles, the dipole (in fAm) with keys 'agg', 'L2' and
+        'L5' before baseline renormalization, scaling and smoothing. See
+        reprocess. None otherwise.
     """
 
     def __init__(self, times, data, nave=1):  # noqa: D102
@@ -142,6 +293,7 @@ class Dipole(object):
         self.times = times
         self.data = {'agg': data[:, 0], 'L2': data[:, 1], 'L5': data[:, 2]}
         self.nave = nave
+        self.raw_data = None
 
     def convert_fAm_to_nAm(self):
         """ must be run after baseline_renormalization()
@@ -196,46 +348,11 @@ class Dipole(object):
                   " were in %s" % (self.units))
             return
 
-        N_pyr_x = params['N_pyr_x']
-        N_pyr_y = params['N_pyr_y']
         # N_pyr cells in grid. This is PER LAYER
-        N_pyr = N_pyr_x * N_pyr_y
-        # dipole offset calculation: increasing number of pyr
-        # cells (L2 and L5, simultaneously)
-        # with no inputs resulted in an aggregate dipole over the
-        # interval [50., 1000.] ms that
-        # eventually plateaus at -48 fAm. The range over this interval
-        # is something like 3 fAm
-        # so the resultant correction is here, per dipole
-        # dpl_offset = N_pyr * 50.207
-        dpl_offset = {
-            # these values will be subtracted
-            'L2': N_pyr * 0.0443,
-            'L5': N_pyr * -49.0502
-            # 'L5': N_pyr * -48.3642,
-            # will be calculated next, this is a placeholder
-            # 'agg': None,
-        }
-        # L2 dipole offset can be roughly baseline shifted over
-        # the entire range of t
-        self.data['L2'] -= dpl_offset['L2']
-        # L5 dipole offset should be different for interval [50., 500.]
-        # and then it can be offset
-        # slope (m) and intercept (b) params for L5 dipole offset
-        # uncorrected for N_cells
-        # these values were fit over the range [37., 750.)
-        m = 3.4770508e-3
-        b = -51.231085
-        # these values were fit over the range [750., 5000]
-        t1 = 750.
-        m1 = 1.01e-4
-        b1 = -48.412078
-        # piecewise normalization
-        self.data['L5'][self.times <= 37.] -= dpl_offset['L5']
-        self.data['L5'][(self.times > 37.) & (self.times < t1)] -= N_pyr * \
-            (m * self.times[(self.times > 37.) & (self.times < t1)] + b)
-        self.data['L5'][self.times >= t1] -= N_pyr * \
-            (m1 * self.times[self.times >= t1] + b1)
+        N_pyr = params['N_pyr_x'] * params['N_pyr_y']
+        baseline_L2, baseline_L5 = _get_baseline(self.times, N_pyr)
+        self.data['L2'] -= baseline_L2
+        self.data['L5'] -= baseline_L5
         # recalculate the aggregate dipole based on the baseline
         # normalized ones
         self.data['agg'] = self.data['L2'] + self.data['L5']
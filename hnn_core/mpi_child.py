@@ -36,7 +36,6 @@ def run_mpi_simulation():
     str_err = io.StringIO()
     sys.stderr = str_err
 
-    from hnn_core import Network
     from hnn_core.neuron import NeuronNetwork, _simulate_single_trial
 
     # using template for reading stdin from:
@@ -45,7 +44,7 @@ def run_mpi_simulation():
     comm = MPI.COMM_WORLD
     rank = comm.Get_rank()
 
-    # get parameters from stdin
+    # get the network from stdin
     if rank == 0:
         stream_in = sys.stdin
         # Force the use of bytes streams under Python 3
@@ -54,16 +53,18 @@ def run_mpi_simulation():
         input_bytes = _read_all_bytes(stream_in)
         stream_in.close()
 
-        params = pickle.loads(codecs.decode(input_bytes, "base64"))
+        net, trial_idxs = pickle.loads(codecs.decode(input_bytes, "base64"))
     else:
-        params = None
+        net, trial_idxs = None, None
 
-    params = comm.bcast(params, root=0)
-    net = Network(params)
-    neuron_net = NeuronNetwork(net)
+    net, trial_idxs = comm.bcast((net, trial_idxs), root=0)
 
     sim_data = []
-    for trial in range(params['N_trials']):
+    for trial_idx in trial_idxs:
+        # seed each trial as JoblibBackend does, so that the trials do not
+        # depend on the backend or on how they are split between launches
+        net._set_trial(trial_idx)
+        neuron_net = NeuronNetwork(net)
         dpl = _simulate_single_trial(neuron_net)
         if rank == 0:
             spikedata = neuron_net.get_data_from_neuron()
@@ -5,10 +5,14 @@
 #          Blake Caldwell <blake_caldwell@brown.edu>
 
 import itertools as it
+import json
 import numpy as np
 from glob import glob
 
-from .params import create_pext
+from .feed import ExtFeed
+from .params import Params, create_pext
+from .params_default import (get_L2Pyr_params_default,
+                             get_L5Pyr_params_default)
 from .viz import plot_hist_input, plot_spikes_raster, plot_cells
 
 
@@ -58,6 +62,128 @@ def read_spikes(fname, gid_dict=None):
     return Spikes(times=spike_times, gids=spike_gids, types=spike_types)
 
 
+def _pack_recordings(recordings):
+    """Replace memory-mapped recordings by their file names.
+
+    This avoids copying the data when the recordings are pickled to be sent
+    back from a parallel worker.
+    """
+    packed = dict()
+    for name, data in recordings.items():
+        if isinstance(data, np.memmap):
+            data.flush()
+            data = ('memmap', data.filename, data.dtype.str, data.shape)
+        packed[name] = data
+    return packed
+
+
+def _unpack_recordings(packed):
+    """Reopen the memory-mapped recordings packed by _pack_recordings."""
+    recordings = dict()
+    for name, data in packed.items():
+        if isinstance(data, tuple) and data[0] == 'memmap':
+            data = np.memmap(data[1], dtype=data[2], mode='r+',
+                             shape=data[3])
+        recordings[name] = data
+    return recordings
+
+
+def read_snapshot(fname):
+    """Read a network from a snapshot written by Network.write_snapshot.
+
+    The connections and the event times of the feeds of each trial are
+    read from the file instead of being derived from the parameters, so
+    building the network in NEURON is a bulk load of the arrays. Later
+    changes to the parameters of the connections and feeds have no effect,
+    but the cells are still created from the parameters of the network.
+
+    Parameters
+    ----------
+    fname : str
+        The name of the file (.npz).
+
+    Returns
+    -------
+    net : instance of Network
+        The network, with the parameters, record_dt and min_delay it had
+        when the snapshot was written.
+    """
+    with np.load(fname) as data:
+        snapshot = {key: data[key] for key in data.files}
+
+    params = Params(json.loads(snapshot.pop('params').item()))
+    min_delay = snapshot.pop('min_delay').item()
+    net = Network(params, record_dt=snapshot.pop('record_dt').item(),
+                  min_delay=None if np.isnan(min_delay) else min_delay)
+    n_src = snapshot.pop('n_src').item()
+    if n_src != net.n_src:
+        raise ValueError('The snapshot has %d sources but its parameters '
+                         'create a network with %d sources' % (n_src,
+                                                               net.n_src))
+    net._snapshot = snapshot
+    return net
+
+
+# The connections between cells made by the parconnect method of each cell
+# class: the source cell type, the number of synapses it targets on each
+# cell and whether a cell connects to itself.
+_CELL_CONNECTIONS = {
+    'L2_pyramidal': [('L2_pyramidal', 6, False), ('L2_basket', 2, True)],
+    'L5Pyr': [('L5Pyr', 6, False), ('L5_basket', 2, True),
+              ('L2_pyramidal', 4, True), ('L2_basket', 1, True)],
+    'L2_basket': [('L2_pyramidal', 1, True), ('L2_basket', 1, True)],
+    'L5_basket': [('L5_basket', 1, False), ('L5Pyr', 1, True),
+                  ('L2_pyramidal', 1, True)],
+}
+# The number of sections that feeds target at each location (sect_loc)
+_FEED_SECTIONS = {
+    'L2_pyramidal': dict(proximal=3, distal=1),
+    'L5Pyr': dict(proximal=3, distal=1),
+    'L2_basket': dict(proximal=1, distal=1),
+    'L5_basket': dict(proximal=1, distal=0),
+}
+# The names of the cell classes, as used in the parameters and ncfrom_*
+_CELL_NAMES = {'L2_pyramidal': 'L2Pyr', 'L5Pyr': 'L5Pyr',
+               'L2_basket': 'L2Basket', 'L5_basket': 'L5Basket'}
+# The number of somatic synapses whose current is recorded
+_N_SOMA_SYNAPSES = {'L2_pyramidal': 2, 'L5Pyr': 2, 'L2_basket': 3,
+                    'L5_basket': 3}
+# The sections of the pyramidal cells (L2 cells have no apical_2)
+_PYR_SECTION_NAMES = ['soma', 'apical_trunk', 'apical_1', 'apical_2',
+                      'apical_tuft', 'apical_oblique', 'basal_1', 'basal_2',
+                      'basal_3']
+# The wall time (s) to create a cell with its feeds and a connection, and to
+# integrate a segment over a time step. Fitted to the timings of single
+# trials of 24 to 532 cells on one x86-64 core; they scale with the speed
+# of the machine.
+_RUNTIME_COSTS = dict(cells=3.5e-3, netcons=2e-5, segment_steps=5.3e-7)
+
+
+def _get_cell_geometry(cell_type, params):
+    """The number of sections and segments of a cell.
+
+    The segments are set as in Pyr.set_dend_props.
+    """
+    if cell_type in ('L2_basket', 'L5_basket'):
+        return 1, 1
+    if cell_type == 'L2_pyramidal':
+        p_all = get_L2Pyr_params_default()
+    else:
+        p_all = get_L5Pyr_params_default()
+    name = _CELL_NAMES[cell_type]
+    n_sections, n_segments = 1, 1  # soma
+    for key in p_all:
+        if key.startswith(name) and key.endswith('_L') and 'soma' not in key:
+            length = params.get(key, p_all[key])
+            nseg = 1
+            if length > 100.:
+                nseg = int(length / 50.)
+                nseg += 1 - nseg % 2  # odd
+            n_sections += 1
+            n_segments += nseg
+    return n_sections, n_segments
+
+
 def _create_coords(n_pyr_x, n_pyr_y, n_common_feeds, p_unique_keys,
                    zdiff=1307.4):
     """Creates coordinate grid.
@@ -147,6 +273,18 @@ class Network(object):
     ----------
     params : dict
         The parameters
+    record_dt : float | None
+        The sampling interval (in ms) of the recorded dipoles and somatic
+        currents. Must be an integer multiple of params['dt']. The signals
+        are low-pass filtered before being decimated to avoid aliasing.
+        If None, record at every integration time step.
+    min_delay : float | None
+        If not None, the delays (in ms) of all connections between cells
+        and from feeds are floored to min_delay. This changes the model,
+        but with MPI the processes exchange spikes at most every
+        min_delay ms. Spike compression and the bin queue of NEURON are
+        enabled as well to reduce the cost of each exchange. Must be at
+        least params['dt']. If None, the delays are not modified.
 
     Attributes
     ----------
@@ -160,9 +298,41 @@ class Network(object):
         An instance of the Spikes object.
     trial_idx : int
         Current trial number (starting from 0)
+    record_dt : float
+        The sampling interval (in ms) of the recorded signals.
+    n_times : int
+        The number of recorded time points.
+    min_delay : float | None
+        The lower bound of the connection delays (in ms).
+    recordings : list of dict
+        The per-cell recordings requested with add_recording and
+        add_dipole_recording. Each element of the list is a trial and maps
+        the name of the recording to an array of shape (n_cells, n_times),
+        or (n_cell_types, n_times) for dipoles summed over cell types.
+    recording_gids : dict of array
+        The cell IDs corresponding to the rows of each recording.
+    recording_types : dict of list of str
+        The cell types corresponding to the rows of the dipoles summed
+        over the cells of each type, added with add_dipole_recording.
+    record_max_bytes : int | None
+        The memory budget (in bytes) of the per-cell recordings of a trial.
+        If their total size exceeds it, the recordings are stored in
+        memory-mapped files. If None, they are always kept in memory.
+    record_mmap_dir : str | None
+        The directory of the memory-mapped files. If None, the default
+        temporary directory is used.
+    electrode_positions : dict of array
+        The positions of the electrodes of each array added with
+        add_electrode_array, of shape (n_electrodes, 3).
+    lfp : list of dict
+        The extracellular potentials (uV) of each trial. Each element maps
+        the name of an electrode array to an array of shape
+        (n_electrodes, n_times).
+    timings : list of dict
+        The timings of each trial. See Network.write_timings.
     """
 
-    def __init__(self, params):
+    def __init__(self, params, record_dt=None, min_delay=None):
         # set the params internally for this net
         # better than passing it around like ...
         self.params = params
@@ -170,9 +340,25 @@ class Network(object):
         # Originally used to create the empty vec for synaptic currents,
         # ensuring that they exist on this node irrespective of whether
         # or not cells of relevant type actually do
-
-        self.n_times = np.arange(0., self.params['tstop'],
-                                 self.params['dt']).size + 1
+        self._n_times_sim = np.arange(0., self.params['tstop'],
+                                      self.params['dt']).size + 1
+
+        # recorded signals are decimated by an integer factor
+        if record_dt is None:
+            record_dt = self.params['dt']
+        decim = record_dt / self.params['dt']
+        if round(decim) < 1 or not np.isclose(decim, round(decim)):
+            raise ValueError('record_dt must be an integer multiple of '
+                             'dt (%s ms). Got %s' % (self.params['dt'],
+                                                     record_dt))
+        self.record_dt = record_dt
+        self._decim = int(round(decim))
+        self.n_times = (self._n_times_sim - 1) // self._decim + 1
+
+        if min_delay is not None and min_delay < self.params['dt']:
+            raise ValueError('min_delay must be at least dt (%s ms). Got %s'
+                             % (self.params['dt'], min_delay))
+        self.min_delay = min_delay
 
         self.n_src = 0
         self.n_of_type = {}  # numbers of sources
@@ -211,6 +397,23 @@ class Network(object):
         self._gid_list = []
         self.trial_idx = 0
 
+        # per-cell recordings requested with add_recording()
+        self._record_spec = dict()
+        self.recording_gids = dict()
+        self.recordings = list()
+        # dipoles of cells and cell types added with add_dipole_recording()
+        self._dipole_spec = dict()
+        self.recording_types = dict()
+        self.record_max_bytes = None
+        self.record_mmap_dir = None
+        # extracellular electrode arrays added with add_electrode_array()
+        self._electrode_spec = dict()
+        self.electrode_positions = dict()
+        self.lfp = list()
+        self.timings = list()
+        # the resolved connections and feeds, set by read_snapshot
+        self._snapshot = None
+
     def __repr__(self):
         class_name = self.__class__.__name__
         s = ("%d x %d Pyramidal cells (L2, L5)"
@@ -275,6 +478,249 @@ class Network(object):
             src = self.src_list_new[i]
             self.gid_dict[src] = range(gid_ind[i], gid_ind[i + 1])
 
+    def _get_gid_ranks(self, n_procs):
+        """Return the rank of the process that each gid is assigned to.
+
+        Cells are assigned to the processes round robin. The feeds that
+        are unique to a cell are assigned to the process of that cell and
+        the common feeds are assigned round robin.
+
+        Parameters
+        ----------
+        n_procs : int
+            The number of processes.
+
+        Returns
+        -------
+        gid_ranks : array of int, shape (n_src,)
+            The rank of each gid.
+        """
+        gid_ranks = np.empty(self.n_src, dtype=int)
+        for src_type, gids in self.gid_dict.items():
+            gids = np.asarray(gids, dtype=int)
+            if src_type in self.p_unique or src_type == 'common':
+                # index of the target cell or common feed
+                gid_ranks[gids] = np.arange(len(gids)) % n_procs
+            else:
+                gid_ranks[gids] = gids % n_procs
+        return gid_ranks
+
+    def _count_netcons(self):
+        """Count the connections that the cells of each type receive.
+
+        The counts follow the parconnect, parreceive and parreceive_ext
+        methods of the cell classes, without creating the cells.
+
+        Returns
+        -------
+        n_netcons : dict of dict
+            The number of connections received by all the cells of each
+            type, by source: 'L2Pyr', 'L2Basket', 'L5Pyr', 'L5Basket',
+            'common', 'extgauss', 'extpois' or 'ev' (evoked). As in
+            Pyr.parreceive_ext, the evoked connections of the pyramidal
+            cells are counted with the common ones.
+        """
+        n_netcons = dict()
+        for cell_type in self.cellname_list:
+            n_cells = self.n_of_type[cell_type]
+            n_sects = _FEED_SECTIONS[cell_type]
+            name = _CELL_NAMES[cell_type]
+            counts = dict()
+            for src_type, n_syns, autapses in _CELL_CONNECTIONS[cell_type]:
+                n_pairs = n_cells * self.n_of_type[src_type]
+                if src_type == cell_type and not autapses:
+                    n_pairs -= n_cells
+                counts[_CELL_NAMES[src_type]] = n_pairs * n_syns
+
+            counts['common'] = 0
+            for p_src in self.p_common:
+                if cell_type in ('L2_pyramidal', 'L5Pyr'):
+                    # Pyr.parreceive connects both receptors
+                    n_receptors = 2
+                else:
+                    n_receptors = sum('%s_%s' % (name, receptor) in p_src
+                                      for receptor in ('ampa', 'nmda'))
+                counts['common'] += (n_cells * n_receptors *
+                                     n_sects[p_src['loc']])
+
+            counts.update(extgauss=0, extpois=0, ev=0)
+            for src_type, p_src in self.p_unique.items():
+                if cell_type not in p_src:
+                    continue
+                if src_type.startswith(('evprox', 'evdist')):
+                    name_ev = 'common' if name.endswith('Pyr') else 'ev'
+                    counts[name_ev] += n_cells * 2 * n_sects[p_src['loc']]
+                elif src_type == 'extgauss':
+                    counts['extgauss'] += n_cells * n_sects['proximal']
+                elif src_type == 'extpois':
+                    n_receptors = 2 if p_src[cell_type][1] > 0. else 1
+                    counts['extpois'] += (n_cells * n_receptors *
+                                          n_sects['proximal'])
+            n_netcons[cell_type] = counts
+        return n_netcons
+
+    def _count_elements(self, gid_ranks=None):
+        """Count what a trial creates in NEURON, to estimate its memory.
+
+        Parameters
+        ----------
+        gid_ranks : array of int, shape (n_src,) | None
+            The rank of the process of each gid. If None, the counts are
+            for a single process.
+
+        Returns
+        -------
+        counts : dict
+            The number of cells ('cells'), segments ('segments'), feeds
+            ('feeds'), connections ('netcons') and values recorded at each
+            integration time step ('recorded', including the dipoles,
+            somatic currents, per-cell recordings and electrode
+            potentials) and coefficients of the electrode transfer
+            matrices ('transfer'). Arrays of shape (n_procs,) if gid_ranks
+            is not None.
+        """
+        # the cells come first in the gids, followed by the feeds
+        is_cell = np.zeros(self.n_src)
+        is_cell[:self.n_cells] = 1
+        sections = np.zeros(self.n_src)
+        segments = np.zeros(self.n_src)
+        netcons = np.zeros(self.n_src)
+        recorded = np.zeros(self.n_src)
+        n_netcons = self._count_netcons()
+        for cell_type in self.cellname_list:
+            gids = np.array(self.gid_dict[cell_type], dtype=int)
+            if len(gids) == 0:
+                continue
+            sections[gids], segments[gids] = _get_cell_geometry(cell_type,
+                                                                self.params)
+            # all the cells of a type receive as many connections
+            netcons[gids] = sum(n_netcons[cell_type].values()) // len(gids)
+            recorded[gids] = _N_SOMA_SYNAPSES[cell_type]
+        for spec in self._record_spec.values():
+            if spec['var'] == 'Qsum' and spec['section'] is None:
+                # the dipole of each section is recorded and summed later
+                recorded[spec['gids']] += sections[spec['gids']]
+            else:
+                recorded[spec['gids']] += 1
+        # each process sums the dipoles of its cells of each type
+        n_type_dipoles = 0
+        for spec in self._dipole_spec.values():
+            if spec['by'] == 'cell':
+                for cell_type in spec['cell_types']:
+                    recorded[self.gid_dict[cell_type]] += 1
+            else:
+                n_type_dipoles += len(spec['cell_types'])
+
+        per_rank = gid_ranks is not None
+        if not per_rank:
+            gid_ranks = np.zeros(self.n_src, dtype=int)
+        n_procs = gid_ranks.max() + 1
+
+        def _per_rank(weights):
+            return np.bincount(gid_ranks, weights,
+                               minlength=n_procs).astype(int)
+
+        # each process records the dipoles of its cells and the potential
+        # of all the electrodes
+        n_electrodes = sum(len(spec['positions']) for spec in
+                           self._electrode_spec.values())
+        counts = dict(cells=_per_rank(is_cell), segments=_per_rank(segments),
+                      feeds=_per_rank(1 - is_cell), netcons=_per_rank(netcons),
+                      recorded=((3 + n_electrodes + n_type_dipoles +
+                                 _per_rank(recorded)) * self._n_times_sim),
+                      transfer=n_electrodes * _per_rank(segments))
+        if not per_rank:
+            counts = {key: int(value[0]) for key, value in counts.items()}
+        return counts
+
+    def plan(self, n_procs=1):
+        """Plan the build of the network without creating it in NEURON.
+
+        Parameters
+        ----------
+        n_procs : int
+            The number of MPI processes to partition the network over.
+
+        Returns
+        -------
+        plan : dict
+            The counts, estimates and partition of the network. See Notes.
+
+        Notes
+        -----
+        The plan contains:
+
+        'cells', 'sections', 'segments' : the number of each by cell type.
+        'netcons' : the number of connections received by the cells of
+        each type, by source ('L2Pyr', 'L2Basket', 'L5Pyr', 'L5Basket',
+        'common', 'extgauss', 'extpois' or 'ev' for the evoked inputs of
+        the basket cells).
+        'feeds' : the number of feed sources by feed type.
+        'feed_events' : the number of events generated by the feeds of each
+        type in the first trial.
+        'memory' : the estimated peak memory (bytes) of a trial on a single
+        process.
+        'runtime' : the estimated wall time (s) to build ('build') and
+        simulate ('simulate') a trial over n_procs processes, that of the
+        slowest process without communication.
+        'ranks' : a list with the number of cells, segments, feeds,
+        connections ('netcons'), recorded values and electrode transfer
+        coefficients ('transfer'), and the estimated memory and build and
+        simulation times, of each process.
+
+        The memory and runtime are estimated from costs per cell, segment,
+        connection and recorded value measured on single trials. The
+        runtime scales with the speed of the machine and the spiking
+        activity of the network.
+        """
+        from .parallel_backends import _MEMORY_COSTS, _estimate_trial_memory
+
+        if n_procs < 1:
+            raise ValueError('n_procs must be at least 1. Got %s' % n_procs)
+
+        geometry = {cell_type: _get_cell_geometry(cell_type, self.params)
+                    for cell_type in self.cellname_list}
+        plan = dict(n_procs=n_procs)
+        plan['cells'] = {cell_type: self.n_of_type[cell_type]
+                         for cell_type in self.cellname_list}
+        plan['sections'] = {cell_type: n_cells * geometry[cell_type][0]
+                            for cell_type, n_cells in plan['cells'].items()}
+        plan['segments'] = {cell_type: n_cells * geometry[cell_type][1]
+                            for cell_type, n_cells in plan['cells'].items()}
+        plan['netcons'] = self._count_netcons()
+
+        plan['feeds'] = dict()
+        plan['feed_events'] = dict()
+        for src_type in self.extname_list:
+            n_events = 0
+            for gid in self.gid_dict[src_type]:
+                feed = self._create_feed(gid, self.p_common, self.p_unique)
+                n_events += len(feed.event_times)
+            plan['feeds'][src_type] = self.n_of_type[src_type]
+            plan['feed_events'][src_type] = n_events
+
+        counts = self._count_elements(self._get_gid_ranks(n_procs))
+        ranks = list()
+        for rank in range(n_procs):
+            rank_counts = {key: int(value[rank])
+                           for key, value in counts.items()}
+            memory = _MEMORY_COSTS['base'] + sum(
+                cost * rank_counts[key] for key, cost in _MEMORY_COSTS.items()
+                if key != 'base')
+            build = (_RUNTIME_COSTS['cells'] * rank_counts['cells'] +
+                     _RUNTIME_COSTS['netcons'] * rank_counts['netcons'])
+            simulate = (_RUNTIME_COSTS['segment_steps'] *
+                        rank_counts['segments'] * self._n_times_sim)
+            ranks.append(dict(rank_counts, memory=int(memory), build=build,
+                              simulate=simulate))
+        plan['ranks'] = ranks
+
+        plan['memory'] = _estimate_trial_memory(self)
+        plan['runtime'] = dict(
+            build=max(rank['build'] for rank in ranks),
+            simulate=max(rank['simulate'] for rank in ranks))
+        return plan
+
     def gid_to_type(self, gid):
         """Reverse lookup of gid to type."""
         for gidtype, gids in self.gid_dict.items():
@@ -294,6 +740,316 @@ class Network(object):
 
         return src_type, src_pos, src_type in real_cell_types
 
+    def _get_pext(self, trial_idx):
+        """The parameters of the feeds of a trial.
+
+        The feeds of trial 0 are seeded by the parameters and those of the
+        other trials by the index of the trial, for all backends.
+        """
+        params = self.params
+        if trial_idx != 0:
+            params = params.copy()
+            params['prng_*'] = trial_idx
+        return create_pext(params, params['tstop'])
+
+    def _set_trial(self, trial_idx):
+        """Seed the feeds of the network for a trial."""
+        self.p_common, self.p_unique = self._get_pext(trial_idx)
+        self.trial_idx = trial_idx
+
+    def _create_feed(self, gid, p_common, p_unique):
+        """Create the feed of a source with the parameters of a trial."""
+        src_type = self.gid_to_type(gid)
+        idx = gid - self.gid_dict[src_type][0]
+        if src_type == 'common':
+            return ExtFeed(feed_type=src_type, target_cell_type=None,
+                           params=p_common[idx], gid=gid)
+        # the unique feeds follow the order of their target cell
+        return ExtFeed(feed_type=src_type,
+                       target_cell_type=self.gid_to_type(idx),
+                       params=p_unique[src_type], gid=gid)
+
+    def _check_recording_name(self, name):
+        """Check that no recording has the name already."""
+        if name in self.recording_gids or name in self.recording_types:
+            raise ValueError('A recording named %s already exists' % name)
+
+    def add_recording(self, var, cell_types=None, gids=None, section=None,
+                      loc=0.5, name=None):
+        """Record a variable in each cell of a subset of the network.
+
+        Parameters
+        ----------
+        var : str
+            The variable to record. Can be 'v' for the membrane potential
+            (mV), 'i' for the total membrane current (nA) or 'Qsum' for the
+            current dipole (fAm) of pyramidal cells.
+        cell_types : list of str | None
+            The cell types to record from, e.g., ['L5Pyr']. If None, all
+            cell types that have the variable.
+        gids : array-like of int | None
+            The cell IDs to record from. If None, all the cells of
+            cell_types.
+        section : str | None
+            The name of the section, e.g., 'soma' or 'apical_tuft'. If None,
+            the soma for 'v' and 'i' and the sum over all the sections of a
+            cell for 'Qsum'.
+        loc : float
+            The location (0 to 1) along the section for 'v' and 'i'.
+        name : str | None
+            The name of the recording. If None, it is '<var>_<section>'
+            (or var if section is None). It must differ from the names of
+            the other recordings.
+
+        Notes
+        -----
+        The recordings of each trial are stored in Network.recordings once
+        the simulation is complete. They are sampled every record_dt.
+        """
+        pyr_types = ['L2_pyramidal', 'L5Pyr']
+        if var not in ('v', 'i', 'Qsum'):
+            raise ValueError("var must be one of 'v', 'i', 'Qsum'. Got %s"
+                             % var)
+        if cell_types is None:
+            cell_types = pyr_types if var == 'Qsum' else self.cellname_list
+        if isinstance(cell_types, str):
+            cell_types = [cell_types]
+        for cell_type in cell_types:
+            if cell_type not in self.cellname_list:
+                raise ValueError('cell_types must be a subset of %s. Got %s'
+                                 % (self.cellname_list, cell_type))
+            if var == 'Qsum' and cell_type not in pyr_types:
+                raise ValueError('Qsum can only be recorded from %s. Got %s'
+                                 % (pyr_types, cell_type))
+        if section is None and var != 'Qsum':
+            section = 'soma'
+        if not 0. <= loc <= 1.:
+            raise ValueError('loc must be between 0 and 1. Got %s' % loc)
+
+        type_gids = np.concatenate([np.array(self.gid_dict[cell_type])
+                                    for cell_type in cell_types])
+        if gids is None:
+            gids = type_gids
+        gids = np.unique(np.asarray(gids, dtype=int))
+        if not np.all(np.in1d(gids, type_gids)):
+            raise ValueError('gids must belong to the cell types %s'
+                             % (cell_types,))
+
+        if name is None:
+            name = var if section is None else '%s_%s' % (var, section)
+        self._check_recording_name(name)
+        self._record_spec[name] = dict(var=var, section=section, loc=loc,
+                                       gids=gids)
+        self.recording_gids[name] = gids
+
+    def add_dipole_recording(self, by='cell', cell_types=None, groups=None,
+                             name='dipole'):
+        """Record the current dipole of cells or cell types.
+
+        Parameters
+        ----------
+        by : str
+            'cell' to record the dipole of each cell or 'cell_type' to
+            record the sum of the dipoles of the cells of each type.
+        cell_types : list of str | None
+            The pyramidal cell types to record from. If None,
+            ['L2_pyramidal', 'L5Pyr'].
+        groups : dict of list of str | None
+            Groups of sections whose dipoles are summed and recorded
+            separately, e.g., {'apical': ['apical_trunk', 'apical_oblique',
+            'apical_1', 'apical_2', 'apical_tuft'], 'basal': ['soma',
+            'basal_1', 'basal_2', 'basal_3']}. The recording of each group
+            is named '<name>_<group>'. If None, the dipole of all the
+            sections is recorded as name.
+        name : str
+            The name of the recording.
+
+        Notes
+        -----
+        The dipoles (fAm) are those of the raw L2 and L5 dipoles, before
+        baseline renormalization, scaling and smoothing: the dipoles of all
+        the sections of all the cells of a layer add up to the raw dipole
+        of the layer. At each integration time step, the dipoles of all the
+        sections of a process are computed at once from its voltages and
+        summed into preallocated arrays. The sums over cell types are
+        combined across MPI processes in the same reduction as the
+        aggregate dipoles and the dipoles of the cells are gathered on rank
+        0. They are stored in Network.recordings once the simulation is
+        complete, sampled every record_dt. The rows are given by
+        Network.recording_gids if by is 'cell' and Network.recording_types
+        if by is 'cell_type'.
+        """
+        pyr_types = ['L2_pyramidal', 'L5Pyr']
+        if by not in ('cell', 'cell_type'):
+            raise ValueError("by must be one of 'cell', 'cell_type'. Got %s"
+                             % by)
+        if cell_types is None:
+            cell_types = pyr_types
+        if isinstance(cell_types, str):
+            cell_types = [cell_types]
+        for cell_type in cell_types:
+            if cell_type not in pyr_types:
+                raise ValueError('cell_types must be a subset of %s. Got %s'
+                                 % (pyr_types, cell_type))
+        cell_types = list(cell_types)
+
+        if groups is None:
+            groups = {name: None}
+        else:
+            for group, sections in groups.items():
+                if isinstance(sections, str):
+                    sections = [sections]
+                for section in sections:
+                    if section not in _PYR_SECTION_NAMES:
+                        raise ValueError('The sections of group %s must be '
+                                         'among %s. Got %s'
+                                         % (group, _PYR_SECTION_NAMES,
+                                            section))
+            groups = {'%s_%s' % (name, group): [sections] if
+                      isinstance(sections, str) else list(sections)
+                      for group, sections in groups.items()}
+        for rec_name in groups:
+            self._check_recording_name(rec_name)
+
+        for rec_name, sections in groups.items():
+            self._dipole_spec[rec_name] = dict(by=by, cell_types=cell_types,
+                                               sections=sections)
+            if by == 'cell':
+                self.recording_gids[rec_name] = np.sort(np.concatenate(
+                    [np.array(self.gid_dict[cell_type], dtype=int)
+                     for cell_type in cell_types]))
+            else:
+                self.recording_types[rec_name] = cell_types
+
+    def add_electrode_array(self, positions, name=None, sigma=0.3,
+                            min_distance=0.5):
+        """Record the extracellular potential at an array of electrodes.
+
+        Parameters
+        ----------
+        positions : array-like, shape (n_electrodes, 3)
+            The x, y, z coordinates (um) of the electrodes, in the space of
+            the 3D points of the cells. The soma of a cell at position
+            (x, y, z) in pos_dict starts at (100 * x, z, 100 * y), so the
+            apical dendrites run along the y axis.
+        name : str | None
+            The name of the array. If None, 'array<k>' for the k-th array
+            (starting from 0).
+        sigma : float
+            The conductivity (S/m) of the extracellular medium.
+        min_distance : float
+            The minimum distance (um) between an electrode and the axis of
+            a segment, to avoid the singularity of the potential on it.
+
+        Notes
+        -----
+        The potential is computed with the line source approximation: the
+        membrane current of each segment is spread uniformly along it. A
+        transfer matrix from the membrane currents of all the segments to
+        the electrodes is computed once when the network is built, and
+        applied to the currents at each integration time step, so the
+        memory scales with the number of electrodes rather than the number
+        of segments. The potentials (uV) of each trial are stored in
+        Network.lfp once the simulation is complete, sampled every
+        record_dt. See hnn_core.analysis.csd for the current source
+        density of a laminar array.
+        """
+        positions = np.array(positions, dtype=float)
+        if positions.ndim != 2 or positions.shape[1] != 3 or \
+                len(positions) == 0:
+            raise ValueError('positions must be of shape (n_electrodes, 3). '
+                             'Got %s' % (positions.shape,))
+        if sigma <= 0:
+            raise ValueError('sigma must be positive. Got %s' % sigma)
+        if min_distance <= 0:
+            raise ValueError('min_distance must be positive. Got %s'
+                             % min_distance)
+        if name is None:
+            name = 'array%d' % len(self._electrode_spec)
+        self._electrode_spec[name] = dict(positions=positions, sigma=sigma,
+                                          min_distance=min_distance)
+        self.electrode_positions[name] = positions
+
+    def write_timings(self, fname):
+        """Write the timings of the simulated trials to a JSON file.
+
+        Parameters
+        ----------
+        fname : str
+            The name of the file.
+
+        Notes
+        -----
+        The file contains a list with a dict for each trial, with keys:
+
+        'n_procs' : the number of processes.
+        'build' : the wall time (s) of each stage of building the network
+        in NEURON, which is built again for each trial.
+        'simulate' : the wall time (s) of each stage of the simulation.
+        'neuron' : the time (s) spent by NEURON integrating ('step_time'),
+        waiting for other processes ('wait_time') and exchanging spikes
+        ('send_time') during the simulation.
+        'counts' : the number of cells, feeds, connections ('netcons') and
+        synaptic events delivered to them ('events').
+
+        Each quantity is a dict with its sum ('total') and maximum ('max')
+        across processes and its value on each process ('per_rank'). A
+        maximum well above the average points to load imbalance.
+        """
+        with open(fname, 'w') as fid:
+            json.dump(self.timings, fid, indent=2)
+
+    def write_snapshot(self, fname):
+        """Write the fully resolved network to a file.
+
+        The network is built in NEURON and the connections it creates and
+        the event times of its feeds in each of the N_trials trials are
+        written as arrays, along with the parameters. The file documents
+        exactly what is simulated and read_snapshot creates a network that
+        is built directly from it.
+
+        Parameters
+        ----------
+        fname : str
+            The name of the file. The extension .npz is appended if
+            missing.
+
+        Notes
+        -----
+        The file is a compressed numpy archive with the arrays:
+
+        'src_gids', 'target_gids' : the cell IDs of the source and target
+        of each connection, in the order they are created.
+        'synapses' : the index of the target synapse of each connection in
+        'synapse_names' (e.g., 'soma_gabaa').
+        'netcons' : the index of the class of each connection in
+        'netcon_names' (e.g., 'L2Pyr', 'extpois').
+        'weights', 'delays', 'thresholds' : the weight, delay (ms) and
+        threshold (mV) of each connection.
+        'feed_gids' : the cell IDs of the feeds.
+        'feed_times', 'feed_offsets' : the event times (ms) of all feeds
+        in all trials, those of feed_gids[i] in trial t being
+        feed_times[feed_offsets[j]:feed_offsets[j + 1]] with
+        j = t * len(feed_gids) + i.
+        'params', 'record_dt', 'min_delay', 'n_src' : the parameters as a
+        JSON string, record_dt, min_delay (nan if None) and the number of
+        sources of the network.
+        """
+        from .neuron import NeuronNetwork, _get_rank
+
+        self._set_trial(0)
+        with NeuronNetwork(self) as neuron_net:
+            snapshot = neuron_net._get_snapshot()
+        if _get_rank() != 0:
+            return
+
+        min_delay = np.nan if self.min_delay is None else self.min_delay
+        np.savez_compressed(
+            fname, params=np.array(json.dumps(dict(self.params))),
+            record_dt=np.array(self.record_dt),
+            min_delay=np.array(min_delay), n_src=np.array(self.n_src),
+            **snapshot)
+
     def plot_cells(self, ax=None, show=True):
         """Plot the cells using Network.pos_dict.
 
@@ -312,7 +1068,8 @@ class Network(object):
         """
         return plot_cells(net=self, ax=ax, show=show)
 
-    def plot_input(self, ax=None, show=True):
+    def plot_input(self, ax=None, show=True, trial_idx=None, tmin=None,
+                   tmax=None):
         """Plot the histogram of input.
 
         Parameters
@@ -322,13 +1079,102 @@ class Network(object):
             a new figure is created.
         show : bool
             If True, show the figure.
+        trial_idx : int | list of int | None
+            The trials to plot. If None, all trials are plotted.
+        tmin : float | None
+            The start of the time window (in ms). If None, 0.
+        tmax : float | None
+            The end of the time window (in ms). If None, params['tstop'].
 
         Returns
         -------
         fig : instance of matplotlib Figure
             The matplotlib figure handle.
         """
-        return plot_hist_input(net=self, ax=ax, show=show)
+        return plot_hist_input(net=self, ax=ax, show=show,
+                               trial_idx=trial_idx, tmin=tmin, tmax=tmax)
+
+
+class _SpikeIndex(object):
+    """The spikes of all trials sorted by cell ID, trial and time.
+
+    Parameters
+    ----------
+    spikes : instance of Spikes
+        The spikes to index.
+
+    Attributes
+    ----------
+    times, gids, trial_idxs : array, shape (n_spikes,)
+        The sorted spikes. The arrays are read-only.
+    gid_offsets : array of int, shape (n_gids + 1,)
+        The spikes of cell ID gid are in gid_offsets[gid]:gid_offsets[gid + 1].
+    train_offsets : array of int, shape (n_trains + 1,)
+        The boundaries of the spike trains of each cell in each trial.
+    n_spikes : list of int
+        The number of spikes of each trial when the index was built.
+    """
+
+    def __init__(self, spikes):
+        self.n_spikes = [len(trial) for trial in spikes._times]
+        times, gids, trial_idxs = spikes._get_flat()
+        self._order = np.lexsort((times, trial_idxs, gids))
+        self.times = times[self._order]
+        self.gids = gids[self._order]
+        self.trial_idxs = trial_idxs[self._order]
+        n_gids = self.gids[-1] + 1 if len(gids) else 0
+        self.gid_offsets = np.concatenate(
+            [[0], np.cumsum(np.bincount(self.gids, minlength=n_gids))])
+        new_train = np.ones(len(times), dtype=bool)
+        new_train[1:] = ((np.diff(self.gids) != 0) |
+                         (np.diff(self.trial_idxs) != 0))
+        self.train_offsets = np.append(np.flatnonzero(new_train), len(times))
+        for arr in (self.times, self.gids, self.trial_idxs):
+            arr.setflags(write=False)
+
+        self._types = spikes._types
+        self._type_index = None
+
+    def get_gid_slice(self, gid):
+        """The slice of the spikes of a cell ID."""
+        if not 0 <= gid < len(self.gid_offsets) - 1:
+            return slice(0, 0)
+        return slice(self.gid_offsets[gid], self.gid_offsets[gid + 1])
+
+    def get_type_index(self):
+        """The spikes sorted by type and time, with offsets per type.
+
+        Returns
+        -------
+        type_offsets : dict of tuple
+            The start and stop of the spikes of each type.
+        times, gids, trial_idxs : array, shape (n_spikes,)
+            The spikes sorted by type and time.
+        """
+        if self._type_index is not None:
+            return self._type_index
+        n_types = [len(trial) for trial in self._types]
+        if n_types != self.n_spikes:
+            raise ValueError('The spikes do not all have a type. Use '
+                             'update_types to assign them')
+        codes = dict()
+        for spike_type in it.chain.from_iterable(self._types):
+            codes.setdefault(spike_type, len(codes))
+        type_codes = np.fromiter(
+            (codes[spike_type] for spike_type in
+             it.chain.from_iterable(self._types)),
+            dtype=int, count=len(self.times))[self._order]
+        order = np.lexsort((self.times, type_codes))
+        counts = np.bincount(type_codes, minlength=len(codes))
+        stops = np.cumsum(counts)
+        type_offsets = {spike_type: (stops[code] - counts[code], stops[code])
+                        for spike_type, code in codes.items()}
+        arrays = [arr[order] for arr in (self.times, self.gids,
+                                         self.trial_idxs)]
+        for arr in arrays:
+            arr.setflags(write=False)
+        self._type_index = (type_offsets, *arrays)
+        return self._type_index
 
 
 class Spikes(object):
@@ -368,6 +1214,18 @@ class Spikes(object):
     -------
     update_types(gid_dict)
         Update spike types in the current instance of Spikes.
+    count(n_gids=None, tmin=None, tmax=None)
+        Count the spikes of each cell in each trial.
+    rates(gid_dict, tmin, tmax, cell_types=None)
+        Compute the mean firing rate of each cell type in each trial.
+    psth(gid_dict, tmin, tmax, bin_width=1., sigma=None, cell_types=None)
+        Compute the peri-stimulus time histogram of each cell type.
+    get_spikes(gid=None, cell_type=None, tmin=None, tmax=None)
+        Get the spikes of a cell or a cell type in all trials.
+    iter_spike_trains(gids=None)
+        Iterate over the spike trains of each cell in each trial.
+    interspike_intervals(gids=None)
+        Compute the intervals between the spikes of each cell.
     plot(ax=None, show=True)
         Plot and return a matplotlib Figure object showing the
         aggregate network spiking activity according to cell type.
@@ -405,6 +1263,13 @@ class Spikes(object):
         self._times = times
         self._gids = gids
         self._types = types
+        # sorted spikes, built on the first query
+        self._index = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_index'] = None
+        return state
 
     def __repr__(self):
         class_name = self.__class__.__name__
@@ -465,8 +1330,311 @@ class Spikes(object):
                 spike_types_trial[spike_gids_mask] = gidtype
             spike_types += [list(spike_types_trial)]
         self._types = spike_types
+        self._index = None
+
+    def _get_flat(self, tmin=None, tmax=None):
+        """Concatenate the spikes of all trials within a time window.
+
+        Returns
+        -------
+        times : array, shape (n_spikes,)
+            The spike times.
+        gids : array of int, shape (n_spikes,)
+            The cell IDs.
+        trial_idxs : array of int, shape (n_spikes,)
+            The trial of each spike.
+        """
+        n_spikes = [len(trial) for trial in self._times]
+        times = np.fromiter(it.chain.from_iterable(self._times), dtype=float,
+                            count=sum(n_spikes))
+        gids = np.fromiter(it.chain.from_iterable(self._gids), dtype=int,
+                           count=sum(n_spikes))
+        trial_idxs = np.repeat(np.arange(len(n_spikes)), n_spikes)
+        if tmin is not None or tmax is not None:
+            mask = np.ones(len(times), dtype=bool)
+            if tmin is not None:
+                mask &= times >= tmin
+            if tmax is not None:
+                mask &= times < tmax
+            times, gids, trial_idxs = times[mask], gids[mask], trial_idxs[mask]
+        return times, gids, trial_idxs
+
+    def _get_type_idxs(self, gids, gid_dict, cell_types):
+        """The index in cell_types of the type of each gid (-1 if none)."""
+        if cell_types is None:
+            cell_types = list(gid_dict)
+        for cell_type in cell_types:
+            if cell_type not in gid_dict:
+                raise ValueError('cell_types must be keys of gid_dict. '
+                                 'Got %s' % cell_type)
+        n_gids = max([max(gid_dict[cell_type], default=-1) + 1
+                      for cell_type in cell_types] +
+                     [gids.max() + 1 if len(gids) else 0])
+        lookup = np.full(n_gids, -1)
+        for type_idx, cell_type in enumerate(cell_types):
+            lookup[np.asarray(gid_dict[cell_type], dtype=int)] = type_idx
+        n_cells = np.array([len(gid_dict[cell_type]) for cell_type in
+                            cell_types])
+        return lookup[gids], n_cells
+
+    def count(self, n_gids=None, tmin=None, tmax=None):
+        """Count the spikes of each cell in each trial.
+
+        Parameters
+        ----------
+        n_gids : int | None
+            The number of cell IDs. If None, the largest cell ID that spiked
+            plus one.
+        tmin : float | None
+            The start of the time window (in ms). If None, it starts at the
+            first spike.
+        tmax : float | None
+            The end (excluded) of the time window (in ms). If None, it ends
+            after the last spike.
+
+        Returns
+        -------
+        counts : array of int, shape (n_trials, n_gids)
+            The number of spikes of each cell ID in each trial.
+        """
+        _, gids, trial_idxs = self._get_flat(tmin, tmax)
+        if n_gids is None:
+            n_gids = gids.max() + 1 if len(gids) else 0
+        elif len(gids) and gids.max() >= n_gids:
+            raise ValueError('n_gids must be larger than the largest cell ID '
+                             '(%d). Got %d' % (gids.max(), n_gids))
+        n_trials = len(self._times)
+        counts = np.bincount(trial_idxs * n_gids + gids,
+                             minlength=n_trials * n_gids)
+        return counts.reshape(n_trials, n_gids)
 
-    def plot(self, ax=None, show=True):
+    def rates(self, gid_dict, tmin, tmax, cell_types=None):
+        """Compute the mean firing rate of each cell type in each trial.
+
+        Parameters
+        ----------
+        gid_dict : dict of range
+            The cell IDs of each cell type, e.g., Network.gid_dict.
+        tmin : float
+            The start of the time window (in ms).
+        tmax : float
+            The end (excluded) of the time window (in ms).
+        cell_types : list of str | None
+            The cell types. If None, all the keys of gid_dict.
+
+        Returns
+        -------
+        rates : array, shape (n_trials, n_cell_types)
+            The number of spikes per cell and per second (Hz) of each cell
+            type, including the cells that did not spike.
+        """
+        if tmax <= tmin:
+            raise ValueError('tmax must be larger than tmin. Got tmin=%s and '
+                             'tmax=%s' % (tmin, tmax))
+        _, gids, trial_idxs = self._get_flat(tmin, tmax)
+        type_idxs, n_cells = self._get_type_idxs(gids, gid_dict, cell_types)
+        n_trials, n_types = len(self._times), len(n_cells)
+        valid = type_idxs >= 0
+        counts = np.bincount(trial_idxs[valid] * n_types + type_idxs[valid],
+                             minlength=n_trials * n_types)
+        counts = counts.reshape(n_trials, n_types)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return counts / (n_cells * (tmax - tmin) / 1000.)
+
+    def psth(self, gid_dict, tmin, tmax, bin_width=1., sigma=None,
+             cell_types=None):
+        """Compute the peri-stimulus time histogram of each cell type.
+
+        Parameters
+        ----------
+        gid_dict : dict of range
+            The cell IDs of each cell type, e.g., Network.gid_dict.
+        tmin : float
+            The start of the first bin (in ms).
+        tmax : float
+            The end of the time window (in ms). The last bin ends at or
+            before tmax.
+        bin_width : float
+            The width of the bins (in ms).
+        sigma : float | None
+            If not None, the histograms are smoothed with a Gaussian kernel
+            of this standard deviation (in ms), truncated at 4 standard
+            deviations. The rates are underestimated within this distance
+            of tmin and tmax.
+        cell_types : list of str | None
+            The cell types. If None, all the keys of gid_dict.
+
+        Returns
+        -------
+        psth : array, shape (n_trials, n_cell_types, n_bins)
+            The number of spikes per cell and per second (Hz) of each cell
+            type in each bin.
+        times : array, shape (n_bins,)
+            The centers of the bins (in ms).
+        """
+        n_bins = int(np.floor((tmax - tmin) / bin_width + 1e-9))
+        if n_bins < 1:
+            raise ValueError('bin_width must be positive and at most tmax - '
+                             'tmin (%s ms). Got %s' % (tmax - tmin, bin_width))
+        t_end = tmin + n_bins * bin_width
+        times, gids, trial_idxs = self._get_flat(tmin, t_end)
+        type_idxs, n_cells = self._get_type_idxs(gids, gid_dict, cell_types)
+        n_trials, n_types = len(self._times), len(n_cells)
+
+        valid = type_idxs >= 0
+        bin_idxs = ((times[valid] - tmin) / bin_width).astype(int)
+        np.minimum(bin_idxs, n_bins - 1, out=bin_idxs)
+        flat_idxs = ((trial_idxs[valid] * n_types + type_idxs[valid]) *
+                     n_bins + bin_idxs)
+        counts = np.bincount(flat_idxs, minlength=n_trials * n_types * n_bins)
+        psth = counts.reshape(n_trials, n_types, n_bins).astype(float)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            psth /= n_cells[:, np.newaxis] * bin_width / 1000.
+
+        if sigma is not None:
+            from .analysis import _next_pow2
+
+            n_half = int(np.ceil(4. * sigma / bin_width))
+            offsets = np.arange(-n_half, n_half + 1) * bin_width
+            kernel = np.exp(-offsets ** 2 / (2. * sigma ** 2))
+            kernel /= kernel.sum()
+            # 'same' convolution of all the histograms at once
+            n_fft = _next_pow2(n_bins + len(kernel) - 1)
+            psth = np.fft.irfft(np.fft.rfft(psth, n_fft) *
+                                np.fft.rfft(kernel, n_fft), n_fft)
+            psth = psth[..., n_half:n_half + n_bins]
+
+        return psth, tmin + (np.arange(n_bins) + 0.5) * bin_width
+
+    def _get_index(self):
+        """Build the index of the spikes if they changed."""
+        n_spikes = [len(trial) for trial in self._times]
+        if self._index is None or self._index.n_spikes != n_spikes:
+            self._index = _SpikeIndex(self)
+        return self._index
+
+    def get_spikes(self, gid=None, cell_type=None, tmin=None, tmax=None):
+        """Get the spikes of a cell or a cell type in all trials.
+
+        The spikes are sorted once by cell ID, trial and time, and by type
+        and time, on the first query. A query then takes logarithmic time.
+
+        Parameters
+        ----------
+        gid : int | None
+            The cell ID.
+        cell_type : str | None
+            The type of the spikes, e.g., 'L5Pyr'. Exactly one of gid and
+            cell_type must be given.
+        tmin : float | None
+            The start of the time window (in ms). If None, it is not
+            bounded.
+        tmax : float | None
+            The end (excluded) of the time window (in ms). If None, it is not
+            bounded.
+
+        Returns
+        -------
+        times : array, shape (n_spikes,)
+            The spike times, sorted by trial and time for a gid and by time
+            for a cell type.
+        gids : array of int, shape (n_spikes,)
+            The cell IDs.
+        trial_idxs : array of int, shape (n_spikes,)
+            The trial of each spike.
+
+        Notes
+        -----
+        The arrays are read-only views of the index, except for the spikes
+        of a gid within a time window, which are copied.
+        """
+        if (gid is None) == (cell_type is None):
+            raise ValueError('Exactly one of gid and cell_type must be '
+                             'given')
+        index = self._get_index()
+        if gid is not None:
+            sl = index.get_gid_slice(gid)
+            times, gids, trial_idxs = (index.times[sl], index.gids[sl],
+                                       index.trial_idxs[sl])
+            if tmin is not None or tmax is not None:
+                mask = np.ones(len(times), dtype=bool)
+                if tmin is not None:
+                    mask &= times >= tmin
+                if tmax is not None:
+                    mask &= times < tmax
+                times, gids, trial_idxs = (times[mask], gids[mask],
+                                           trial_idxs[mask])
+            return times, gids, trial_idxs
+
+        type_offsets, times, gids, trial_idxs = index.get_type_index()
+        start, stop = type_offsets.get(cell_type, (0, 0))
+        if tmin is not None:
+            start += np.searchsorted(times[start:stop], tmin, side='left')
+        if tmax is not None:
+            stop = start + np.searchsorted(times[start:stop], tmax,
+                                           side='left')
+        return times[start:stop], gids[start:stop], trial_idxs[start:stop]
+
+    def iter_spike_trains(self, gids=None):
+        """Iterate over the spike trains of each cell in each trial.
+
+        Parameters
+        ----------
+        gids : list of int | None
+            The cell IDs. If None, all the cells that spiked, in increasing
+            order.
+
+        Yields
+        ------
+        gid : int
+            The cell ID.
+        trial_idx : int
+            The trial.
+        times : array
+            The sorted spike times, as a read-only view of the index.
+            Trials in which the cell did not spike are skipped.
+        """
+        index = self._get_index()
+        offsets = index.train_offsets
+        if gids is None:
+            train_ranges = [(0, len(offsets) - 1)]
+        else:
+            train_ranges = list()
+            for gid in gids:
+                sl = index.get_gid_slice(gid)
+                train_ranges.append(tuple(np.searchsorted(
+                    offsets, [sl.start, sl.stop]).tolist()))
+        for first, last in train_ranges:
+            for start, stop in zip(offsets[first:last].tolist(),
+                                   offsets[first + 1:last + 1].tolist()):
+                yield (int(index.gids[start]), int(index.trial_idxs[start]),
+                       index.times[start:stop])
+
+    def interspike_intervals(self, gids=None):
+        """Compute the intervals between the spikes of each cell.
+
+        Parameters
+        ----------
+        gids : list of int | None
+            The cell IDs. If None, all cells.
+
+        Returns
+        -------
+        isis : array, shape (n_intervals,)
+            The intervals (in ms) between consecutive spikes of a cell within
+            a trial, sorted by cell ID and trial.
+        isi_gids : array of int, shape (n_intervals,)
+            The cell ID of each interval.
+        """
+        index = self._get_index()
+        same_train = ((np.diff(index.gids) == 0) &
+                      (np.diff(index.trial_idxs) == 0))
+        if gids is not None:
+            same_train &= np.in1d(index.gids[1:], gids)
+        return np.diff(index.times)[same_train], index.gids[1:][same_train]
+
+    def plot(self, ax=None, show=True, trial_idx=None, tmin=None,
+             tmax=None, max_spikes=50000):
         """Plot the aggregate spiking activity according to cell type.
 
         Parameters
@@ -476,13 +1644,25 @@ class Spikes(object):
             a new figure is created.
         show : bool
             If True, show the figure.
+        trial_idx : int | list of int | None
+            The trials to plot. If None, all trials are plotted.
+        tmin : float | None
+            The start of the time window (in ms). If None, 0.
+        tmax : float | None
+            The end of the time window (in ms). If None, the last spike
+            time.
+        max_spikes : int
+            If more spikes are plotted, they are drawn as an image of the
+            spike density of each cell type. See plot_spikes_raster.
 
         Returns
         -------
         fig : instance of matplotlib Figure
             The matplotlib figure object.
         """
-        return plot_spikes_raster(spikes=self, ax=ax, show=show)
+        return plot_spikes_raster(spikes=self, ax=ax, show=show,
+                                  trial_idx=trial_idx, tmin=tmin, tmax=tmax,
+                                  max_spikes=max_spikes)
 
     def write(self, fname):
         """Write spiking activity per trial to a collection of files.
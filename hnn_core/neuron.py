@@ -4,11 +4,24 @@
 #          Sam Neymotin <samnemo@gmail.com>
 #          Blake Caldwell <blake_caldwell@brown.edu>
 
+import os
+import os.path as op
+import sys
+import hashlib
+import platform
+import shutil
+import subprocess
+import tempfile
+from glob import glob
+from time import perf_counter
+from warnings import warn
+
 import numpy as np
 from neuron import h
 
-from .feed import ExtFeed
-from .cell import _ArtificialCell
+from .network import _pack_recordings
+from .cell import (_ArtificialCell, _move_cells_to_pos,
+                   _get_segment_coords)
 from .pyramidal import L2Pyr, L5Pyr
 from .basket import L2Basket, L5Basket
 
@@ -22,14 +35,86 @@ _CVODE = None
 # NeuronNetwork, it will seg fault.
 _LAST_NETWORK = None
 
+# the sources of the connections, each stored in a list cell.ncfrom_<name>
+_NETCON_NAMES = ['L2Pyr', 'L2Basket', 'L5Pyr', 'L5Basket', 'common',
+                 'extgauss', 'extpois', 'ev']
+
+
+class _StageTimer(object):
+    """Record the wall time of consecutive stages.
+
+    Each call to lap() ends the current stage and starts the next one.
+    """
+
+    def __init__(self):
+        self.times = dict()
+        self._start = perf_counter()
+
+    def lap(self, stage):
+        now = perf_counter()
+        self.times[stage] = now - self._start
+        self._start = now
+
+
+def _summarize_per_rank(values):
+    """Summarize a quantity measured on each rank."""
+    values = np.asarray(values)
+    return {'total': values.sum().item(), 'max': values.max().item(),
+            'per_rank': values.tolist()}
+
+
+def _summarize_timings(local_list, spike_gids):
+    """Combine the timings and counts measured on each rank.
+
+    Parameters
+    ----------
+    local_list : list of dict
+        The timings and counts of each rank, as gathered on rank 0.
+    spike_gids : array of int
+        The cell IDs of all the spikes of the trial.
+
+    Returns
+    -------
+    timings : dict
+        The timings of the build ('build') and simulation ('simulate')
+        stages in seconds, the counts of cells, feeds, connections and
+        synaptic events ('counts') and the integration, waiting and spike
+        exchange times reported by NEURON ('neuron'). Each quantity is a
+        dict with its total and maximum across ranks and its value on each
+        rank.
+    """
+    timings = {'n_procs': len(local_list)}
+    for key in ('build', 'simulate', 'neuron'):
+        timings[key] = {stage: _summarize_per_rank(
+            [local[key][stage] for local in local_list])
+            for stage in local_list[0][key]}
+
+    # every spike is delivered to each of the connections from its source
+    n_src = len(local_list[0]['fanout'])
+    spike_counts = np.bincount(spike_gids, minlength=n_src)
+    for local in local_list:
+        local['counts']['events'] = int(local['fanout'] @ spike_counts)
+    timings['counts'] = {name: _summarize_per_rank(
+        [local['counts'][name] for local in local_list])
+        for name in local_list[0]['counts']}
+    return timings
+
 
 def _simulate_single_trial(neuron_net):
-    """Simulate one trial."""
+    """Simulate one trial.
+
+    Returns
+    -------
+    dpl : instance of Dipole | None
+        The dipole of the trial. The signals are only combined on rank 0,
+        so it is None on the other ranks.
+    """
 
-    from .dipole import Dipole
+    from .dipole import Dipole, _lowpass_decimate, reprocess
 
     global _PC, _CVODE
 
+    timer = _StageTimer()
     h.load_file("stdrun.hoc")
 
     rank = _get_rank()
@@ -59,9 +144,21 @@ def _simulate_single_trial(neuron_net):
     dp_rec_L5 = h.Vector()
     dp_rec_L5.record(h._ref_dp_total_L5)  # L5 dipole recording
 
-    # sets the default max solver step in ms (purposefully large)
+    # with floored delays, the spikes exchanged between procs are
+    # compressed and events are delivered with a bin queue
+    if neuron_net.net.min_delay is not None:
+        _PC.spike_compress(1, 0)
+        _CVODE.queue_mode(1, 0)
+    else:
+        _PC.spike_compress(0, 0)
+        _CVODE.queue_mode(0, 0)
+
+    # sets the default max solver step in ms (purposefully large). NEURON
+    # exchanges spikes at the minimum connection delay if it is smaller
     _PC.set_maxstep(10)
 
+    timer.lap('setup')
+
     # initialize cells to -65 mV, after all the NetCon
     # delays have been specified
     h.finitialize()
@@ -74,58 +171,292 @@ def _simulate_single_trial(neuron_net):
             _CVODE.event(tt, simulation_time)
 
     h.fcurrent()
+    neuron_net._init_step_recordings()
 
     # initialization complete, but wait for all procs to start the solver
     _PC.barrier()
+    timer.lap('finitialize')
+
+    # NEURON accumulates these times over the whole process
+    neuron_times = {'step_time': _PC.step_time(),
+                    'wait_time': _PC.wait_time(),
+                    'send_time': _PC.send_time()}
 
     # actual simulation - run the solver
     _PC.psolve(h.tstop)
 
+    neuron_times = {'step_time': _PC.step_time() - neuron_times['step_time'],
+                    'wait_time': _PC.wait_time() - neuron_times['wait_time'],
+                    'send_time': _PC.send_time() - neuron_times['send_time']}
+    timer.lap('psolve')
+
     _PC.barrier()
 
-    # these calls aggregate data across procs/nodes
-    _PC.allreduce(dp_rec_L2, 1)
-    # combine dp_rec on every node, 1=add contributions together
-    _PC.allreduce(dp_rec_L5, 1)
+    # low-pass filter and decimate the signals on each proc before
+    # combining them. Since the sum across procs is linear, this is
+    # equivalent to decimating the combined signals but it transfers less
+    decim = neuron_net.net._decim
+    times = _vec_as_numpy(t_vec)[::decim].copy()
     # aggregate the currents independently on each proc
     neuron_net.aggregate_currents()
-    # combine neuron_net.current{} variables from each proc
-    _PC.allreduce(neuron_net.current['L5Pyr_soma'], 1)
-    _PC.allreduce(neuron_net.current['L2Pyr_soma'], 1)
+    current_names = list(neuron_net.current.keys())
+    signals = [_vec_as_numpy(dp_rec_L2), _vec_as_numpy(dp_rec_L5)]
+    signals += [_vec_as_numpy(neuron_net.current[name])
+                for name in current_names]
+    # the potential at each electrode is the sum over the procs of that
+    # due to their cells
+    signals.append(neuron_net._lfp_data)
+    # as are the dipoles summed over cell types
+    type_rows = [(name, start, stop) for name, (by, start, stop, _) in
+                 neuron_net._dipole_rows.items() if by == 'cell_type']
+    signals += [neuron_net._dipole_data[start:stop]
+                for _, start, stop in type_rows]
+    # fuse the dipoles, currents and potentials into one buffer and sum it
+    # on rank 0
+    signals = _lowpass_decimate(np.vstack(signals), decim)
+    signals = _reduce_to_root(signals)
+    timer.lap('reduce')
+
+    # combine the per-cell recordings from each proc on rank 0
+    neuron_net._recordings = neuron_net._gather_recordings()
 
     # combine spiking data from each proc
-    spiketimes_list = _PC.py_gather(neuron_net._spiketimes, 0)
-    spikegids_list = _PC.py_gather(neuron_net._spikegids, 0)
-    # only rank 0's lists are complete
-
-    if rank == 0:
-        for spike_vec in spiketimes_list:
-            neuron_net._all_spiketimes.append(spike_vec)
-        for spike_vec in spikegids_list:
-            neuron_net._all_spikegids.append(spike_vec)
+    spike_times, spike_gids = _gather_spikes(
+        _vec_as_numpy(neuron_net._spiketimes),
+        _vec_as_numpy(neuron_net._spikegids))
 
     _PC.barrier()  # get all nodes to this place before continuing
+    timer.lap('gather')
 
-    dpl_data = np.c_[np.array(dp_rec_L2.to_python()) +
-                     np.array(dp_rec_L5.to_python()),
-                     np.array(dp_rec_L2.to_python()),
-                     np.array(dp_rec_L5.to_python())]
-
-    dpl = Dipole(np.array(t_vec.to_python()), dpl_data)
+    # only rank 0's data are complete
+    dpl = None
     if rank == 0:
+        neuron_net._all_spiketimes = spike_times
+        neuron_net._all_spikegids = spike_gids
+        n_currents = len(current_names)
+        neuron_net.current = dict(zip(current_names,
+                                      signals[2:2 + n_currents]))
+        rest = signals[2 + n_currents:]
+        for name, spec in neuron_net.net._electrode_spec.items():
+            n_electrodes = len(spec['positions'])
+            neuron_net._lfp[name] = rest[:n_electrodes]
+            rest = rest[n_electrodes:]
+        for name, start, stop in type_rows:
+            neuron_net._recordings[name] = rest[:stop - start]
+            rest = rest[stop - start:]
+
+        dp_L2, dp_L5 = signals[0], signals[1]
+        dpl_data = np.c_[dp_L2 + dp_L5, dp_L2, dp_L5]
+        dpl = Dipole(times, dpl_data)
         if neuron_net.net.params['save_dpl']:
             dpl.write('rawdpl.txt')
 
-        dpl.baseline_renormalize(neuron_net.net.params)
-        dpl.convert_fAm_to_nAm()
-        dpl.scale(neuron_net.net.params['dipole_scalefctr'])
-        dpl.smooth(neuron_net.net.params['dipole_smooth_win'] / h.dt)
+        # the raw dipole is kept to change the processing without
+        # simulating again
+        dpl.raw_data = dpl.data
+        dpl = reprocess(dpl, neuron_net.net.params,
+                        neuron_net.net.record_dt)[0]
+    timer.lap('postprocess')
+
+    local = {'build': neuron_net._build_times, 'simulate': timer.times,
+             'neuron': neuron_times, 'counts': neuron_net._counts,
+             'fanout': neuron_net._fanout}
+    local_list = _PC.py_gather(local, 0) if nhosts > 1 else [local]
+    if rank == 0:
+        neuron_net._timings = _summarize_timings(local_list, spike_gids)
 
     neuron_net.net.trial_idx += 1
 
     return dpl
 
 
+def _get_mpi_comm():
+    """Return the mpi4py communicator spanning the ParallelContext.
+
+    Returns
+    -------
+    comm : instance of mpi4py.MPI.Comm | None
+        The communicator. None if running on a single process, or if mpi4py
+        is not available, in which case the ParallelContext is used.
+    """
+    if _get_nhosts() == 1:
+        return None
+    try:
+        from mpi4py import MPI
+    except ImportError:
+        return None
+    comm = MPI.COMM_WORLD
+    if comm.Get_size() != _get_nhosts():
+        return None
+    return comm
+
+
+def _reduce_to_root(signals):
+    """Sum signals across procs onto rank 0 in a single operation.
+
+    Parameters
+    ----------
+    signals : array, shape (n_signals, n_times)
+        The signals of this proc, fused into one contiguous buffer.
+
+    Returns
+    -------
+    signals : array, shape (n_signals, n_times) | None
+        The signals summed across procs. None on ranks other than 0.
+    """
+    signals = np.ascontiguousarray(signals, dtype=np.float64)
+    if _get_nhosts() == 1:
+        return signals
+
+    comm = _get_mpi_comm()
+    if comm is None:
+        # ParallelContext cannot reduce to a root, but one allreduce of the
+        # fused buffer still replaces one call per signal
+        vec = h.Vector(signals.ravel())
+        _PC.allreduce(vec, 1)
+        reduced = _vec_as_numpy(vec).reshape(signals.shape).copy()
+    else:
+        from mpi4py import MPI
+        reduced = np.empty_like(signals) if comm.Get_rank() == 0 else None
+        comm.Reduce(signals, reduced, op=MPI.SUM, root=0)
+
+    if _get_rank() != 0:
+        return None
+    return reduced
+
+
+def _gather_spikes(spike_times, spike_gids):
+    """Gather the spikes of all procs onto rank 0 as typed arrays.
+
+    Parameters
+    ----------
+    spike_times : array, shape (n_spikes,)
+        The spike times recorded on this proc.
+    spike_gids : array, shape (n_spikes,)
+        The corresponding cell IDs.
+
+    Returns
+    -------
+    spike_times : array of float, shape (n_spikes_total,) | None
+        The spike times of all procs. None on ranks other than 0.
+    spike_gids : array of int, shape (n_spikes_total,) | None
+        The corresponding cell IDs. None on ranks other than 0.
+    """
+    # gids are exactly representable as doubles, so times and gids are
+    # packed into one buffer of shape (n_spikes, 2)
+    local = np.column_stack((spike_times, spike_gids)).astype(np.float64)
+
+    comm = _get_mpi_comm()
+    if _get_nhosts() == 1:
+        spikes = local
+    elif comm is None:
+        spikes_list = _PC.py_gather(local, 0)
+        spikes = np.concatenate(spikes_list) if _get_rank() == 0 else None
+    else:
+        counts = np.empty(comm.Get_size(), dtype=np.int64)
+        comm.Gather(np.array([local.size], dtype=np.int64), counts, root=0)
+        if comm.Get_rank() == 0:
+            spikes = np.empty((counts.sum() // 2, 2))
+            comm.Gatherv(local, (spikes, counts), root=0)
+        else:
+            comm.Gatherv(local, None, root=0)
+            spikes = None
+
+    if spikes is None:
+        return None, None
+    return spikes[:, 0].copy(), spikes[:, 1].astype(np.int64)
+
+
+def _vec_as_numpy(vec):
+    """Return a h.Vector as a numpy array, without copy where supported."""
+    if hasattr(vec, 'as_numpy'):
+        return vec.as_numpy()
+    return np.array(vec.to_python())
+
+
+def _allocate_recordings(shapes, max_bytes=None, mmap_dir=None):
+    """Allocate arrays for the per-cell recordings.
+
+    Parameters
+    ----------
+    shapes : dict of tuple
+        The shape of each recording.
+    max_bytes : int | None
+        If the total size of the arrays exceeds max_bytes, they are
+        memory-mapped files instead of in-memory arrays.
+    mmap_dir : str | None
+        The directory of the memory-mapped files.
+
+    Returns
+    -------
+    recordings : dict of array
+        The allocated arrays.
+    """
+    n_bytes = sum(np.prod(shape) * 8 for shape in shapes.values())
+    use_mmap = max_bytes is not None and n_bytes > max_bytes
+
+    recordings = dict()
+    for name, shape in shapes.items():
+        if use_mmap:
+            fd, fname = tempfile.mkstemp(prefix='hnn_%s_' % name,
+                                         suffix='.dat', dir=mmap_dir)
+            os.close(fd)
+            recordings[name] = np.memmap(fname, dtype=np.float64,
+                                         mode='w+', shape=shape)
+        else:
+            recordings[name] = np.empty(shape)
+    return recordings
+
+
+def _get_transfer_matrix(positions, starts, ends, sigma, min_distance):
+    """Compute the line source transfer matrix of an electrode array.
+
+    Parameters
+    ----------
+    positions : array, shape (n_electrodes, 3)
+        The coordinates (um) of the electrodes.
+    starts : array, shape (n_segments, 3)
+        The coordinates (um) of the start of each segment.
+    ends : array, shape (n_segments, 3)
+        The coordinates (um) of the end of each segment.
+    sigma : float
+        The conductivity (S/m) of the extracellular medium.
+    min_distance : float
+        The minimum distance (um) between an electrode and the axis of a
+        segment.
+
+    Returns
+    -------
+    transfer : array, shape (n_electrodes, n_segments)
+        The potential (uV) at each electrode for a membrane current of 1 nA
+        spread uniformly along each segment.
+    """
+    axes = ends - starts
+    lengths = np.linalg.norm(axes, axis=1)
+    is_line = lengths > 0
+    units = np.zeros_like(axes)
+    units[is_line] = axes[is_line] / lengths[is_line, None]
+
+    transfer = np.empty((len(positions), len(starts)))
+    # one electrode at a time keeps the temporaries of shape (n_segments,)
+    for row, pos in enumerate(positions):
+        rel = pos - starts
+        # position along and distance from the axis of each segment
+        along = np.einsum('ij,ij->i', rel, units)
+        dist2 = np.einsum('ij,ij->i', rel, rel)
+        perp = np.sqrt(np.maximum(dist2 - along ** 2, 0.))
+        perp = np.maximum(perp, min_distance)
+        # the integral of 1 / distance along the segment, divided by its
+        # length. Segments of zero length are point sources.
+        coefs = 1. / np.maximum(np.sqrt(dist2), min_distance)
+        coefs[is_line] = (np.arcsinh((lengths - along) / perp) +
+                          np.arcsinh(along / perp))[is_line] / lengths[is_line]
+        transfer[row] = coefs
+    # nA / (S/m * um) is mV
+    transfer *= 1e3 / (4 * np.pi * sigma)
+    return transfer
+
+
 def _is_loaded_mechanisms():
     # copied from:
     # https://www.neuron.yale.edu/neuron/static/py_doc/modelspec/programmatic/mechtype.html
@@ -142,20 +473,156 @@ def _is_loaded_mechanisms():
         return True
 
 
-def load_custom_mechanisms():
-    import platform
-    import os.path as op
+def _get_cache_dir():
+    """The per-user directory where hnn_core caches compiled files."""
+    cache_dir = os.environ.get('HNN_CORE_CACHE_DIR')
+    if cache_dir is None:
+        if sys.platform == 'win32':
+            base_dir = os.environ.get('LOCALAPPDATA', op.expanduser('~'))
+        else:
+            base_dir = os.environ.get('XDG_CACHE_HOME',
+                                      op.join(op.expanduser('~'), '.cache'))
+        cache_dir = op.join(base_dir, 'hnn_core')
+    return cache_dir
+
+
+def _get_mechanisms_key(mod_dir):
+    """The key of the mechanisms compiled from the mod files of mod_dir.
+
+    It combines the architecture, the NEURON version and a hash of the
+    names and contents of the mod files, so that a library is never reused
+    after any of them changes.
+    """
+    import neuron
+
+    hasher = hashlib.sha256()
+    for fname in sorted(glob(op.join(mod_dir, '*.mod'))):
+        hasher.update(op.basename(fname).encode())
+        with open(fname, 'rb') as fid:
+            hasher.update(fid.read())
+    return '%s-%s-neuron%s-%s' % (sys.platform, platform.machine(),
+                                  neuron.__version__,
+                                  hasher.hexdigest()[:16])
+
+
+def _find_mechanisms_library(build_dir):
+    """The library compiled by nrnivmodl in build_dir, or None."""
+    candidates = [op.join(build_dir, 'nrnmech.dll')]
+    for arch_dir in sorted(glob(op.join(build_dir, '*', ''))):
+        candidates += [op.join(arch_dir, 'libnrnmech.so'),
+                       op.join(arch_dir, '.libs', 'libnrnmech.so'),
+                       op.join(arch_dir, 'libnrnmech.dylib')]
+    for fname in candidates:
+        if op.exists(fname):
+            return fname
+    return None
+
+
+class _FileLock(object):
+    """Exclusive lock on a file, held by one process at a time."""
+
+    def __init__(self, fname):
+        self.fname = fname
+
+    def __enter__(self):
+        self._fid = open(self.fname, 'a')
+        try:
+            import fcntl
+            fcntl.flock(self._fid, fcntl.LOCK_EX)
+        except ImportError:  # Windows
+            import msvcrt
+            msvcrt.locking(self._fid.fileno(), msvcrt.LK_LOCK, 1)
+        return self
+
+    def __exit__(self, *args):
+        try:
+            import fcntl
+            fcntl.flock(self._fid, fcntl.LOCK_UN)
+        except ImportError:
+            import msvcrt
+            msvcrt.locking(self._fid.fileno(), msvcrt.LK_UNLCK, 1)
+        self._fid.close()
+
 
+def _compile_mechanisms(mod_dir, cache_dir=None):
+    """Compile the mechanisms of mod_dir into the cache unless already there.
+
+    Parameters
+    ----------
+    mod_dir : str
+        The directory of the mod files.
+    cache_dir : str | None
+        The cache directory. If None, the per-user cache of hnn_core. Its
+        location can be set with the HNN_CORE_CACHE_DIR environment
+        variable.
+
+    Returns
+    -------
+    mech_fname : str
+        The compiled library.
+    """
+    if cache_dir is None:
+        cache_dir = op.join(_get_cache_dir(), 'mechanisms')
+    os.makedirs(cache_dir, exist_ok=True)
+    key = _get_mechanisms_key(mod_dir)
+    build_dir = op.join(cache_dir, key)
+
+    # the processes that start at the same time wait for the first one
+    # to compile the mechanisms
+    with _FileLock(build_dir + '.lock'):
+        mech_fname = _find_mechanisms_library(build_dir)
+        if mech_fname is not None:
+            return mech_fname
+
+        if shutil.which('nrnivmodl') is None:
+            raise FileNotFoundError('nrnivmodl could not be found to compile '
+                                    'the mechanisms in %s' % mod_dir)
+        print('Compiling the mechanisms in %s into %s' % (mod_dir, build_dir))
+        # compile in a temporary directory so that an interrupted
+        # compilation is never mistaken for a complete one
+        tmp_dir = tempfile.mkdtemp(prefix=key + '.', dir=cache_dir)
+        try:
+            for fname in glob(op.join(mod_dir, '*.mod')):
+                shutil.copy(fname, tmp_dir)
+            proc = subprocess.run(['nrnivmodl'], cwd=tmp_dir,
+                                  stdout=subprocess.PIPE,
+                                  stderr=subprocess.STDOUT,
+                                  universal_newlines=True)
+            if (proc.returncode != 0 or
+                    _find_mechanisms_library(tmp_dir) is None):
+                raise RuntimeError('Compiling the mechanisms in %s failed:\n%s'
+                                   % (mod_dir, proc.stdout[-2000:]))
+            os.rename(tmp_dir, build_dir)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    return _find_mechanisms_library(build_dir)
+
+
+def load_custom_mechanisms():
+    """Load the mechanisms of hnn_core, compiling them on first use.
+
+    The mechanisms are compiled into a per-user cache, keyed by the
+    contents of the mod files, the NEURON version and the architecture,
+    and reused by all the processes and Python environments that share
+    them. If they cannot be compiled, e.g., because nrnivmodl or a
+    compiler is not available or the cache is not writable, the mechanisms
+    compiled when installing hnn_core are loaded instead.
+    """
     if _is_loaded_mechanisms():
         return
 
-    if platform.system() == 'Windows':
-        mech_fname = op.join(op.dirname(__file__), 'mod', 'nrnmech.dll')
-    else:
-        mech_fname = op.join(op.dirname(__file__), 'mod', 'x86_64',
-                             '.libs', 'libnrnmech.so')
-    if not op.exists(mech_fname):
-        raise FileNotFoundError(f'The file {mech_fname} could not be found')
+    mod_dir = op.join(op.dirname(__file__), 'mod')
+    try:
+        mech_fname = _compile_mechanisms(mod_dir)
+    except (OSError, RuntimeError) as err:
+        mech_fname = _find_mechanisms_library(mod_dir)
+        if mech_fname is None:
+            raise FileNotFoundError('The mechanisms in %s are not compiled '
+                                    'and could not be compiled: %s'
+                                    % (mod_dir, err))
+        warn('The mechanisms could not be compiled (%s). Loading %s, which '
+             'may have been compiled from other mod files or for another '
+             'version of NEURON' % (err, mech_fname))
 
     h.nrn_load_dll(mech_fname)
     print('Loading custom mechanism files from %s' % mech_fname)
@@ -241,6 +708,10 @@ class NeuronNetwork(object):
         Dictionary with keys 'evprox1', 'evdist1' etc.
         containing the range of Cell IDs of different cell
         (or input) types.
+    min_delays : array, shape (n_procs, n_procs) | None
+        The minimum delay (in ms) of the connections from sources on each
+        process (rows) to cells on each process (columns). Only available
+        on rank 0.
 
     Notes
     -----
@@ -270,10 +741,13 @@ class NeuronNetwork(object):
     def _build(self):
         """Building the network in NEURON."""
 
+        timer = _StageTimer()
         _create_parallel_context()
+        timer.lap('create_parallel_context')
 
         # load mechanisms needs ParallelContext for get_rank
         load_custom_mechanisms()
+        timer.lap('load_mechanisms')
 
         if _get_rank() == 0:
             print('Building the NEURON model')
@@ -281,30 +755,59 @@ class NeuronNetwork(object):
         self._clear_last_network_objects()
 
         self._gid_assign()
-
-        # Create a h.Vector() with size 1xself.N_t, zero'd
-        self.current = {
-            'L5Pyr_soma': h.Vector(self.net.n_times, 0),
-            'L2Pyr_soma': h.Vector(self.net.n_times, 0),
-        }
+        timer.lap('gid_assign')
 
         self._create_cells_and_feeds()
+        timer.lap('create_cells_and_feeds')
         self.state_init()
-        self._parnet_connect()
+        timer.lap('state_init')
+        if self.net._snapshot is None:
+            self._parnet_connect()
+        else:
+            self._connect_from_snapshot()
+        timer.lap('connect')
 
         # set to record spikes
         self._spiketimes = h.Vector()
         self._spikegids = h.Vector()
 
         # used by rank 0 for spikes across all procs (MPI)
-        self._all_spiketimes = h.Vector()
-        self._all_spikegids = h.Vector()
+        self._all_spiketimes = np.empty(0)
+        self._all_spikegids = np.empty(0, dtype=np.int64)
 
         self._record_spikes()
+        self._record_cells()
+        timer.lap('record')
         self.move_cells_to_pos()  # position cells in 2D grid
-
+        timer.lap('move_cells_to_pos')
+        # the transfer matrices depend on the final positions of the cells
+        self._setup_electrodes()
+        timer.lap('setup_electrodes')
+        self._setup_dipoles()
+        timer.lap('setup_dipoles')
+        if self._imem_ptrvec is not None or self._dipole_ptrvec is not None:
+            # the same object must be passed to remove the callback
+            self._step_callback = self._record_step
+            _CVODE.extra_scatter_gather(0, self._step_callback)
+
+        src_gids, delays = self._get_local_connections()
+        self.min_delays = self._compute_min_delays(src_gids, delays)
+        # the number of connections from each source to this proc
+        self._fanout = np.bincount(src_gids, minlength=self.net.n_src)
+        self._counts = {'cells': len(self.cells),
+                        'feeds': len(self._feed_cells),
+                        'netcons': len(src_gids)}
+        timer.lap('analyze_connections')
+        self._build_times = timer.times
+        self._timings = dict()
         if _get_rank() == 0:
             print('[Done]')
+            msg = 'Minimum connection delay: %0.3f ms' % self.min_delays.min()
+            if _get_nhosts() > 1:
+                between_procs = ~np.eye(_get_nhosts(), dtype=bool)
+                msg += (' (%0.3f ms between processes)'
+                        % self.min_delays[between_procs].min())
+            print(msg)
 
     def __enter__(self):
         """Context manager to cleanly build NeuronNetwork objects"""
@@ -322,29 +825,15 @@ class NeuronNetwork(object):
     def _gid_assign(self):
 
         rank = _get_rank()
-        nhosts = _get_nhosts()
 
-        # round robin assignment of gids
-        for gid in range(rank, self.net.n_cells, nhosts):
-            # set the cell gid
-            _PC.set_gid2node(gid, rank)
-            self.net._gid_list.append(gid)
-            # now to do the cell-specific external input gids on the same proc
-            # these are guaranteed to exist because all of
-            # these inputs were created for each cell
-            for key in self.net.p_unique.keys():
-                gid_input = gid + self.net.gid_dict[key][0]
-                _PC.set_gid2node(gid_input, rank)
-                self.net._gid_list.append(gid_input)
-
-        for gid_base in range(rank, self.net.n_common_feeds, nhosts):
-            # shift the gid_base to the common gid
-            gid = gid_base + self.net.gid_dict['common'][0]
-            # set as usual
+        # round robin assignment of cells, with the inputs specific to
+        # each cell on the same proc. The rank of all gids is kept to
+        # analyze the connectivity between procs.
+        self._gid_ranks = self.net._get_gid_ranks(_get_nhosts())
+        # extremely important to get the gids in the right order
+        for gid in np.flatnonzero(self._gid_ranks == rank).tolist():
             _PC.set_gid2node(gid, rank)
             self.net._gid_list.append(gid)
-        # extremely important to get the gids in the right order
-        self.net._gid_list.sort()
 
     def _create_cells_and_feeds(self):
         """Parallel create cells AND external inputs (feeds)
@@ -354,6 +843,24 @@ class NeuronNetwork(object):
         """
         params = self.net.params
 
+        # the event times of the feeds of each trial are stored in the
+        # snapshot
+        snapshot = self.net._snapshot
+        if snapshot is not None:
+            n_feeds = len(snapshot['feed_gids'])
+            n_trials = (len(snapshot['feed_offsets']) - 1) // max(n_feeds, 1)
+            trial_idx = self.net.trial_idx
+            if trial_idx >= n_trials:
+                raise ValueError('The snapshot has the feeds of %d trials. '
+                                 'Cannot simulate trial %d'
+                                 % (n_trials, trial_idx + 1))
+            start = trial_idx * n_feeds
+            offsets = snapshot['feed_offsets'][start:start + n_feeds + 1]
+            feed_times = {gid: snapshot['feed_times'][first:last] for
+                          gid, first, last in
+                          zip(snapshot['feed_gids'].tolist(),
+                              offsets[:-1].tolist(), offsets[1:].tolist())}
+
         # loop through gids on this node
         for gid in self.net._gid_list:
 
@@ -378,39 +885,20 @@ class NeuronNetwork(object):
                     cell = Cell(gid, src_pos)
                 self.cells.append(cell)
 
-            # external inputs are special types of artificial-cells
-            # 'common': all cells impacted with identical TIMING of spike
-            # events. NB: cell types can still have different weights for how
-            # such 'common' spikes influence them
-            elif src_type == 'common':
-                # print('cell_type',cell_type)
-                # to find param index, take difference between REAL gid
-                # here and gid start point of the items
-                p_ind = gid - self.net.gid_dict['common'][0]
-
-                # new ExtFeed: target cell type irrelevant (None) since input
-                # timing will be identical for all cells
-                feed = ExtFeed(feed_type=src_type,
-                               target_cell_type=None,
-                               params=self.net.p_common[p_ind],
-                               gid=gid)
-                feed_cell = _ArtificialCell(feed.event_times,
+            elif snapshot is not None:
+                feed_cell = _ArtificialCell(feed_times[gid].tolist(),
                                             params['threshold'])
                 self._feed_cells.append(feed_cell)
 
-            # external inputs can also be Poisson- or Gaussian-
-            # distributed, or 'evoked' inputs (proximal or distal)
-            # these are cell-specific ('unique')
-            elif src_type in self.net.p_unique.keys():
-                gid_target = gid - self.net.gid_dict[src_type][0]
-                target_cell_type = self.net.gid_to_type(gid_target)
-
-                # new ExtFeed, where now both feed type and target cell type
-                # specified because these feeds have cell-specific parameters
-                feed = ExtFeed(feed_type=src_type,
-                               target_cell_type=target_cell_type,
-                               params=self.net.p_unique[src_type],
-                               gid=gid)
+            # external inputs are special types of artificial-cells
+            # 'common': all cells impacted with identical TIMING of spike
+            # events. NB: cell types can still have different weights for how
+            # such 'common' spikes influence them. External inputs can also
+            # be Poisson- or Gaussian-distributed, or 'evoked' inputs
+            # (proximal or distal). These are cell-specific ('unique')
+            elif src_type == 'common' or src_type in self.net.p_unique:
+                feed = self.net._create_feed(gid, self.net.p_common,
+                                             self.net.p_unique)
                 feed_cell = _ArtificialCell(feed.event_times,
                                             params['threshold'])
                 self._feed_cells.append(feed_cell)
@@ -455,6 +943,178 @@ class NeuronNetwork(object):
                         cell_type, gid, self.net.gid_dict, self.net.pos_dict,
                         p_type)
 
+        # flooring the delays lengthens the interval between spike exchanges
+        if self.net.min_delay is not None:
+            for nc in self._iter_netcons():
+                nc.delay = max(nc.delay, self.net.min_delay)
+
+    def _connect_from_snapshot(self):
+        """Create the connections stored in the snapshot of the network.
+
+        The connections targeting the cells of this proc are created with
+        the stored weights and delays, in the order they were originally
+        created.
+        """
+        snapshot = self.net._snapshot
+        target_gids = snapshot['target_gids']
+        local = np.flatnonzero(self._gid_ranks[target_gids] == _get_rank())
+        synapse_names = snapshot['synapse_names'].tolist()
+        netcon_names = ['ncfrom_%s' % name_src for name_src in
+                        snapshot['netcon_names'].tolist()]
+
+        cells = {cell.gid: cell for cell in self.cells}
+        for src_gid, target_gid, synapse, netcon, weight, delay, threshold \
+                in zip(snapshot['src_gids'][local].tolist(),
+                       target_gids[local].tolist(),
+                       snapshot['synapses'][local].tolist(),
+                       snapshot['netcons'][local].tolist(),
+                       snapshot['weights'][local].tolist(),
+                       snapshot['delays'][local].tolist(),
+                       snapshot['thresholds'][local].tolist()):
+            cell = cells[target_gid]
+            nc = _PC.gid_connect(src_gid,
+                                 cell.synapses[synapse_names[synapse]])
+            nc.threshold = threshold
+            nc.weight[0] = weight
+            nc.delay = delay
+            getattr(cell, netcon_names[netcon]).append(nc)
+
+        if self.net.min_delay is not None:
+            for nc in self._iter_netcons():
+                nc.delay = max(nc.delay, self.net.min_delay)
+
+    def _iter_netcons(self, with_names=False):
+        """Iterate over the NetCons targeting the cells of this proc."""
+        for cell in self.cells:
+            for name_src in _NETCON_NAMES:
+                for nc in getattr(cell, 'ncfrom_%s' % name_src):
+                    if with_names:
+                        yield cell, name_src, nc
+                    else:
+                        yield nc
+
+    def _get_snapshot(self):
+        """Extract the resolved connections and the feeds of each trial.
+
+        Returns
+        -------
+        snapshot : dict of array | None
+            The arrays described in Network.write_snapshot, combined across
+            procs. None on ranks other than 0.
+        """
+        synapse_names = sorted({name for cell in self.cells
+                                for name in cell.synapses})
+        columns = dict(src_gids=list(), target_gids=list(), synapses=list(),
+                       netcons=list(), weights=list(), delays=list(),
+                       thresholds=list(), order=list())
+        syn_keys = dict()
+        for cell, name_src, nc in self._iter_netcons(with_names=True):
+            if cell.gid not in syn_keys:
+                syn_keys[cell.gid] = {syn.hname(): name for name, syn in
+                                      cell.synapses.items()}
+            columns['src_gids'].append(int(nc.srcgid()))
+            columns['target_gids'].append(cell.gid)
+            columns['synapses'].append(syn_keys[cell.gid][nc.syn().hname()])
+            columns['netcons'].append(_NETCON_NAMES.index(name_src))
+            columns['weights'].append(nc.weight[0])
+            columns['delays'].append(nc.delay)
+            columns['thresholds'].append(nc.threshold)
+            # the index of the hoc object increases with each new NetCon
+            columns['order'].append(int(nc.hname().split('[')[1][:-1]))
+        order = np.argsort(columns.pop('order'), kind='stable')
+        local = {key: np.array(val)[order] for key, val in columns.items()}
+
+        if _get_nhosts() > 1:
+            local_list = _PC.py_gather((synapse_names, local), 0)
+        else:
+            local_list = [(synapse_names, local)]
+        if _get_rank() != 0:
+            return None
+
+        synapse_names = sorted({name for names, _ in local_list
+                                for name in names})
+        snapshot = dict()
+        for key in ('src_gids', 'target_gids', 'netcons'):
+            snapshot[key] = np.concatenate([local[key] for _, local in
+                                            local_list]).astype(int)
+        for key in ('weights', 'delays', 'thresholds'):
+            snapshot[key] = np.concatenate([local[key] for _, local in
+                                            local_list]).astype(float)
+        snapshot['synapses'] = np.concatenate([
+            np.array([synapse_names.index(name) for name in
+                      local['synapses'].tolist()], dtype=int)
+            for _, local in local_list])
+
+        # the feeds of each trial are seeded as by the backends
+        net = self.net
+        feed_gids = [gid for gid in range(net.n_src) if
+                     not net._get_src_type_and_pos(gid)[2]]
+        snapshot['feed_gids'] = np.array(feed_gids, dtype=int)
+        feed_times = list()
+        for trial_idx in range(net.params['N_trials']):
+            p_common, p_unique = net._get_pext(trial_idx)
+            feed_times += [
+                np.array(net._create_feed(gid, p_common,
+                                          p_unique).event_times, float)
+                for gid in feed_gids]
+        snapshot['feed_offsets'] = np.concatenate(
+            [[0], np.cumsum([len(times) for times in feed_times])])
+        snapshot['feed_times'] = np.concatenate([np.empty(0)] + feed_times)
+        snapshot['synapse_names'] = np.array(synapse_names)
+        snapshot['netcon_names'] = np.array(_NETCON_NAMES)
+        return snapshot
+
+    def _get_local_connections(self):
+        """Return the connections targeting the cells of this proc.
+
+        Returns
+        -------
+        src_gids : array of int, shape (n_netcons,)
+            The gid of the source of each connection.
+        delays : array, shape (n_netcons,)
+            The delay (in ms) of each connection.
+        """
+        src_gids, delays = list(), list()
+        for nc in self._iter_netcons():
+            src_gids.append(int(nc.srcgid()))
+            delays.append(nc.delay)
+        return np.array(src_gids, dtype=int), np.array(delays)
+
+    def _compute_min_delays(self, src_gids, delays):
+        """Compute the minimum connection delay between each pair of procs.
+
+        NEURON exchanges spikes between procs at intervals of the minimum
+        delay of all connections, so the entries of min_delays bound how
+        long the procs can integrate independently.
+
+        Parameters
+        ----------
+        src_gids : array of int, shape (n_netcons,)
+            The gid of the source of each connection to this proc.
+        delays : array, shape (n_netcons,)
+            The delay (in ms) of each connection.
+
+        Returns
+        -------
+        min_delays : array, shape (n_procs, n_procs) | None
+            The minimum delay (in ms) of the connections from sources on
+            the proc of the row to cells on the proc of the column. The
+            entry is inf if there are no such connections. None on ranks
+            other than 0.
+        """
+        nhosts = _get_nhosts()
+        local = np.full(nhosts, np.inf)
+        np.minimum.at(local, self._gid_ranks[src_gids], delays)
+
+        if nhosts > 1:
+            local_list = _PC.py_gather(local, 0)
+        else:
+            local_list = [local]
+        if _get_rank() != 0:
+            return None
+        # rows of the gathered list are the target procs
+        return np.array(local_list).T
+
     # setup spike recording for this node
     def _record_spikes(self):
 
@@ -465,9 +1125,249 @@ class NeuronNetwork(object):
             if _PC.gid_exists(gid):
                 _PC.spike_record(gid, self._spiketimes, self._spikegids)
 
+    # setup the per-cell recordings for this node
+    def _record_cells(self):
+        self._cell_recordings = dict()
+        self._recordings = dict()
+        self._imem_records = list()
+
+        # membrane currents are only computed if they are recorded, or
+        # needed for the potential at electrodes
+        record_spec = self.net._record_spec
+        _CVODE.use_fast_imem(int(any(spec['var'] == 'i' for spec in
+                                     record_spec.values()) or
+                                 len(self.net._electrode_spec) > 0))
+
+        for name, spec in record_spec.items():
+            gid_set = set(spec['gids'].tolist())
+            gids, vecs = list(), list()
+            for cell in self.cells:
+                if cell.gid not in gid_set:
+                    continue
+                refs = cell._get_record_refs(spec['var'], spec['section'],
+                                             spec['loc'])
+                cell_vecs = list()
+                for ref in refs:
+                    # preallocate to avoid reallocations while recording
+                    vec = h.Vector()
+                    vec.buffer_size(self.net._n_times_sim)
+                    vec.record(ref)
+                    cell_vecs.append(vec)
+                    if spec['var'] == 'i':
+                        self._imem_records.append((vec, ref))
+                gids.append(cell.gid)
+                vecs.append(cell_vecs)
+            self._cell_recordings[name] = (np.array(gids, dtype=int), vecs)
+
+    def _setup_electrodes(self):
+        """Precompute the transfer matrix of the electrode arrays.
+
+        The membrane currents of all the segments of this proc are gathered
+        into one vector at each integration time step and multiplied by
+        the stacked transfer matrices of all the arrays.
+        """
+        self._lfp = dict()
+        self._transfer = np.empty((0, 0))
+        self._imem_ptrvec = None
+        electrode_spec = self.net._electrode_spec
+        if len(electrode_spec) == 0:
+            return
+
+        starts, ends, _ = _get_segment_coords(self.cells)
+        self._transfer = np.concatenate([
+            _get_transfer_matrix(spec['positions'], starts, ends,
+                                 spec['sigma'], spec['min_distance'])
+            for spec in electrode_spec.values()])
+        if len(starts) == 0:
+            return
+
+        # the segments are in the order of _get_segment_coords
+        self._imem_ptrvec = h.PtrVector(len(starts))
+        idx = 0
+        for cell in self.cells:
+            for sect in cell.get_sections():
+                for seg in sect:
+                    self._imem_ptrvec.pset(idx, seg._ref_i_membrane_)
+                    idx += 1
+        self._imem_vec = h.Vector(len(starts))
+
+    def _setup_dipoles(self):
+        """Map the dipole terms of the cells to the dipole recordings.
+
+        The voltages that the dipoles of all the sections of this proc
+        depend on are gathered into one vector at each integration time
+        step. The terms are computed at once and summed into the rows of
+        all the dipole recordings with a single bincount.
+        """
+        # the rows of each recording: by, first and last row, gids
+        self._dipole_rows = dict()
+        self._n_dipole_rows = 0
+        self._dipole_ptrvec = None
+        dipole_spec = self.net._dipole_spec
+        if len(dipole_spec) == 0:
+            return
+
+        cell_types = set()
+        for spec in dipole_spec.values():
+            cell_types.update(spec['cell_types'])
+        cells = [cell for cell in self.cells if cell.celltype in cell_types]
+        refs, weights = list(), list()
+        term_cells, term_sections = list(), list()
+        for cell_idx, cell in enumerate(cells):
+            for section, pv_ref, v_ref, weight in cell._get_dipole_terms():
+                refs.extend((pv_ref, v_ref))
+                weights.append(weight)
+                term_cells.append(cell_idx)
+                term_sections.append(section)
+        term_cells = np.array(term_cells, dtype=int)
+        term_sections = np.array(term_sections, dtype=object)
+        celltypes = np.array([cell.celltype for cell in cells],
+                             dtype=object)
+
+        n_rows = 0
+        term_idxs, term_rows = list(), list()
+        for rec_name, spec in dipole_spec.items():
+            is_cell = np.isin(celltypes, spec['cell_types'])
+            if spec['by'] == 'cell':
+                # the rows of the cells of each recording, by increasing gid
+                n_cell_rows = int(is_cell.sum())
+                cell_rows = np.cumsum(is_cell) - 1
+                gids = np.array([cell.gid for cell in cells],
+                                dtype=int)[is_cell]
+            else:
+                n_cell_rows = len(spec['cell_types'])
+                cell_rows = np.array([spec['cell_types'].index(celltype)
+                                      if celltype in spec['cell_types']
+                                      else -1 for celltype in celltypes],
+                                     dtype=int)
+                gids = None
+            is_term = is_cell[term_cells]
+            if spec['sections'] is not None:
+                is_term &= np.isin(term_sections, spec['sections'])
+            idxs = np.flatnonzero(is_term)
+            term_idxs.append(idxs)
+            term_rows.append(n_rows + cell_rows[term_cells[idxs]])
+            self._dipole_rows[rec_name] = (spec['by'], n_rows,
+                                           n_rows + n_cell_rows, gids)
+            n_rows += n_cell_rows
+        self._n_dipole_rows = n_rows
+        if len(refs) == 0:
+            return
+
+        self._dipole_ptrvec = h.PtrVector(len(refs))
+        for idx, ref in enumerate(refs):
+            self._dipole_ptrvec.pset(idx, ref)
+        self._dipole_vec = h.Vector(len(refs))
+        self._dipole_weights = np.array(weights)
+        self._dipole_term_idxs = np.concatenate(term_idxs)
+        self._dipole_term_rows = np.concatenate(term_rows)
+
+    def _init_step_recordings(self):
+        """Allocate the potentials and dipoles of a trial.
+
+        Must be called after h.fcurrent(), which it records as the first
+        sample. NEURON calls _record_step after each of the following
+        integration steps.
+        """
+        n_times = self.net._n_times_sim
+        self._lfp_data = np.zeros((len(self._transfer), n_times))
+        self._dipole_data = np.zeros((self._n_dipole_rows, n_times))
+        self._step_idx = 0
+        if getattr(self, '_step_callback', None) is not None:
+            self._record_step()
+        # the membrane currents are recorded by finitialize before
+        # fcurrent, which would add the initial transient to their first
+        # sample
+        for vec, ref in self._imem_records:
+            vec.x[0] = ref[0]
+
+    def _record_step(self):
+        """Record the potentials and dipoles at the current step."""
+        # with psolve, h.t is not updated when this is called
+        idx = self._step_idx
+        if idx < self.net._n_times_sim:
+            if self._imem_ptrvec is not None:
+                self._imem_ptrvec.gather(self._imem_vec)
+                self._lfp_data[:, idx] = \
+                    self._transfer @ _vec_as_numpy(self._imem_vec)
+            if self._dipole_ptrvec is not None:
+                # this is called before the AFTER SOLVE blocks of the
+                # dipole mechanisms, so the terms are computed from the
+                # voltages as in dipole.mod
+                self._dipole_ptrvec.gather(self._dipole_vec)
+                v = _vec_as_numpy(self._dipole_vec)
+                terms = (v[0::2] - v[1::2]) * self._dipole_weights
+                self._dipole_data[:, idx] = np.bincount(
+                    self._dipole_term_rows, terms[self._dipole_term_idxs],
+                    minlength=self._n_dipole_rows)
+        self._step_idx += 1
+
+    def _gather_recordings(self, chunk_size=256):
+        """Decimate the per-cell recordings and combine them on rank 0.
+
+        Returns
+        -------
+        recordings : dict of array | None
+            The arrays of shape (n_cells, n_times) for each recording,
+            with rows ordered by cell ID. None on ranks other than 0.
+        """
+        from .dipole import _lowpass_decimate
+
+        if len(self.net.recording_gids) == 0:
+            return dict()
+
+        decim = self.net._decim
+        n_times = self.net.n_times
+        local = dict()
+        for name, (gids, vecs) in self._cell_recordings.items():
+            data = np.empty((len(gids), n_times))
+            # stack chunks of cells to filter and decimate them at once
+            for start in range(0, len(vecs), chunk_size):
+                chunk = vecs[start:start + chunk_size]
+                x = np.empty((len(chunk), self.net._n_times_sim))
+                for row, cell_vecs in enumerate(chunk):
+                    x[row] = _vec_as_numpy(cell_vecs[0])
+                    for vec in cell_vecs[1:]:
+                        x[row] += _vec_as_numpy(vec)
+                data[start:start + len(chunk)] = _lowpass_decimate(x, decim)
+            local[name] = (gids, data)
+        for name, (by, start, stop, gids) in self._dipole_rows.items():
+            if by != 'cell':
+                continue
+            data = np.empty((len(gids), n_times))
+            for row in range(0, len(gids), chunk_size):
+                x = self._dipole_data[start + row:
+                                      min(start + row + chunk_size, stop)]
+                data[row:row + len(x)] = _lowpass_decimate(x, decim)
+            local[name] = (gids, data)
+
+        if _get_nhosts() > 1:
+            local_list = _PC.py_gather(local, 0)
+        else:
+            local_list = [local]
+        if _get_rank() != 0:
+            return None
+
+        all_gids = self.net.recording_gids
+        shapes = {name: (len(all_gids[name]), n_times) for name in all_gids}
+        recordings = _allocate_recordings(shapes, self.net.record_max_bytes,
+                                          self.net.record_mmap_dir)
+        for name in all_gids:
+            for local in local_list:
+                gids, data = local[name]
+                rows = np.searchsorted(all_gids[name], gids)
+                recordings[name][rows] = data
+        return recordings
+
     # aggregate recording all the somatic voltages for pyr
     def aggregate_currents(self):
         """This method must be run post-integration."""
+        # Create a h.Vector() with size 1xself.N_t, zero'd, at the
+        # resolution of the integration time step
+        self.current = {
+            'L5Pyr_soma': h.Vector(self.net._n_times_sim, 0),
+            'L2Pyr_soma': h.Vector(self.net._n_times_sim, 0),
+        }
         # this is quite ugly
         for cell in self.cells:
             # check for celltype
@@ -505,8 +1405,7 @@ class NeuronNetwork(object):
 
     def move_cells_to_pos(self):
         """Move cells 3d positions to positions used for wiring."""
-        for cell in self.cells:
-            cell.move_to_pos()
+        _move_cells_to_pos(self.cells)
 
     def _clear_neuron_objects(self):
         """Clear up NEURON internal gid information.
@@ -521,6 +1420,10 @@ class NeuronNetwork(object):
 
         _PC.gid_clear()
 
+        if getattr(self, '_step_callback', None) is not None:
+            _CVODE.extra_scatter_gather_remove(self._step_callback)
+            self._step_callback = None
+
         # dereference cell and NetConn objects
         for gid, cell in zip(self.net._gid_list, self.cells):
             # only work on cells on this node
@@ -542,12 +1445,19 @@ class NeuronNetwork(object):
         self.cells = []
 
     def get_data_from_neuron(self):
-        """Get copies of spike data that are pickleable"""
+        """Get spike data, per-cell recordings, timings and electrode
+        potentials that are pickleable
 
-        from copy import deepcopy
-        data = (self._all_spiketimes.to_python(),
-                self._all_spikegids.to_python(),
-                deepcopy(self.net.gid_dict))
+        The spike times and gids are returned as typed numpy arrays, which
+        pickle as compact binary buffers. The values of gid_dict are
+        immutable range objects, so a shallow copy suffices.
+        """
+        data = (self._all_spiketimes,
+                self._all_spikegids,
+                dict(self.net.gid_dict),
+                _pack_recordings(self._recordings),
+                self._timings,
+                self._lfp)
         return data
 
     def _clear_last_network_objects(self):
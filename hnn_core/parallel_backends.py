@@ -9,27 +9,176 @@ import multiprocessing
 import shlex
 import pickle
 import codecs
+import tempfile
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from warnings import warn
-from subprocess import Popen, PIPE
+from subprocess import Popen, PIPE, run, STDOUT, SubprocessError
+
+import numpy as np
 
 _BACKEND = None
 
 
+def _get_n_cores():
+    """The number of cores this process is allowed to run on."""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return multiprocessing.cpu_count()
+
+
+def _get_available_memory():
+    """The available physical memory in bytes, or None if unknown."""
+    try:
+        import psutil
+    except ImportError:
+        try:
+            return (os.sysconf('SC_AVPHYS_PAGES') *
+                    os.sysconf('SC_PAGE_SIZE'))
+        except (AttributeError, ValueError, OSError):
+            return None
+    return psutil.virtual_memory().available
+
+
+def _has_mpi(mpi_cmd='mpiexec'):
+    """Whether simulations can be run with MPIBackend."""
+    try:
+        import mpi4py
+        mpi4py.__version__  # for flake8 test
+    except ImportError:
+        return False
+    return (shutil.which(mpi_cmd) is not None and
+            shutil.which('nrniv') is not None)
+
+
+@lru_cache(maxsize=None)
+def _is_openmpi(mpi_cmd='mpiexec'):
+    """Whether the mpi launcher is that of Open MPI."""
+    try:
+        proc = run([mpi_cmd, '--version'], stdout=PIPE, stderr=STDOUT,
+                   universal_newlines=True, timeout=10)
+    except (OSError, SubprocessError):
+        return False
+    version = proc.stdout.lower()
+    return 'open mpi' in version or 'openrte' in version
+
+
+# The memory (in bytes) that a process needs to simulate one trial: a fixed
+# cost for Python, NEURON and the mechanisms plus the cost of each segment,
+# connection and value recorded at each time step. The costs were fitted to
+# the peak resident memory of single trials with 24 to 532 cells, with and
+# without recording the voltage of all cells, and are within 5% of it.
+_MEMORY_COSTS = dict(base=85e6, segments=1.6e3, netcons=460.,
+                     recorded=14., transfer=8.)
+
+
+def _estimate_trial_memory(net):
+    """Estimate the memory (in bytes) to simulate one trial of a network."""
+    counts = net._count_elements()
+    return int(_MEMORY_COSTS['base'] +
+               sum(cost * counts[key] for key, cost in _MEMORY_COSTS.items()
+                   if key != 'base'))
+
+
+def _parse_memory(max_memory):
+    """The memory budget in bytes, given as a number or e.g. '4G'."""
+    if max_memory is None:
+        return _get_available_memory()
+    if isinstance(max_memory, str):
+        units = dict(K=1e3, M=1e6, G=1e9, T=1e12)
+        unit = max_memory[-1].upper()
+        if unit not in units:
+            raise ValueError('max_memory must be a number of bytes or end '
+                             'with one of %s. Got %s'
+                             % (list(units), max_memory))
+        return int(float(max_memory[:-1]) * units[unit])
+    return int(max_memory)
+
+
+def _limit_concurrency(n_jobs, trial_memory, max_memory):
+    """The number of trials that can be simulated at once in max_memory."""
+    if max_memory is None:
+        return n_jobs
+    n_fit = int(max_memory // trial_memory)
+    if n_fit < 1:
+        warn('Simulating one trial needs about %0.2f GB, more than the '
+             'memory budget of %0.2f GB' % (trial_memory / 1e9,
+                                            max_memory / 1e9))
+    return max(min(n_jobs, n_fit), 1)
+
+
+def _choose_parallelism(n_trials, n_cells, n_cores, trial_memory=0,
+                        max_memory=None, has_mpi=True, min_cells_per_proc=64):
+    """Choose how to split the trials and cells of a network over cores.
+
+    Parameters
+    ----------
+    n_trials : int
+        The number of trials.
+    n_cells : int
+        The number of cells in the network.
+    n_cores : int
+        The number of cores to use at most.
+    trial_memory : int
+        The memory (in bytes) to simulate one trial.
+    max_memory : int | None
+        The memory budget in bytes. If None, the memory is not limiting.
+    has_mpi : bool
+        Whether the cells of a trial can be split over MPI processes.
+    min_cells_per_proc : int
+        The fewest cells an MPI process should simulate. Below this, the
+        communication between processes outweighs the gain.
+
+    Returns
+    -------
+    decision : dict
+        The mode ('serial', 'trial', 'cell' or 'hybrid'), the number of
+        trials simulated at the same time ('n_jobs') and the number of MPI
+        processes per trial ('n_procs', 1 without MPI).
+    """
+    # simulations that fit in memory at the same time
+    n_jobs = _limit_concurrency(max(min(n_trials, n_cores), 1),
+                                trial_memory, max_memory)
+
+    # splitting the cells only pays off with enough cells per process
+    max_procs = max(n_cells // min_cells_per_proc, 1)
+    n_procs = min(n_cores // n_jobs, max_procs) if has_mpi else 1
+
+    if n_procs < 2:
+        mode = 'serial' if n_jobs == 1 else 'trial'
+        n_procs = 1
+    else:
+        if max_memory is not None:
+            # each MPI process holds its own Python and NEURON
+            group_memory = trial_memory + (n_procs - 1) * _MEMORY_COSTS['base']
+            n_jobs = max(min(n_jobs, int(max_memory // group_memory)), 1)
+        mode = 'cell' if n_jobs == 1 else 'hybrid'
+    return dict(mode=mode, n_jobs=n_jobs, n_procs=n_procs)
+
+
 def _gather_trial_data(sim_data, net, n_trials):
     """Arrange data by trial
 
     To be called after simulate(). Returns list of Dipoles, one for each trial,
-    and saves spiking info in net (instance of Network).
+    and saves spiking info, per-cell recordings and extracellular potentials
+    in net (instance of Network).
     """
+    from .network import _unpack_recordings
+
     dpls = []
 
     for idx in range(n_trials):
         dpls.append(sim_data[idx][0])
         spikedata = sim_data[idx][1]
-        net.spikes._times.append(spikedata[0])
-        net.spikes._gids.append(spikedata[1])
+        # Spikes stores lists, convert from the typed arrays in bulk
+        net.spikes._times.append(np.asarray(spikedata[0]).tolist())
+        net.spikes._gids.append(np.asarray(spikedata[1]).tolist())
         net.gid_dict = spikedata[2]  # only have one gid_dict
         net.spikes.update_types(net.gid_dict)
+        net.recordings.append(_unpack_recordings(spikedata[3]))
+        net.timings.append(spikedata[4])
+        net.lfp.append(spikedata[5])
 
     return dpls
 
@@ -42,28 +191,40 @@ class JoblibBackend(object):
     n_jobs : int | None
         The number of jobs to start in parallel. If None, then 1 trial will be
         started without parallelism
+    max_memory : int | str | None
+        The memory budget of the simulation, in bytes or as a string such as
+        '4G' or '500M'. Fewer jobs are started if the trials would not fit
+        in it. If None, the memory available when the simulation starts.
 
     Attributes
     ----------
     n_jobs : int
         The number of jobs to start in parallel
+    max_memory : int | str | None
+        The memory budget of the simulation.
+
+    Notes
+    -----
+    The memory of a trial is estimated from the number of segments,
+    connections and recorded values of the network.
     """
-    def __init__(self, n_jobs=1):
+    def __init__(self, n_jobs=1, max_memory=None):
         self.n_jobs = n_jobs
+        self.max_memory = max_memory
         print("joblib will run over %d jobs" % (self.n_jobs))
 
-    def _parallel_func(self, func):
-        if self.n_jobs != 1:
+    def _parallel_func(self, func, n_jobs):
+        if n_jobs != 1:
             try:
                 from joblib import Parallel, delayed
             except ImportError:
                 warn('joblib not installed. Cannot run in parallel.')
-                self.n_jobs = 1
-        if self.n_jobs == 1:
+                self.n_jobs = n_jobs = 1
+        if n_jobs == 1:
             my_func = func
             parallel = list
         else:
-            parallel = Parallel(self.n_jobs)
+            parallel = Parallel(n_jobs)
             my_func = delayed(func)
 
         return parallel, my_func
@@ -85,9 +246,7 @@ class JoblibBackend(object):
         # avoid relative lookups after being forked by joblib
         from hnn_core.neuron import NeuronNetwork, _simulate_single_trial
 
-        if trial_idx != 0:
-            net.params['prng_*'] = trial_idx
-
+        net._set_trial(trial_idx)
         neuron_net = NeuronNetwork(net)
         dpl = _simulate_single_trial(neuron_net)
 
@@ -113,7 +272,23 @@ class JoblibBackend(object):
         n_trials = net.params['N_trials']
         dpls = []
 
-        parallel, myfunc = self._parallel_func(self._clone_and_simulate)
+        n_jobs = 1 if self.n_jobs is None else self.n_jobs
+        if n_jobs < 0:  # as in joblib, -1 uses all cores
+            n_jobs = max(_get_n_cores() + 1 + n_jobs, 1)
+        n_jobs = min(n_jobs, n_trials)
+        if n_jobs > 1:
+            trial_memory = _estimate_trial_memory(net)
+            max_memory = _parse_memory(self.max_memory)
+            n_fit = _limit_concurrency(n_jobs, trial_memory, max_memory)
+            if n_fit < n_jobs:
+                print("Running %d jobs instead of %d to fit in %0.2f GB of "
+                      "memory (%0.2f GB per trial)"
+                      % (n_fit, n_jobs, max_memory / 1e9,
+                         trial_memory / 1e9))
+                n_jobs = n_fit
+
+        parallel, myfunc = self._parallel_func(self._clone_and_simulate,
+                                               n_jobs)
         sim_data = parallel(myfunc(net, idx) for idx in range(n_trials))
 
         dpls = _gather_trial_data(sim_data, net, n_trials)
@@ -141,6 +316,8 @@ class MPIBackend(object):
         can be less than the user specified value if limited by the cores on
         the system, the number of cores allowed by the job scheduler, or
         if mpi4py could not be loaded.
+    mpi_cmd : str
+        The name of the mpi launcher executable.
     mpi_cmd_str : str
         The string of the mpi command with number of procs and options
 
@@ -150,11 +327,10 @@ class MPIBackend(object):
         n_logical_cores = multiprocessing.cpu_count()
 
         # obey limits set by scheduler
-        if hasattr(os, 'sched_getaffinity'):
-            scheduler_cores = len(os.sched_getaffinity(0))
-            self.n_procs = min(self.n_procs, scheduler_cores)
-        elif n_procs is None:
-            self.n_procs = n_logical_cores
+        if self.n_procs is None:
+            self.n_procs = _get_n_cores()
+        else:
+            self.n_procs = min(self.n_procs, _get_n_cores())
 
         # did user try to force running on more cores than available?
         oversubscribe = False
@@ -185,7 +361,10 @@ class MPIBackend(object):
             warn('mpi4py not installed. will run on single processor')
             self.n_procs = 1
 
+        self.mpi_cmd = mpi_cmd
         self.mpi_cmd_str = mpi_cmd
+        # the options of the mpi launcher, before the number of processes
+        self._mpi_options = list()
 
         if self.n_procs == 1:
             print("Backend will use 1 core. Running simulation without MPI")
@@ -194,17 +373,21 @@ class MPIBackend(object):
             print("MPI will run over %d processes" % (self.n_procs))
 
         if hyperthreading:
-            self.mpi_cmd_str += ' --use-hwthread-cpus'
+            self._mpi_options.append('--use-hwthread-cpus')
 
         if oversubscribe:
-            self.mpi_cmd_str += ' --oversubscribe'
+            self._mpi_options.append('--oversubscribe')
 
-        self.mpi_cmd_str += ' -np ' + str(self.n_procs)
+        self._set_mpi_cmd_str()
 
-        self.mpi_cmd_str += ' nrniv -python -mpi -nobanner ' + \
-            sys.executable + ' ' + \
-            os.path.join(os.path.dirname(sys.modules[__name__].__file__),
-                         'mpi_child.py')
+    def _set_mpi_cmd_str(self):
+        """Build the mpi command from the launcher and its options."""
+        mpi_child = os.path.join(
+            os.path.dirname(sys.modules[__name__].__file__), 'mpi_child.py')
+        self.mpi_cmd_str = ' '.join(
+            [self.mpi_cmd] + self._mpi_options +
+            ['-np', str(self.n_procs), 'nrniv', '-python', '-mpi',
+             '-nobanner', sys.executable, mpi_child])
 
     def __enter__(self):
         global _BACKEND
@@ -240,8 +423,28 @@ class MPIBackend(object):
 
         n_trials = net.params['N_trials']
         print("Running %d trials..." % (n_trials))
-        dpls = []
 
+        proc = self._start_simulation(net, list(range(n_trials)))
+        sim_data = self._collect_simulation(proc)
+
+        dpls = _gather_trial_data(sim_data, net, n_trials)
+        return dpls
+
+    def _start_simulation(self, net, trial_idxs):
+        """Launch the MPI processes that simulate a subset of the trials.
+
+        Parameters
+        ----------
+        net : Network object
+            The network to simulate.
+        trial_idxs : list of int
+            The indices of the trials to simulate.
+
+        Returns
+        -------
+        proc : instance of subprocess.Popen
+            The process of the MPI launcher.
+        """
         # Split the command into shell arguments for passing to Popen
         if 'win' in sys.platform:
             use_posix = True
@@ -249,18 +452,26 @@ class MPIBackend(object):
             use_posix = False
         cmdargs = shlex.split(self.mpi_cmd_str, posix=use_posix)
 
-        pickled_params = codecs.encode(pickle.dumps(net.params),
-                                       "base64").decode()
+        pickled_net = codecs.encode(pickle.dumps((net, trial_idxs)),
+                                    "base64").decode()
 
         # set some MPI environment variables
         my_env = os.environ.copy()
         my_env["OMPI_MCA_btl_base_warn_component_unused"] = '0'
-        # Start the simulation in parallel!
-        proc = Popen(cmdargs, stdin=PIPE, stdout=PIPE, stderr=PIPE, env=my_env,
-                     cwd=os.getcwd(), universal_newlines=True)
+        # Start the simulation in parallel! The input is passed through a
+        # file so that several simulations can run at the same time
+        with tempfile.TemporaryFile(mode='w+') as fid:
+            fid.write(pickled_net)
+            fid.seek(0)
+            proc = Popen(cmdargs, stdin=fid, stdout=PIPE, stderr=PIPE,
+                         env=my_env, cwd=os.getcwd(), universal_newlines=True)
+        return proc
+
+    def _collect_simulation(self, proc):
+        """Wait for the MPI processes and return the data of their trials."""
 
         # wait until process completes
-        out, err = proc.communicate(pickled_params)
+        out, err = proc.communicate()
 
         # print all messages (including error messages)
         print(out)
@@ -289,7 +500,133 @@ class MPIBackend(object):
         data_pickled = codecs.decode(data_bytes, "base64")
 
         # unpickle the data
-        sim_data = pickle.loads(data_pickled)
+        return pickle.loads(data_pickled)
 
-        dpls = _gather_trial_data(sim_data, net, n_trials)
-        return dpls
+    def _collect_simulations(self, procs):
+        """Wait for several launches at once and return their data.
+
+        The output of each launch is read as it is written, so that a
+        launch never waits for the others to drain its pipes. If one fails,
+        the others are terminated.
+        """
+        with ThreadPoolExecutor(max_workers=max(len(procs), 1)) as executor:
+            futures = [executor.submit(self._collect_simulation, proc)
+                       for proc in procs]
+            try:
+                return [future.result() for future in futures]
+            except Exception:
+                for proc in procs:
+                    if proc.poll() is None:
+                        proc.kill()
+                raise
+
+
+class AutoBackend(object):
+    """The AutoBackend class.
+
+    Chooses how to parallelize each simulation from the number of trials,
+    the size of the network, the cores this process may run on, the
+    available memory and whether MPI is available:
+
+    - 'serial': one trial at a time on one core.
+    - 'trial': trials in parallel with :class:`JoblibBackend`.
+    - 'cell': the cells of each trial split over the processes of
+      :class:`MPIBackend`.
+    - 'hybrid': groups of trials simulated at the same time, each group with
+      its own MPI processes.
+
+    Parameters
+    ----------
+    n_procs : int | None
+        The largest number of cores to use. If None, all the cores this
+        process may run on are used.
+    mpi_cmd : str
+        The name of the mpi launcher executable. Will use 'mpiexec'
+        (openmpi) by default.
+    min_cells_per_proc : int
+        The fewest cells an MPI process should simulate.
+    max_memory : int | str | None
+        The memory budget of the simulation, in bytes or as a string such as
+        '4G' or '500M'. If None, the memory available when the simulation
+        starts.
+
+    Attributes
+    ----------
+    decision : dict | None
+        The mode, number of concurrent trials ('n_jobs') and MPI processes
+        per trial ('n_procs') of the last simulation.
+    """
+    def __init__(self, n_procs=None, mpi_cmd='mpiexec', min_cells_per_proc=64,
+                 max_memory=None):
+        n_cores = _get_n_cores()
+        if n_procs is not None:
+            n_cores = min(n_procs, n_cores)
+        self.n_cores = n_cores
+        self.mpi_cmd = mpi_cmd
+        self.min_cells_per_proc = min_cells_per_proc
+        self.max_memory = max_memory
+        self.decision = None
+
+    def __enter__(self):
+        global _BACKEND
+
+        self._old_backend = _BACKEND
+        _BACKEND = self
+
+        return self
+
+    def __exit__(self, type, value, traceback):
+        global _BACKEND
+
+        _BACKEND = self._old_backend
+
+    def simulate(self, net):
+        """Simulate the HNN model with the parallelism chosen for it
+
+        Parameters
+        ----------
+        net : Network object
+            The Network object specifying how cells are
+            connected.
+
+        Returns
+        -------
+        dpl: list of Dipole
+            The Dipole results from each simulation trial
+        """
+        n_trials = net.params['N_trials']
+        decision = _choose_parallelism(
+            n_trials, net.n_cells, self.n_cores,
+            trial_memory=_estimate_trial_memory(net),
+            max_memory=_parse_memory(self.max_memory),
+            has_mpi=self.n_cores > 1 and _has_mpi(self.mpi_cmd),
+            min_cells_per_proc=self.min_cells_per_proc)
+        self.decision = decision
+        print("AutoBackend: %d trials of %d cells on %d cores, running in "
+              "'%s' mode with %d concurrent trials of %d processes"
+              % (n_trials, net.n_cells, self.n_cores, decision['mode'],
+                 decision['n_jobs'], decision['n_procs']))
+
+        if decision['mode'] in ('serial', 'trial'):
+            return JoblibBackend(n_jobs=decision['n_jobs'],
+                                 max_memory=self.max_memory).simulate(net)
+
+        backend = MPIBackend(n_procs=decision['n_procs'],
+                             mpi_cmd=self.mpi_cmd)
+        if decision['mode'] == 'cell':
+            return backend.simulate(net)
+
+        # the launches must not pin their processes to the same cores,
+        # which Open MPI does by default
+        if _is_openmpi(self.mpi_cmd):
+            backend._mpi_options += ['--bind-to', 'none']
+            backend._set_mpi_cmd_str()
+        n_jobs = decision['n_jobs']
+        trial_idxs = list(range(n_trials))
+        procs = [backend._start_simulation(net, trial_idxs[job::n_jobs])
+                 for job in range(n_jobs)]
+        sim_data = [None] * n_trials
+        for job, job_data in enumerate(backend._collect_simulations(procs)):
+            sim_data[job::n_jobs] = job_data
+
+        return _gather_trial_data(sim_data, net, n_trials)
@@ -5,12 +5,83 @@
 
 import json
 import fnmatch
+import hashlib
+import numbers
 import os.path as op
 from copy import deepcopy
+from functools import lru_cache
 
 from .params_default import get_params_default
 
 
+# values of these types are shared rather than copied between Params
+_IMMUTABLE_TYPES = (int, float, complex, str, bytes, type(None))
+
+
+@lru_cache(maxsize=16)
+def _get_params_default(nprox, ndist):
+    """The default parameters, computed once for each number of inputs.
+
+    The returned dict is shared and must not be modified.
+    """
+    return get_params_default(nprox, ndist)
+
+
+def _has_wildcard(key):
+    """Whether a key is a shell-style wildcard pattern."""
+    return isinstance(key, str) and any(char in key for char in '*?[')
+
+
+# The impact of a change of each parameter on a simulation, from the
+# largest to the smallest. The category of a parameter is that of the first
+# pattern it matches and parameters that match none change the topology.
+_PARAM_CATEGORIES = [
+    ('seeds', ['prng_*']),
+    ('trials', ['N_trials']),
+    ('postproc', ['dipole_scalefctr', 'dipole_smooth_win', 'save_*',
+                  'sim_prefix', 'f_max_spec']),
+    ('topology', ['N_pyr_x', 'N_pyr_y']),
+    ('weights', ['gbar_*', '*_A_weight*']),
+    ('feeds', ['t_ev*', 'sigma_t_ev*', 'numspikes_*', 'dt_ev*', 'sync_evinput',
+               'inc_evinput', 'input_*', '*_input_*', 't0_*', 'T_pois',
+               '*_Gauss_mu', '*_Gauss_sigma', '*_Pois_lamtha',
+               'distribution_*', 'events_per_cycle_*', 'f_input_*',
+               'f_stdev_*', 'repeats_*']),
+    ('biophysics', ['L2Pyr_*', 'L5Pyr_*', 'L2Basket_*', 'L5Basket_*',
+                    'celsius', 'dt', 'tstop', 'threshold']),
+]
+_IMPACT_ORDER = ['topology', 'biophysics', 'weights', 'feeds', 'seeds',
+                 'trials', 'postproc']
+
+
+@lru_cache(maxsize=None)
+def _get_param_category(key):
+    """The category of the impact of a parameter on a simulation."""
+    for category, patterns in _PARAM_CATEGORIES:
+        if any(fnmatch.fnmatchcase(key, pattern) for pattern in patterns):
+            return category
+    return 'topology'
+
+
+def _canonicalize(value):
+    """Convert a value to a canonical JSON-serializable form.
+
+    Numbers (including booleans) become floats, sequences become lists
+    and mappings become dicts, so that equal values have the same form.
+    """
+    if isinstance(value, str):
+        return value
+    elif isinstance(value, numbers.Real):
+        return float(value)
+    elif isinstance(value, dict):
+        return {str(key): _canonicalize(val) for key, val in value.items()}
+    elif hasattr(value, 'tolist'):  # numpy arrays
+        return _canonicalize(value.tolist())
+    elif isinstance(value, (list, tuple)):
+        return [_canonicalize(val) for val in value]
+    return value
+
+
 # return number of evoked inputs (proximal, distal)
 # using dictionary d (or if d is a string, first load the dictionary from
 # filename d)
@@ -113,8 +184,19 @@ class Params(dict):
     ----------
     params_input : dict | None
         Dictionary of parameters. If None, use default parameters.
+
+    Notes
+    -----
+    Keys can be shell-style wildcard patterns, e.g., ``params['L2Pyr*']``
+    returns a new Params with the matching parameters and
+    ``params['prng_*'] = 0`` sets all of them. The keys matching each
+    pattern are cached until keys are added or removed. Copies share the
+    values of immutable types, such as numbers and strings.
     """
 
+    # the keys matching each wildcard pattern, reset when the keys change
+    _matches = None
+
     def __init__(self, params_input=None):
 
         if params_input is None:
@@ -123,13 +205,10 @@ class Params(dict):
         if isinstance(params_input, dict):
             nprox, ndist = _count_evoked_inputs(params_input)
             # create default params templated from params_input
-            params_default = get_params_default(nprox, ndist)
-
-            for key in params_default.keys():
-                if key in params_input:
-                    self[key] = params_input[key]
-                else:
-                    self[key] = params_default[key]
+            params_default = _get_params_default(nprox, ndist)
+            dict.update(self, params_default)
+            dict.update(self, ((key, params_input[key]) for key in
+                               params_input if key in params_default))
         else:
             raise ValueError('params_input must be dict or None. Got %s'
                              % type(params_input))
@@ -138,36 +217,136 @@ class Params(dict):
         """Display the params nicely."""
         return json.dumps(self, sort_keys=True, indent=4)
 
+    def _get_matches(self, pattern):
+        """The keys matching a wildcard pattern."""
+        if self._matches is None:
+            self._matches = dict()
+        if pattern not in self._matches:
+            self._matches[pattern] = tuple(fnmatch.filter(self.keys(),
+                                                          pattern))
+        return self._matches[pattern]
+
+    def _from_items(self, items):
+        """Create Params from (key, value) pairs without the defaults."""
+        params = dict.__new__(type(self))
+        dict.update(params, ((key, value if isinstance(
+            value, _IMMUTABLE_TYPES) else deepcopy(value))
+            for key, value in items))
+        return params
+
     def __getitem__(self, key):
         """Return a subset of parameters."""
-        keys = self.keys()
-        if key in keys:
+        try:
             return dict.__getitem__(self, key)
-        else:
-            matches = fnmatch.filter(keys, key)
+        except KeyError:
+            matches = self._get_matches(key) if _has_wildcard(key) else ()
             if len(matches) == 0:
-                return dict.__getitem__(self, key)
-            params = self.copy()
-            for key in keys:
-                if key not in matches:
-                    params.pop(key)
-            return params
+                raise
+        return self._from_items((match, dict.__getitem__(self, match))
+                                for match in matches)
 
     def __setitem__(self, key, value):
         """Set the value for a subset of parameters."""
-        keys = self.keys()
-        if key in keys:
-            return dict.__setitem__(self, key, value)
-        else:
-            matches = fnmatch.filter(keys, key)
-            if len(matches) == 0:
-                return dict.__setitem__(self, key, value)
-            for key in keys:
-                if key in matches:
-                    self.update({key: value})
+        if key not in self and _has_wildcard(key):
+            matches = self._get_matches(key)
+            if len(matches) > 0:
+                for match in matches:
+                    dict.__setitem__(self, match, value)
+                return
+        if key not in self:
+            self._matches = None
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        self._matches = None
+
+    def pop(self, *args):
+        self._matches = None
+        return dict.pop(self, *args)
+
+    def popitem(self):
+        self._matches = None
+        return dict.popitem(self)
+
+    def clear(self):
+        self._matches = None
+        dict.clear(self)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self._matches = None
+        return dict.setdefault(self, key, default)
+
+    def update(self, *args, **kwargs):
+        self._matches = None
+        dict.update(self, *args, **kwargs)
 
     def copy(self):
-        return deepcopy(self)
+        params = self._from_items(self.items())
+        if self._matches is not None:
+            params._matches = dict(self._matches)
+        return params
+
+    def fingerprint(self):
+        """Compute a hash of the parameter values.
+
+        The hash does not depend on the order of the keys, nor on whether
+        numbers are stored as int, float or bool or sequences as tuple or
+        list. It is stable across sessions and platforms.
+
+        Returns
+        -------
+        fingerprint : str
+            The SHA-256 hash of the canonical JSON representation of the
+            parameters, in hexadecimal.
+        """
+        canonical = json.dumps(_canonicalize(self), sort_keys=True,
+                               separators=(',', ':'))
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    def diff(self, other):
+        """Find the parameters that differ and classify their impact.
+
+        Values are compared as in Params.fingerprint, so 1 and 1.0 are
+        equal.
+
+        Parameters
+        ----------
+        other : dict
+            The parameters to compare to.
+
+        Returns
+        -------
+        changes : dict
+            The category of each parameter that differs or that only one of
+            the parameter sets has, sorted by decreasing impact:
+
+            'topology' : the number or layout of cells and feeds.
+            'biophysics' : the morphology and membrane properties of the
+            cells, the temperature, the integration time step and duration.
+            'weights' : the weights of the connections and feeds.
+            'feeds' : the timing of the events of the feeds.
+            'seeds' : the seeds of the random number generators.
+            'trials' : the number of trials. The network is unchanged but
+            the trials must be simulated again.
+            'postproc' : the processing of the simulated dipole and the
+            outputs. A network does not need to be rebuilt or simulated again
+            if only these parameters change.
+        """
+        missing = object()
+        changes = dict()
+        for key in set(self) | set(other):
+            value_self = dict.get(self, key, missing)
+            value_other = other.get(key, missing)
+            if value_self is value_other:
+                continue
+            if (value_self is missing or value_other is missing or
+                    _canonicalize(value_self) != _canonicalize(value_other)):
+                changes[key] = _get_param_category(key)
+        return {key: changes[key] for key in sorted(
+            changes, key=lambda key: (_IMPACT_ORDER.index(changes[key]),
+                                      key))}
 
     def write(self, fname):
         """Write param values to a file.
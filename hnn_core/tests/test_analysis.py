@@ -0,0 +1,208 @@
+import numpy as np
+from numpy.testing import assert_allclose, assert_array_equal
+import pytest
+
+from hnn_core import Spikes
+from hnn_core.dipole import Dipole
+from hnn_core.analysis import (tfr_morlet, psd_welch, _morlet_bank,
+                               _morlet_bank_fft, cross_correlograms,
+                               spike_time_tiling, synchrony_index, csd)
+
+
+def _make_dipoles(n_trials=3, n_times=2000, dt=0.5):
+    """Create dipoles with a 20 Hz oscillation plus noise."""
+    rng = np.random.RandomState(42)
+    times = np.arange(n_times) * dt
+    dpls = list()
+    for _ in range(n_trials):
+        data = rng.randn(n_times, 3)
+        data[:, 0] += 5 * np.sin(2 * np.pi * 20. * times / 1000.)
+        dpls.append(Dipole(times, data))
+    return dpls
+
+
+def _make_spikes(n_trials=3, n_spikes=100, n_gids=8, tstop=100.):
+    """Create random spikes."""
+    rng = np.random.RandomState(42)
+    times = [rng.uniform(0, tstop, n_spikes).tolist()
+             for _ in range(n_trials)]
+    gids = [rng.randint(0, n_gids, n_spikes).tolist()
+            for _ in range(n_trials)]
+    return Spikes(times=times, gids=gids,
+                  types=[list() for _ in range(n_trials)])
+
+
+def _bin_trains(spikes, gid, bin_width, n_bins):
+    """Bin the spikes of a cell in each trial."""
+    trains = np.zeros((len(spikes.times), n_bins))
+    for trial_idx, (times, gids) in enumerate(zip(spikes.times,
+                                                  spikes.gids)):
+        times = np.array(times)[np.array(gids) == gid]
+        np.add.at(trains[trial_idx], (times / bin_width).astype(int), 1)
+    return trains
+
+
+def test_tfr_morlet():
+    """Test batched Morlet time-frequency representation."""
+    dpls = _make_dipoles()
+    freqs = np.array([10., 20., 40.])
+    n_cycles = 5.
+    tfr = tfr_morlet(dpls, freqs, n_cycles=n_cycles)
+    assert tfr.shape == (3, 3, 3, 2000)
+    # 20 Hz power dominates the 'agg' layer
+    assert np.argmax(tfr[:, 0].mean(axis=(0, 2))) == 1
+
+    # compare against direct convolution, one trial at a time
+    sfreq = 2000.
+    wavelets = _morlet_bank(sfreq, tuple(freqs), (n_cycles,) * 3)
+    tfr_complex = tfr_morlet(dpls, freqs, n_cycles=n_cycles,
+                             layers=['L2'], output='complex')
+    for trial_idx, dpl in enumerate(dpls):
+        for freq_idx, wavelet in enumerate(wavelets):
+            coefs = np.convolve(dpl.data['L2'], wavelet, 'same')
+            assert_allclose(tfr_complex[trial_idx, 0, freq_idx], coefs,
+                            atol=1e-10)
+
+    # the wavelet banks are cached
+    _morlet_bank_fft.cache_clear()
+    tfr_morlet(dpls, freqs, n_cycles=n_cycles)
+    tfr_morlet(dpls[:1], freqs, n_cycles=n_cycles)
+    assert _morlet_bank_fft.cache_info().hits == 1
+
+    with pytest.raises(ValueError, match='output must be one of'):
+        tfr_morlet(dpls, freqs, output='phase')
+    with pytest.raises(ValueError, match='longer than the signal'):
+        tfr_morlet(dpls, [1.], n_cycles=7.)
+    with pytest.raises(ValueError, match='layer must be one of'):
+        tfr_morlet(dpls, freqs, layers=['L4'])
+
+
+def test_psd_welch():
+    """Test batched Welch power spectral density."""
+    signal = pytest.importorskip('scipy.signal')
+
+    dpls = _make_dipoles()
+    psds, freqs = psd_welch(dpls, n_fft=256, n_overlap=128)
+    assert psds.shape == (3, 3, len(freqs))
+    for trial_idx, dpl in enumerate(dpls):
+        for layer_idx, layer in enumerate(['agg', 'L2', 'L5']):
+            freqs_sp, psd_sp = signal.welch(dpl.data[layer], fs=2000.,
+                                            nperseg=256, noverlap=128)
+            assert_allclose(freqs, freqs_sp)
+            assert_allclose(psds[trial_idx, layer_idx], psd_sp)
+
+    psds, freqs = psd_welch(dpls[0], fmin=10., fmax=50., layers='agg')
+    assert psds.shape == (1, 1, len(freqs))
+    assert freqs[0] >= 10. and freqs[-1] <= 50.
+
+    with pytest.raises(ValueError, match='n_overlap must be'):
+        psd_welch(dpls, n_fft=256, n_overlap=256)
+
+
+def test_cross_correlograms(tmpdir):
+    """Test chunked cross-correlograms of spike trains."""
+    spikes = _make_spikes()
+    ccg, lags = cross_correlograms(spikes, range(5), range(3, 8), tmax=100.,
+                                   max_lag=5., chunk_size=2)
+    assert ccg.shape == (5, 5, 11)
+    assert ccg.dtype == np.float32
+    assert_allclose(lags, np.arange(-5., 6.))
+    for idx1, gid1 in enumerate(range(5)):
+        trains1 = _bin_trains(spikes, gid1, 1., 100)
+        for idx2, gid2 in enumerate(range(3, 8)):
+            trains2 = _bin_trains(spikes, gid2, 1., 100)
+            expected = sum(np.correlate(train2, train1, 'full')[94:105]
+                           for train1, train2 in zip(trains1, trains2))
+            assert_allclose(ccg[idx1, idx2], expected)
+
+    # the average excludes the pairs of a cell with itself
+    ccg_avg, _ = cross_correlograms(spikes, range(5), range(3, 8),
+                                    tmax=100., max_lag=5., average=True)
+    distinct = np.not_equal.outer(np.arange(5), np.arange(3, 8))
+    assert_allclose(ccg_avg, ccg[distinct].mean(axis=0))
+
+    # the correlograms of all pairs can be written to a memory-mapped array
+    out = np.memmap(str(tmpdir.join('ccg.dat')), dtype=np.float32,
+                    mode='w+', shape=ccg.shape)
+    ccg_out, _ = cross_correlograms(spikes, range(5), range(3, 8),
+                                    tmax=100., max_lag=5., chunk_size=3,
+                                    out=out)
+    assert ccg_out is out
+    assert_array_equal(out, ccg)
+    with pytest.raises(ValueError, match='out must be of shape'):
+        cross_correlograms(spikes, range(5), tmax=100., max_lag=5.,
+                           out=np.zeros((5, 5, 3)))
+    with pytest.raises(ValueError, match='out cannot be used with average'):
+        cross_correlograms(spikes, range(5), average=True, out=out)
+
+    with pytest.raises(ValueError, match='tmax must be larger'):
+        cross_correlograms(spikes, range(5), tmin=10., tmax=5.)
+    with pytest.raises(ValueError, match='chunk_size must be'):
+        cross_correlograms(spikes, range(5), chunk_size=0)
+
+
+def test_spike_time_tiling():
+    """Test spike time tiling coefficients."""
+    spikes = _make_spikes()
+    sttc = spike_time_tiling(spikes, range(8), tmax=100., dt=2.,
+                             bin_width=1., chunk_size=3)
+    assert sttc.shape == (8, 8)
+    assert_allclose(np.diag(sttc), 1.)
+    assert_allclose(sttc, sttc.T)
+
+    trains = [_bin_trains(spikes, gid, 1., 100) for gid in range(2)]
+    tiled = [np.array([np.convolve(train, np.ones(5), 'same') > 0
+                       for train in trains_gid]) for trains_gid in trains]
+    tilings = [tiled_gid.mean() for tiled_gid in tiled]
+    props = [np.sum(tiled[1] * trains[0]) / trains[0].sum(),
+             np.sum(tiled[0] * trains[1]) / trains[1].sum()]
+    expected = 0.5 * ((props[0] - tilings[1]) / (1 - props[0] * tilings[1]) +
+                      (props[1] - tilings[0]) / (1 - props[1] * tilings[0]))
+    assert_allclose(sttc[0, 1], expected)
+
+    # cells that did not spike
+    assert np.all(np.isnan(spike_time_tiling(spikes, [0], [42], tmax=100.)))
+
+
+def test_synchrony_index():
+    """Test population synchrony index of each cell type."""
+    spikes = _make_spikes()
+    gid_dict = {'a': range(0, 4), 'b': range(4, 8), 'c': range(8, 10)}
+    sync = synchrony_index(spikes, gid_dict, 0., 100., bin_width=5.)
+    assert sync.shape == (3, 3)
+    for type_idx, cell_type in enumerate(['a', 'b']):
+        counts = np.array([_bin_trains(spikes, gid, 5., 20)
+                           for gid in gid_dict[cell_type]])
+        expected = np.sqrt(counts.mean(axis=0).var(axis=-1) /
+                           counts.var(axis=-1).mean(axis=0))
+        assert_allclose(sync[:, type_idx], expected)
+    assert np.all(np.isnan(sync[:, 2]))
+
+    # fully synchronous cells
+    spikes = Spikes(times=[[10.] * 4 + [50.] * 4], gids=[list(range(4)) * 2],
+                    types=[list()])
+    assert_allclose(synchrony_index(spikes, gid_dict, 0., 100.,
+                                    cell_types=['a']), [[1.]])
+
+
+def test_csd():
+    """Test the current source density of a laminar array."""
+    spacing, sigma = 100., 0.3
+    depths = np.arange(6) * spacing
+    # a quadratic potential has a constant second derivative
+    lfp = np.repeat((2. * depths ** 2)[:, None], 10, axis=1)
+    lfp = np.stack((lfp, -lfp))
+    csd_inner = csd(lfp, spacing, sigma, vaknin=False)
+    assert csd_inner.shape == (2, 4, 10)
+    assert_allclose(csd_inner[0], -1e3 * sigma * 4.)
+    assert_allclose(csd_inner[1], 1e3 * sigma * 4.)
+    csd_all = csd(lfp, spacing, sigma)
+    assert csd_all.shape == (2, 6, 10)
+    assert_allclose(csd_all[:, 1:-1], csd_inner)
+
+    with pytest.raises(ValueError, match='Need at least 3 electrodes'):
+        csd(lfp[:, :2], spacing, vaknin=False)
+    with pytest.raises(ValueError, match='spacing must be positive'):
+        csd(lfp, 0.)
+    with pytest.raises(ValueError, match='at least 2 dimensions'):
+        csd(depths, spacing)
@@ -1,13 +1,19 @@
 import pytest
+from types import SimpleNamespace
 
 import matplotlib
+import numpy as np
+from numpy.testing import assert_allclose
 import os.path as op
 
 import hnn_core
 from hnn_core import read_params, Network
 from hnn_core.neuron import NeuronNetwork
-from hnn_core.cell import _ArtificialCell, _Cell
-from hnn_core.pyramidal import L5Pyr
+from hnn_core.cell import (_ArtificialCell, _Cell, _get_pt3d, _set_pt3d,
+                           _get_bboxes, _get_segment_coords,
+                           _move_cells_to_pos, _PT3D_BULK_MIN)
+from hnn_core.pyramidal import L2Pyr, L5Pyr
+from hnn_core.basket import L2Basket
 from hnn_core.params_default import get_L5Pyr_params_default
 
 matplotlib.use('agg')
@@ -64,3 +70,73 @@ def test_artificial_cell():
     # the h.Netcon() instance should reference the h.VecStim() instance
     assert artificial_cell.nrn_netcon.pre() == artificial_cell.nrn_vecstim
     assert artificial_cell.nrn_netcon.threshold == threshold
+
+
+def test_cell_geometry():
+    """Test bulk extraction and translation of 3D points."""
+    cells = [L5Pyr(gid=0, pos=(1., 2., 1307.4)),
+             L2Pyr(gid=1, pos=(3., 0., 0.)),
+             L2Basket(gid=2, pos=(0.5, 1., 0.))]
+    lengths = [[sect.L for sect in cell.get_sections()] for cell in cells]
+    sections, pts, sec_offsets, cell_offsets = _get_pt3d(cells)
+    assert len(sections) == cell_offsets[-1] == sec_offsets.size - 1
+    sect = sections[cell_offsets[1] + 1]
+    assert np.allclose(pts[sec_offsets[cell_offsets[1] + 1]],
+                       [sect.x3d(0), sect.y3d(0), sect.z3d(0), sect.diam3d(0)])
+
+    _move_cells_to_pos(cells)
+    for cell, cell_lengths in zip(cells, lengths):
+        # NEURON stores the 3D points in single precision
+        assert np.allclose(
+            (cell.soma.x3d(0), cell.soma.y3d(0), cell.soma.z3d(0)),
+            (cell.pos[0] * 100, cell.pos[2], cell.pos[1] * 100), atol=1e-3)
+        assert np.allclose([sect.L for sect in cell.get_sections()],
+                           cell_lengths)
+    _, moved, _, _ = _get_pt3d(cells)
+    n_pts = sec_offsets[cell_offsets[1]]
+    assert np.allclose(np.diff(moved[:n_pts], axis=0),
+                       np.diff(pts[:n_pts], axis=0), atol=1e-3)
+
+    bboxes = _get_bboxes(moved, sec_offsets, cell_offsets)
+    assert bboxes.shape == (3, 3, 2)
+    assert np.allclose(bboxes[0], cells[0].getbbox())
+    x, y, z, _ = cells[0].get3dinfo()
+    assert np.allclose(bboxes[0, 0], (x.min(), x.max()))
+    cells[0].translate3d(10., 0., -5.)
+    assert np.allclose(cells[0].getbbox(), bboxes[0] + [[10.], [0.], [-5.]],
+                       atol=1e-3)
+
+    # segments tile each section along its 3D points
+    starts, ends, seg_offsets = _get_segment_coords(cells)
+    n_segs = [sum(sect.nseg for sect in cell.get_sections())
+              for cell in cells]
+    assert np.array_equal(np.diff(seg_offsets), n_segs)
+    seg_lengths = np.linalg.norm(ends - starts, axis=1)
+    for cell, start, stop in zip(cells, seg_offsets[:-1], seg_offsets[1:]):
+        assert np.isclose(seg_lengths[start:stop].sum(),
+                          sum(sect.L for sect in cell.get_sections()))
+    soma = cells[0].soma
+    assert np.allclose(starts[0], (soma.x3d(0), soma.y3d(0), soma.z3d(0)))
+
+
+def test_set_pt3d():
+    """Test setting the 3D points of short and long sections."""
+    from neuron import h
+
+    n_pts = [2, _PT3D_BULK_MIN, 4 * _PT3D_BULK_MIN]
+    sections = [h.Section(name='sect%d' % idx) for idx in range(3)]
+    sec_offsets = np.concatenate([[0], np.cumsum(n_pts)])
+    rng = np.random.RandomState(0)
+    for sect, n in zip(sections, n_pts):
+        for x in range(n):
+            sect.pt3dadd(x, 0., 0., 1.)
+    pts = rng.uniform(1., 10., (sec_offsets[-1], 4))
+    _set_pt3d(sections, pts, sec_offsets)
+    _, pts_set, _, _ = _get_pt3d([SimpleNamespace(
+        get_sections=lambda: sections)])
+    assert_allclose(pts_set, pts, atol=1e-5)
+    for sect, start, stop in zip(sections, sec_offsets[:-1], sec_offsets[1:]):
+        assert sect.n3d() == stop - start
+        length = np.linalg.norm(np.diff(pts[start:stop, :3], axis=0),
+                                axis=1).sum()
+        assert_allclose(sect.L, length, rtol=1e-5)
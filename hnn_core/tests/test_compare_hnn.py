@@ -47,22 +47,19 @@ def run_hnn_core(backend=None, n_jobs=1):
     assert_array_equal(dpl_pr[:, 3], dpl_master[:, 3])  # L5
 
     # Test spike type counts
-    spiketype_counts = {}
-    for spikegid in net.spikes.gids[0]:
-        if net.gid_to_type(spikegid) not in spiketype_counts:
-            spiketype_counts[net.gid_to_type(spikegid)] = 0
-        else:
-            spiketype_counts[net.gid_to_type(spikegid)] += 1
+    counts = net.spikes.count(n_gids=net.n_src)[0]
+    spiketype_counts = {src_type: counts[gids].sum() for src_type, gids in
+                        net.gid_dict.items() if counts[gids].sum() > 0}
     assert 'common' not in spiketype_counts
     assert 'exgauss' not in spiketype_counts
     assert 'extpois' not in spiketype_counts
-    assert spiketype_counts == {'evprox1': 269,
-                                'L2_basket': 54,
-                                'L2_pyramidal': 113,
-                                'L5Pyr': 395,
-                                'L5_basket': 85,
-                                'evdist1': 234,
-                                'evprox2': 269}
+    assert spiketype_counts == {'evprox1': 270,
+                                'L2_basket': 55,
+                                'L2_pyramidal': 114,
+                                'L5Pyr': 396,
+                                'L5_basket': 86,
+                                'evdist1': 235,
+                                'evprox2': 270}
 
 
 def test_hnn_core():
@@ -6,8 +6,9 @@ from numpy.testing import assert_allclose
 import pytest
 
 import hnn_core
-from hnn_core import read_params, read_dipole, average_dipoles, viz
-from hnn_core.dipole import Dipole
+from hnn_core import (read_params, read_dipole, average_dipoles, viz,
+                      simulate_dipole, reprocess, Network)
+from hnn_core.dipole import Dipole, _lowpass_decimate
 
 matplotlib.use('agg')
 
@@ -43,3 +44,82 @@ def test_dipole():
     with pytest.raises(ValueError, match="Dipole at index 0 was already an "
                        "average of 2 trials"):
         dipole_avg = average_dipoles([dipole_avg, dipole_read])
+
+
+def test_lowpass_decimate():
+    """Test anti-aliased decimation of recorded signals."""
+    dt, decim = 0.025, 20
+    times = np.arange(0, 1000. + dt, dt)
+    slow = np.sin(2 * np.pi * 10. * times / 1000.)
+    # above the Nyquist frequency (1 kHz) of the decimated signal
+    fast = np.sin(2 * np.pi * 1500. * times / 1000.)
+    slow_decim = _lowpass_decimate(slow + fast + 3., decim)
+    assert slow_decim.shape == times[::decim].shape
+    # the fast component would alias to 500 Hz if it was not attenuated
+    assert_allclose(slow_decim[2:-2], slow[::decim][2:-2] + 3., atol=0.02)
+    # the baseline is preserved at the edges
+    assert_allclose(_lowpass_decimate(slow + 3., decim)[[0, -1]], 3.,
+                    atol=0.02)
+    assert _lowpass_decimate(slow, 1) is slow
+
+
+def test_dipole_record_dt():
+    """Test recording dipoles at a coarser sampling interval."""
+    hnn_core_root = op.dirname(hnn_core.__file__)
+    params_fname = op.join(hnn_core_root, 'param', 'default.json')
+    params = read_params(params_fname)
+    params.update({'N_pyr_x': 3, 'N_pyr_y': 3, 'tstop': 30.,
+                   't_evprox_1': 5, 't_evdist_1': 10, 't_evprox_2': 20,
+                   'dipole_smooth_win': 0})
+    dpl = simulate_dipole(Network(params.copy()))[0]
+
+    net = Network(params.copy(), record_dt=0.5)
+    assert net.n_times == 61
+    dpl_decim = simulate_dipole(net)[0]
+    assert_allclose(dpl_decim.times, dpl.times[::20])
+    for dpl_key in dpl.data.keys():
+        assert dpl_decim.data[dpl_key].shape == (net.n_times,)
+        assert_allclose(dpl_decim.data[dpl_key],
+                        _lowpass_decimate(dpl.data[dpl_key], 20),
+                        atol=1e-10)
+
+
+def test_reprocess():
+    """Test processing the raw dipoles again with new parameters."""
+    hnn_core_root = op.dirname(hnn_core.__file__)
+    params_fname = op.join(hnn_core_root, 'param', 'default.json')
+    params = read_params(params_fname)
+    params.update({'N_pyr_x': 3, 'N_pyr_y': 3, 'tstop': 30.,
+                   't_evprox_1': 5, 't_evdist_1': 10, 't_evprox_2': 20,
+                   'dipole_smooth_win': 5.})
+    dpls = simulate_dipole(Network(params.copy()), n_trials=2)
+    assert dpls[0].raw_data['agg'].shape == dpls[0].times.shape
+
+    dpls_same = reprocess(dpls, params)
+    for dpl, dpl_same in zip(dpls, dpls_same):
+        for layer in ('agg', 'L2', 'L5'):
+            assert np.array_equal(dpl_same.data[layer], dpl.data[layer])
+
+    params.update({'dipole_scalefctr': 10., 'dipole_smooth_win': 2.})
+    dpls_new = reprocess(dpls, params)
+    for dpl, dpl_new in zip(dpls, dpls_new):
+        dpl_raw = Dipole(dpl.times, np.c_[dpl.raw_data['agg'],
+                                          dpl.raw_data['L2'],
+                                          dpl.raw_data['L5']])
+        dpl_raw.baseline_renormalize(params)
+        dpl_raw.convert_fAm_to_nAm()
+        dpl_raw.scale(10.)
+        dpl_raw.smooth(2. / params['dt'])
+        for layer in ('agg', 'L2', 'L5'):
+            assert_allclose(dpl_new.data[layer], dpl_raw.data[layer])
+        assert dpl_new.units == 'nAm'
+
+    # the processing commutes with averaging
+    dpl_avg = reprocess(average_dipoles(dpls), params)[0]
+    assert dpl_avg.nave == 2
+    assert_allclose(dpl_avg.data['agg'],
+                    average_dipoles(dpls_new).data['agg'])
+
+    with pytest.raises(ValueError, match='has no raw data'):
+        reprocess(Dipole(dpls[0].times, np.zeros((len(dpls[0].times), 3))),
+                  params)
@@ -0,0 +1,35 @@
+import subprocess
+import sys
+
+# the time (s) importing hnn_core may take on top of numpy
+_IMPORT_BUDGET = 1.
+
+_CODE = """
+import sys
+from time import perf_counter
+import numpy
+start = perf_counter()
+import hnn_core
+from hnn_core import read_dipole, read_spikes, read_params, Params
+print(perf_counter() - start)
+print(' '.join(sorted(sys.modules)))
+"""
+
+
+def test_import():
+    """Test that hnn_core is imported quickly and without NEURON."""
+    out = subprocess.run([sys.executable, '-c', _CODE], check=True,
+                         stdout=subprocess.PIPE,
+                         universal_newlines=True).stdout.splitlines()
+    import_time, modules = float(out[-2]), out[-1].split()
+    for module in ('neuron', 'hnn_core.neuron', 'hnn_core.cell',
+                   'matplotlib', 'joblib', 'mpi4py'):
+        assert module not in modules
+    assert import_time < _IMPORT_BUDGET
+
+    # the cell classes are still available, and import NEURON on first use
+    out = subprocess.run([sys.executable, '-c', 'import sys, hnn_core; '
+                          'hnn_core.L5Pyr; print("neuron" in sys.modules)'],
+                         check=True, stdout=subprocess.PIPE,
+                         universal_newlines=True).stdout.splitlines()
+    assert out[-1] == 'True'
@@ -1,14 +1,20 @@
 # Authors: Mainak Jas <mainakjas@gmail.com>
 
 from copy import deepcopy
+import json
 import os.path as op
 from glob import glob
 import numpy as np
+from numpy.testing import assert_allclose, assert_array_equal
 import pytest
 
 import hnn_core
-from hnn_core import read_params, Network, Spikes, read_spikes
-from hnn_core.neuron import NeuronNetwork
+from hnn_core import (read_params, Network, Spikes, read_spikes,
+                      read_snapshot, simulate_dipole)
+from hnn_core.cell import _get_segment_coords
+from hnn_core.network import _get_cell_geometry
+from hnn_core.neuron import NeuronNetwork, _get_transfer_matrix
+from hnn_core.pyramidal import L2Pyr, L5Pyr
 
 
 def test_network():
@@ -41,6 +47,16 @@ def test_network():
         type_key = ev_input[2: -2] + ev_input[-1]
         assert len(net.gid_dict[type_key]) == net.n_cells
 
+    # Assert that the recorded signals are sampled at every time step
+    assert net.record_dt == params['dt']
+    assert net.n_times == int(params['tstop'] / params['dt']) + 1
+    net_decim = Network(deepcopy(params), record_dt=4 * params['dt'])
+    assert net_decim.n_times == (net.n_times - 1) // 4 + 1
+    for record_dt in (0.1 * params['dt'], 1.5 * params['dt']):
+        with pytest.raises(ValueError, match='record_dt must be an integer '
+                           'multiple of dt'):
+            Network(deepcopy(params), record_dt=record_dt)
+
     # Assert that an empty Spikes object is created as an attribute
     assert net.spikes == Spikes()
 
@@ -54,6 +70,344 @@ def test_network():
                                                n_gaus_sources +
                                                n_common_sources)
 
+    # Assert that gids are assigned round robin, with the feeds unique to a
+    # cell on the process of that cell
+    gid_ranks = net._get_gid_ranks(n_procs=3)
+    assert_array_equal(gid_ranks[:net.n_cells], np.arange(net.n_cells) % 3)
+    assert_array_equal(gid_ranks[np.array(net.gid_dict['extpois'])],
+                       gid_ranks[:net.n_cells])
+    assert_array_equal(gid_ranks[np.array(net.gid_dict['common'])], [0, 1])
+
+    # Assert that the minimum delay is that of the feeds
+    assert neuron_network.min_delays.shape == (1, 1)
+    assert_allclose(neuron_network.min_delays, 0.1)
+    with pytest.raises(ValueError, match='min_delay must be at least dt'):
+        Network(deepcopy(params), min_delay=params['dt'] / 2.)
+    net_delay = Network(deepcopy(params), min_delay=1.)
+    neuron_network = NeuronNetwork(net_delay)
+    assert_allclose(neuron_network.min_delays, 1.)
+    assert min(nc.delay for nc in neuron_network._iter_netcons()) == 1.
+
+    # Assert that connections and segments are counted without NEURON
+    counts = net_delay._count_elements()
+    assert counts['netcons'] == len(list(neuron_network._iter_netcons()))
+    assert counts['segments'] == sum(sec.nseg for cell in neuron_network.cells
+                                     for sec in cell.get_sections())
+    # the wiring and geometry tables of network.py follow the cell classes
+    n_netcons = dict()
+    for cell, name_src, _ in neuron_network._iter_netcons(with_names=True):
+        key = (cell.celltype, name_src)
+        n_netcons[key] = n_netcons.get(key, 0) + 1
+    assert n_netcons == {(cell_type, name_src): n for cell_type, counts_type
+                         in net_delay._count_netcons().items()
+                         for name_src, n in counts_type.items() if n > 0}
+    for cell in neuron_network.cells:
+        assert _get_cell_geometry(cell.celltype, params) == (
+            len(cell.get_sections()),
+            sum(sec.nseg for sec in cell.get_sections()))
+
+    # Assert that the plan matches the network built in NEURON
+    plan = net_delay.plan(n_procs=3)
+    assert sum(plan['cells'].values()) == len(neuron_network.cells)
+    assert sum(plan['segments'].values()) == counts['segments']
+    assert sum(plan['feeds'].values()) == len(neuron_network._feed_cells)
+    assert sum(plan['feed_events'].values()) == sum(
+        feed_cell.nrn_eventvec.size() for feed_cell in
+        neuron_network._feed_cells)
+    assert sum(rank['netcons'] for rank in plan['ranks']) == counts['netcons']
+    assert [rank['cells'] for rank in plan['ranks']] == [90, 90, 90]
+    assert plan['runtime']['simulate'] < net_delay.plan()['runtime'][
+        'simulate']
+    with pytest.raises(ValueError, match='n_procs must be at least 1'):
+        net_delay.plan(n_procs=0)
+
+
+def test_network_recordings(tmpdir):
+    """Test recording per-cell variables."""
+    hnn_core_root = op.dirname(hnn_core.__file__)
+    params_fname = op.join(hnn_core_root, 'param', 'default.json')
+    params = read_params(params_fname)
+    params.update({'N_pyr_x': 3, 'N_pyr_y': 3, 'tstop': 30.,
+                   't_evprox_1': 5, 't_evdist_1': 10, 't_evprox_2': 20,
+                   'dipole_smooth_win': 0})
+    net = Network(params, record_dt=0.5)
+
+    with pytest.raises(ValueError, match="var must be one of"):
+        net.add_recording('g')
+    with pytest.raises(ValueError, match="cell_types must be a subset"):
+        net.add_recording('v', cell_types=['L4Pyr'])
+    with pytest.raises(ValueError, match="Qsum can only be recorded"):
+        net.add_recording('Qsum', cell_types=['L2_basket'])
+    with pytest.raises(ValueError, match="gids must belong"):
+        net.add_recording('v', cell_types=['L5Pyr'], gids=[0])
+
+    net.add_recording('v', cell_types=['L5Pyr', 'L2_basket'])
+    net.add_recording('v', cell_types='L5Pyr', section='apical_tuft')
+    with pytest.raises(ValueError, match='A recording named v_soma already'):
+        net.add_recording('v', cell_types='L5Pyr')
+    net.add_recording('i', gids=[3, 0])
+    n_recorded = net._count_elements()['recorded']
+    net.add_recording('Qsum')
+    assert_array_equal(net.recording_gids['i_soma'], [0, 3])
+    # the dipole of each section of the pyramidal cells is recorded
+    n_sections = sum(len(cell_class(0, (0, 0, 0), params).get_sections())
+                     for cell_class in (L2Pyr, L5Pyr)) * params['N_pyr_x'] * \
+        params['N_pyr_y']
+    assert net._count_elements()['recorded'] - n_recorded == (
+        n_sections * net._n_times_sim)
+    net.record_max_bytes = 1
+    net.record_mmap_dir = str(tmpdir)
+
+    dpl = simulate_dipole(net)[0]
+    recordings = net.recordings[0]
+    assert set(recordings) == {'v_soma', 'v_apical_tuft', 'i_soma', 'Qsum'}
+    for name, data in recordings.items():
+        assert isinstance(data, np.memmap)
+        assert data.shape == (len(net.recording_gids[name]), net.n_times)
+    assert len(tmpdir.listdir()) == 4
+
+    # the dipoles of the L2 pyramidal cells add up to the L2 dipole
+    is_L2 = np.in1d(net.recording_gids['Qsum'], net.gid_dict['L2_pyramidal'])
+    n_pyr = params['N_pyr_x'] * params['N_pyr_y']
+    dpl_L2 = (dpl.data['L2'] / (1e-6 * params['dipole_scalefctr']) +
+              n_pyr * 0.0443)
+    assert_allclose(recordings['Qsum'][is_L2].sum(axis=0), dpl_L2)
+
+    # spike data are transferred as typed arrays and stored as lists
+    assert len(net.spikes.times[0]) == len(net.spikes.gids[0])
+    assert all(isinstance(gid, int) for gid in net.spikes.gids[0])
+    assert np.all(np.diff(dpl.times) > 0)
+
+    # the timings of the stages are exported as JSON
+    timings = net.timings[0]
+    assert timings['n_procs'] == 1
+    assert {'connect', 'create_cells_and_feeds'} < set(timings['build'])
+    assert 'psolve' in timings['simulate']
+    assert timings['counts']['cells']['total'] == net.n_cells
+    assert timings['counts']['events']['total'] > 0
+    fname = op.join(str(tmpdir), 'timings.json')
+    net.write_timings(fname)
+    with open(fname) as fid:
+        assert json.load(fid) == net.timings
+
+
+def test_network_snapshot(tmpdir):
+    """Test building a network from a snapshot."""
+    hnn_core_root = op.dirname(hnn_core.__file__)
+    params_fname = op.join(hnn_core_root, 'param', 'default.json')
+    params = read_params(params_fname)
+    params.update({'N_pyr_x': 3, 'N_pyr_y': 3, 'tstop': 30.,
+                   't_evprox_1': 5, 't_evdist_1': 10, 't_evprox_2': 20,
+                   'dipole_smooth_win': 0, 'N_trials': 2})
+    net = Network(params, min_delay=0.5)
+    dpls = simulate_dipole(net)
+    # the feeds of each trial are seeded differently
+    assert not np.array_equal(dpls[0].data['agg'], dpls[1].data['agg'])
+    # and the network is built again for each of them
+    assert all('connect' in timings['build'] for timings in net.timings)
+
+    fname = op.join(str(tmpdir), 'snapshot')
+    net.write_snapshot(fname)
+    net_snap = read_snapshot(fname + '.npz')
+    assert net_snap.min_delay == 0.5
+    assert net_snap.params == net.params
+    snapshot = net_snap._snapshot
+    assert len(snapshot['src_gids']) == net._count_elements()['netcons']
+    assert_array_equal(snapshot['feed_gids'],
+                       np.setdiff1d(np.arange(net.n_src),
+                                    np.arange(net.n_cells)))
+    assert len(snapshot['feed_offsets']) == 2 * len(snapshot['feed_gids']) + 1
+    assert np.all(snapshot['delays'] >= 0.5)
+
+    # the snapshot takes precedence over the parameters
+    net_snap.params['gbar_L2Pyr_L2Pyr_ampa'] = 0.
+    net_snap.params['prng_*'] = 7
+    dpls_snap = simulate_dipole(net_snap)
+    for dpl, dpl_snap in zip(dpls, dpls_snap):
+        assert_array_equal(dpl_snap.data['agg'], dpl.data['agg'])
+    assert net_snap.spikes == net.spikes
+
+    net_snap.params['N_trials'] = 3
+    with pytest.raises(ValueError, match='The snapshot has the feeds of 2'):
+        simulate_dipole(net_snap)
+
+    np.savez(fname, **dict(snapshot, params=json.dumps(dict(params)),
+                           record_dt=0.025, min_delay=np.nan, n_src=1))
+    with pytest.raises(ValueError, match='The snapshot has 1 sources'):
+        read_snapshot(fname + '.npz')
+
+
+def test_network_electrodes():
+    """Test recording the extracellular potential at electrodes."""
+    hnn_core_root = op.dirname(hnn_core.__file__)
+    params_fname = op.join(hnn_core_root, 'param', 'default.json')
+    params = read_params(params_fname)
+    params.update({'N_pyr_x': 3, 'N_pyr_y': 3, 'tstop': 30.,
+                   't_evprox_1': 5, 't_evdist_1': 10, 't_evprox_2': 20,
+                   'dipole_smooth_win': 0})
+    net = Network(params, record_dt=0.5)
+
+    with pytest.raises(ValueError, match='positions must be of shape'):
+        net.add_electrode_array([0, 0, 0])
+    with pytest.raises(ValueError, match='sigma must be positive'):
+        net.add_electrode_array([[0, 0, 0]], sigma=0.)
+    with pytest.raises(ValueError, match='min_distance must be positive'):
+        net.add_electrode_array([[0, 0, 0]], min_distance=-1.)
+
+    # a laminar array through the middle of the network
+    depths = np.linspace(-200., 2800., 7)
+    positions = np.c_[np.full(7, 100.), depths, np.full(7, 100.)]
+    net.add_electrode_array(positions, name='laminar')
+    net.add_electrode_array(positions, name='conductive', sigma=0.6)
+    net.add_electrode_array([[1e6, 0., 0.]])
+    assert set(net.electrode_positions) == {'laminar', 'conductive',
+                                            'array2'}
+    counts = net._count_elements()
+    assert counts['transfer'] == 15 * counts['segments']
+
+    simulate_dipole(net)
+    lfp = net.lfp[0]
+    assert set(lfp) == {'laminar', 'conductive', 'array2'}
+    assert lfp['laminar'].shape == (7, net.n_times)
+    assert np.all(np.isfinite(lfp['laminar']))
+    assert np.abs(lfp['laminar']).max() > 0
+    # the potential is inversely proportional to the conductivity
+    assert_allclose(lfp['conductive'], lfp['laminar'] / 2.)
+    # and vanishes far from the cells
+    assert np.abs(lfp['array2']).max() < 1e-3 * np.abs(lfp['laminar']).max()
+
+    # the potential is the transfer matrix applied to the membrane currents
+    # of all the segments, recorded at the same time steps
+    net = Network(params, record_dt=0.5)
+    net.add_electrode_array(positions, name='laminar')
+    cells = NeuronNetwork(net).cells
+    seg_names = list()
+    for cell in cells[:net.n_cells]:
+        if cell.celltype in {name[0] for name in seg_names}:
+            continue
+        for sect_name, sect in zip(cell.get_section_names(),
+                                   cell.get_sections()):
+            for seg_idx, seg in enumerate(sect):
+                name = 'i_%s_%s_%d' % (cell.celltype, sect_name, seg_idx)
+                net.add_recording('i', cell_types=cell.celltype,
+                                  section=sect_name, loc=seg.x, name=name)
+                seg_names.append((cell.celltype, name))
+    simulate_dipole(net)
+    recordings = net.recordings[0]
+    imem = list()
+    for cell in cells[:net.n_cells]:
+        for cell_type, name in seg_names:
+            if cell_type == cell.celltype:
+                row = list(net.recording_gids[name]).index(cell.gid)
+                imem.append(recordings[name][row])
+    starts, ends, _ = _get_segment_coords(cells[:net.n_cells])
+    spec = net._electrode_spec['laminar']
+    transfer = _get_transfer_matrix(positions, starts, ends, spec['sigma'],
+                                    spec['min_distance'])
+    assert_allclose(transfer @ np.array(imem), net.lfp[0]['laminar'],
+                    rtol=1e-6, atol=1e-9)
+
+
+def test_network_dipole_recordings():
+    """Test recording the dipoles of cells, cell types and sections."""
+    hnn_core_root = op.dirname(hnn_core.__file__)
+    params_fname = op.join(hnn_core_root, 'param', 'default.json')
+    params = read_params(params_fname)
+    params.update({'N_pyr_x': 3, 'N_pyr_y': 3, 'tstop': 40.,
+                   't_evprox_1': 5, 't_evdist_1': 10, 't_evprox_2': 20})
+    net = Network(params)
+
+    with pytest.raises(ValueError, match="by must be one of"):
+        net.add_dipole_recording(by='section')
+    with pytest.raises(ValueError, match='cell_types must be a subset'):
+        net.add_dipole_recording(cell_types=['L2_basket'])
+    with pytest.raises(ValueError, match='The sections of group apical'):
+        net.add_dipole_recording(groups=dict(apical=['dend']))
+
+    apical = ['apical_trunk', 'apical_oblique', 'apical_1', 'apical_2',
+              'apical_tuft']
+    basal = ['soma', 'basal_1', 'basal_2', 'basal_3']
+    net.add_recording('Qsum')
+    net.add_dipole_recording()
+    net.add_dipole_recording(by='cell_type', groups=dict(apical=apical,
+                                                         basal=basal))
+    net.add_dipole_recording(cell_types='L5Pyr', groups=dict(tuft=[
+        'apical_tuft']), name='L5')
+    with pytest.raises(ValueError, match='A recording named dipole already'):
+        net.add_dipole_recording()
+    # the dipole recordings and the other recordings share their names
+    with pytest.raises(ValueError, match='A recording named dipole already'):
+        net.add_recording('v', cell_types=['L2_basket'], name='dipole')
+    with pytest.raises(ValueError, match='A recording named Qsum already'):
+        net.add_dipole_recording(by='cell_type', name='Qsum')
+    assert net.recording_types == {
+        'dipole_apical': ['L2_pyramidal', 'L5Pyr'],
+        'dipole_basal': ['L2_pyramidal', 'L5Pyr']}
+    assert_array_equal(net.recording_gids['L5_tuft'],
+                       net.gid_dict['L5Pyr'])
+
+    dpls = simulate_dipole(net)
+    recordings = net.recordings[0]
+    assert recordings['dipole'].shape == recordings['Qsum'].shape
+    assert recordings['dipole_apical'].shape == (2, net.n_times)
+    assert recordings['L5_tuft'].shape == (9, net.n_times)
+    # the dipoles of the cells are those of their dipole mechanisms
+    assert_allclose(recordings['dipole'], recordings['Qsum'], atol=1e-8)
+    # and the dipoles of the sections add up to the raw layer dipoles
+    dipole_types = recordings['dipole_apical'] + recordings['dipole_basal']
+    assert_allclose(dipole_types[0], dpls[0].raw_data['L2'], atol=1e-8)
+    assert_allclose(dipole_types[1], dpls[0].raw_data['L5'], atol=1e-8)
+    rows = np.searchsorted(net.recording_gids['dipole'],
+                           net.gid_dict['L2_pyramidal'])
+    assert_allclose(recordings['dipole'][rows].sum(axis=0), dipole_types[0],
+                    atol=1e-8)
+    assert np.abs(recordings['L5_tuft']).max() > 0
+
+
+def test_plot_spikes():
+    """Test plotting the spikes of cells and feeds."""
+    import matplotlib
+    matplotlib.use('agg')
+    hnn_core_root = op.dirname(hnn_core.__file__)
+    params_fname = op.join(hnn_core_root, 'param', 'default.json')
+    params = read_params(params_fname)
+    params.update({'N_pyr_x': 3, 'N_pyr_y': 3})
+    net = Network(params)
+
+    # the input histogram is computed from the binned feed spikes
+    gid_evprox = net.gid_dict['evprox1'][0]
+    gid_evdist = net.gid_dict['evdist1'][0]
+    net.spikes = Spikes(times=[[1., 5., 12., 30.], [2.]],
+                        gids=[[gid_evprox, gid_evprox + 1, gid_evdist,
+                               gid_evprox], [gid_evprox]],
+                        types=[['evprox1', 'evprox1', 'evdist1', 'evprox1'],
+                               ['evprox1']])
+    fig = net.plot_input(show=False, trial_idx=0, tmax=20.)
+    heights = [patch.get_height() for patch in fig.axes[0].patches]
+    assert sum(heights[:len(heights) // 2]) == 2
+    assert sum(heights[len(heights) // 2:]) == 1
+
+    # plot selected trials and times, as lines or as a density image
+    spiketimes = [[2.3456, 3.5, 7.89, 8.5], [4.2812, 93.2]]
+    spikegids = [[1, 0, 3, 2], [5, 7]]
+    spiketypes = [['L2_pyramidal', 'L2_pyramidal', 'L2_basket',
+                   'L2_pyramidal'], ['L5Pyr', 'L5_basket']]
+    spikes = Spikes(times=spiketimes, gids=spikegids, types=spiketypes)
+    fig = spikes.plot(show=False, trial_idx=0)
+    assert len(fig.axes[0].collections) == 4
+    assert len(fig.axes[0].images) == 0
+    fig = spikes.plot(show=False, tmin=3., tmax=50., max_spikes=1)
+    # one row per gid, grouped by the types that spiked within the window
+    images = fig.axes[0].images
+    assert [image.get_array().shape for image in images] == [
+        (1, 2000), (3, 2000), (1, 2000)]
+    assert_array_equal(images[1].get_array().sum(axis=1), [1, 0, 1])
+    assert [image.get_extent()[2:] for image in images] == [
+        [-0.5, 0.5], [0.5, 3.5], [3.5, 4.5]]
+    assert fig.axes[0].get_ylim() == (-0.5, 4.5)
+    with pytest.raises(ValueError, match='trial_idx must be between'):
+        spikes.plot(show=False, trial_idx=2)
+
 
 def test_spikes():
     """Test spikes object."""
@@ -79,6 +433,73 @@ def test_spikes():
         spikes = Spikes(times=[[2.3456, 7.89]], gids=spikegids,
                         types=spiketypes)
 
+    # counts, rates and histograms over all trials at once
+    gid_dict = {'L2_pyramidal': range(0, 2), 'L2_basket': range(2, 4),
+                'L5Pyr': range(4, 6), 'L5_basket': range(6, 8)}
+    assert_array_equal(spikes.count(), [[0, 1, 0, 1, 0, 0, 0, 0],
+                                        [0, 0, 0, 0, 0, 1, 0, 1]])
+    assert spikes.count(n_gids=10, tmin=5.).shape == (2, 10)
+    assert spikes.count(tmin=5.).sum() == 2
+    with pytest.raises(ValueError, match='n_gids must be larger'):
+        spikes.count(n_gids=5)
+    rates = spikes.rates(gid_dict, 0., 100.)
+    assert_allclose(rates, [[5., 5., 0., 0.], [0., 0., 5., 5.]])
+    rates = spikes.rates(gid_dict, 0., 50., cell_types=['L5Pyr'])
+    assert_allclose(rates, [[0.], [10.]])
+    with pytest.raises(ValueError, match='cell_types must be keys'):
+        spikes.rates(gid_dict, 0., 50., cell_types=['L4Pyr'])
+
+    psth, times = spikes.psth(gid_dict, 0., 100., bin_width=10.)
+    assert psth.shape == (2, 4, 10)
+    assert_allclose(times, np.arange(5., 100., 10.))
+    assert_allclose(psth.mean(axis=-1), spikes.rates(gid_dict, 0., 100.))
+    assert psth[1, 2, 0] == 50.
+    psth_smooth, _ = spikes.psth(gid_dict, 0., 200., bin_width=1.,
+                                 sigma=2.)
+    # the number of spikes is preserved away from the edges
+    assert_allclose(psth_smooth[1, 3].sum(), 500.)
+    assert psth_smooth[0, 0].sum() < 500.
+    assert np.argmax(psth_smooth[0, 1]) == 7
+
+    # queries of the spikes of a cell or a cell type in all trials
+    spikes = Spikes(times=[[5., 1., 3., 9.], [2., 4.]],
+                    gids=[[1, 3, 1, 1], [1, 3]],
+                    types=[['L2_pyramidal', 'L2_basket', 'L2_pyramidal',
+                            'L2_pyramidal'], ['L2_pyramidal', 'L2_basket']])
+    times, gids, trial_idxs = spikes.get_spikes(gid=1)
+    assert_array_equal(times, [3., 5., 9., 2.])
+    assert_array_equal(trial_idxs, [0, 0, 0, 1])
+    assert not times.flags.writeable
+    times, _, trial_idxs = spikes.get_spikes(gid=1, tmin=2.5, tmax=9.)
+    assert_array_equal(times, [3., 5.])
+    assert len(spikes.get_spikes(gid=42)[0]) == 0
+    times, gids, trial_idxs = spikes.get_spikes(cell_type='L2_pyramidal',
+                                                tmin=2., tmax=9.)
+    assert_array_equal(times, [2., 3., 5.])
+    assert_array_equal(trial_idxs, [1, 0, 0])
+    assert_array_equal(spikes.get_spikes(cell_type='L2_basket')[0], [1., 4.])
+    assert len(spikes.get_spikes(cell_type='L5Pyr')[0]) == 0
+    with pytest.raises(ValueError, match='Exactly one of gid and cell_type'):
+        spikes.get_spikes()
+
+    trains = list(spikes.iter_spike_trains())
+    assert [(gid, trial_idx) for gid, trial_idx, _ in trains] == \
+        [(1, 0), (1, 1), (3, 0), (3, 1)]
+    assert_array_equal(trains[0][2], [3., 5., 9.])
+    trains = list(spikes.iter_spike_trains(gids=[3, 2]))
+    assert [(gid, trial_idx) for gid, trial_idx, _ in trains] == \
+        [(3, 0), (3, 1)]
+    isis, isi_gids = spikes.interspike_intervals()
+    assert_array_equal(isis, [2., 4.])
+    assert_array_equal(isi_gids, [1, 1])
+    assert len(spikes.interspike_intervals(gids=[3])[0]) == 0
+
+    # the index is rebuilt when spikes are added
+    spikes._times[1].append(6.)
+    spikes._gids[1].append(1)
+    spikes._types[1].append('L2_pyramidal')
+    assert_array_equal(spikes.interspike_intervals()[0], [2., 4., 4.])
+
     # Write spike file with no 'types' column
     # Check for gid_dict errors
     for fname in sorted(glob('/tmp/spk_*.txt')):
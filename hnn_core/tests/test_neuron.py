@@ -0,0 +1,91 @@
+import os.path as op
+import shutil
+from types import SimpleNamespace
+
+import numpy as np
+from numpy.testing import assert_allclose
+import pytest
+
+import hnn_core
+from hnn_core import neuron
+from hnn_core.neuron import (_compile_mechanisms, _get_mechanisms_key,
+                             load_custom_mechanisms,
+                             _get_transfer_matrix)
+
+
+def test_compile_mechanisms(tmpdir, monkeypatch):
+    """Test compiling mechanisms into the cache."""
+    mod_dir = tmpdir.mkdir('mod')
+    cache_dir = str(tmpdir.join('cache'))
+    shutil.copy(op.join(op.dirname(hnn_core.__file__), 'mod',
+                        'vecevent.mod'), str(mod_dir))
+
+    key = _get_mechanisms_key(str(mod_dir))
+    mech_fname = _compile_mechanisms(str(mod_dir), cache_dir)
+    assert op.exists(mech_fname)
+    assert key in mech_fname
+    # the compiled library is reused
+    mtime = op.getmtime(mech_fname)
+    assert _compile_mechanisms(str(mod_dir), cache_dir) == mech_fname
+    assert op.getmtime(mech_fname) == mtime
+    # the default cache can be moved with HNN_CORE_CACHE_DIR
+    monkeypatch.setenv('HNN_CORE_CACHE_DIR', cache_dir)
+    default_fname = _compile_mechanisms(str(mod_dir))
+    assert default_fname.startswith(op.join(cache_dir, 'mechanisms', key))
+    assert op.exists(default_fname)
+
+    # any change to the mod files changes the key
+    with open(str(mod_dir.join('vecevent.mod')), 'a') as fid:
+        fid.write(': a comment\n')
+    assert _get_mechanisms_key(str(mod_dir)) != key
+
+    # mod files that do not compile
+    with open(str(mod_dir.join('vecevent.mod')), 'a') as fid:
+        fid.write('NOT NMODL\n')
+    with pytest.raises(RuntimeError, match='Compiling the mechanisms'):
+        _compile_mechanisms(str(mod_dir), cache_dir)
+
+
+@pytest.mark.parametrize('error', [RuntimeError('nrnivmodl failed'),
+                                   PermissionError('read-only cache')])
+def test_load_prebuilt_mechanisms(monkeypatch, error):
+    """Test loading the packaged mechanisms if they cannot be compiled."""
+    def compile_mechanisms(mod_dir):
+        raise error
+
+    loaded = list()
+    monkeypatch.setattr(neuron, '_compile_mechanisms', compile_mechanisms)
+    monkeypatch.setattr(neuron, 'h', SimpleNamespace(
+        nrn_load_dll=loaded.append))
+    is_loaded = iter([False, True])
+    monkeypatch.setattr(neuron, '_is_loaded_mechanisms',
+                        lambda: next(is_loaded))
+    with pytest.warns(UserWarning, match='could not be compiled'):
+        load_custom_mechanisms()
+    mod_dir = op.join(op.dirname(hnn_core.__file__), 'mod')
+    assert loaded == [neuron._find_mechanisms_library(mod_dir)]
+
+
+def test_transfer_matrix():
+    """Test the line source transfer matrix."""
+    rng = np.random.RandomState(0)
+    starts = rng.uniform(-50, 50, (4, 3))
+    ends = starts + rng.uniform(-20, 20, (4, 3))
+    # a segment of zero length is a point source
+    ends[3] = starts[3]
+    positions = rng.uniform(-100, 100, (3, 3))
+    sigma = 0.3
+    transfer = _get_transfer_matrix(positions, starts, ends, sigma, 0.5)
+    assert transfer.shape == (3, 4)
+
+    # average 1 / distance over points along each segment
+    frac = (np.arange(10000) + 0.5) / 10000
+    points = starts[:, None] + frac[:, None] * (ends - starts)[:, None]
+    dist = np.linalg.norm(positions[:, None, None] - points, axis=-1)
+    expected = 1e3 / (4 * np.pi * sigma) * (1. / dist).mean(axis=-1)
+    assert_allclose(transfer, expected, rtol=1e-6)
+
+    # the distance to the axis of a segment is bounded
+    transfer = _get_transfer_matrix(starts[:1], starts[:1], ends[:1], sigma,
+                                    0.5)
+    assert np.isfinite(transfer).all()
@@ -0,0 +1,113 @@
+import os
+import os.path as op
+import stat
+import sys
+from subprocess import Popen, PIPE
+
+import pytest
+
+import hnn_core
+from hnn_core import read_params, Network, MPIBackend
+from hnn_core.parallel_backends import (_choose_parallelism,
+                                        _estimate_trial_memory,
+                                        _parse_memory, _is_openmpi)
+
+# A fake launch that writes more than a pipe holds to stdout and returns
+# its data on stderr as mpi_child does. The first one only exits once the
+# second one has written its output.
+_FAKE_LAUNCH = """
+import codecs, os, pickle, sys, time
+job, flag = int(sys.argv[1]), sys.argv[2]
+sys.stdout.write('x' * 2 ** 18)
+sys.stdout.flush()
+if job == 1:
+    open(flag, 'w').close()
+for _ in range(200):
+    if os.path.exists(flag):
+        break
+    time.sleep(0.05)
+else:
+    sys.exit(1)
+data = pickle.dumps([job])
+data += b'=' * (-len(data) % 3)
+sys.stderr.write(codecs.encode(data, 'base64').decode() + '====')
+"""
+
+
+def test_choose_parallelism():
+    """Test the choice of parallelism of AutoBackend."""
+    # one core or a small network: no MPI
+    assert _choose_parallelism(1, 270, 1) == dict(mode='serial', n_jobs=1,
+                                                  n_procs=1)
+    assert _choose_parallelism(4, 24, 8) == dict(mode='trial', n_jobs=4,
+                                                 n_procs=1)
+    # more trials than cores: one trial per core
+    assert _choose_parallelism(10, 270, 4) == dict(mode='trial', n_jobs=4,
+                                                   n_procs=1)
+    # a single large trial is split over cells
+    assert _choose_parallelism(1, 270, 8) == dict(mode='cell', n_jobs=1,
+                                                  n_procs=4)
+    assert _choose_parallelism(1, 270, 8, has_mpi=False)['mode'] == 'serial'
+    # spare cores are shared between the trials
+    assert _choose_parallelism(2, 1000, 8) == dict(mode='hybrid', n_jobs=2,
+                                                   n_procs=4)
+    # memory limits the number of concurrent trials
+    decision = _choose_parallelism(8, 270, 8, trial_memory=1e9,
+                                   max_memory=2.5e9, has_mpi=False)
+    assert decision == dict(mode='trial', n_jobs=2, n_procs=1)
+    # each MPI process adds its own copy of NEURON
+    decision = _choose_parallelism(8, 270, 8, trial_memory=1e9,
+                                   max_memory=2.5e9)
+    assert decision == dict(mode='cell', n_jobs=1, n_procs=4)
+    with pytest.warns(UserWarning, match='more than the memory budget'):
+        decision = _choose_parallelism(8, 270, 8, trial_memory=1e9,
+                                       max_memory=0)
+    assert decision['n_jobs'] == 1
+
+
+def test_estimate_trial_memory():
+    """Test the memory estimate of a trial."""
+    hnn_core_root = op.dirname(hnn_core.__file__)
+    params = read_params(op.join(hnn_core_root, 'param', 'default.json'))
+    params.update({'N_pyr_x': 3, 'N_pyr_y': 3})
+    net = Network(params)
+    trial_memory = _estimate_trial_memory(net)
+    assert 80e6 < trial_memory < 150e6
+    # recording the voltage of every cell adds a value per cell and step
+    net.add_recording('v')
+    assert _estimate_trial_memory(net) > trial_memory
+
+    assert _parse_memory('4G') == 4e9
+    assert _parse_memory(500e6) == 500e6
+    with pytest.raises(ValueError, match='max_memory must be'):
+        _parse_memory('4X')
+
+
+def test_collect_simulations(tmpdir):
+    """Test waiting for concurrent launches."""
+    flag = str(tmpdir.join('flag'))
+    procs = [Popen([sys.executable, '-c', _FAKE_LAUNCH, str(job), flag],
+                   stdout=PIPE, stderr=PIPE, universal_newlines=True)
+             for job in range(2)]
+    backend = MPIBackend(n_procs=1)
+    assert backend._collect_simulations(procs) == [[0], [1]]
+
+    procs = [Popen([sys.executable, '-c', 'import sys; sys.exit(1)'],
+                   stdout=PIPE, stderr=PIPE, universal_newlines=True),
+             Popen([sys.executable, '-c', 'import time; time.sleep(60)'],
+                   stdout=PIPE, stderr=PIPE, universal_newlines=True)]
+    with pytest.raises(RuntimeError, match='MPI simulation failed'):
+        backend._collect_simulations(procs)
+    assert procs[1].wait(timeout=10) != 0
+
+
+def test_is_openmpi(tmpdir):
+    """Test detecting the Open MPI launcher."""
+    for name, version in [('ompi', 'mpiexec (OpenRTE) 4.1.4'),
+                          ('mpich', 'HYDRA build details:')]:
+        fname = str(tmpdir.join(name))
+        with open(fname, 'w') as fid:
+            fid.write('#!/bin/sh\necho "%s"\n' % version)
+        os.chmod(fname, os.stat(fname).st_mode | stat.S_IEXEC)
+        assert _is_openmpi(fname) == (name == 'ompi')
+    assert not _is_openmpi(str(tmpdir.join('missing')))
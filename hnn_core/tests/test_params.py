@@ -3,6 +3,7 @@
 
 import os.path as op
 import json
+import pickle
 
 import pytest
 from mne.utils import _fetch_file
@@ -31,6 +32,79 @@ def test_read_params():
     pytest.raises(ValueError, Params, 'sdfdfdf')
 
 
+def test_params_wildcards():
+    """Test getting and setting parameters with wildcards."""
+    params_fname = op.join(hnn_core_root, 'param', 'default.json')
+    params = read_params(params_fname)
+    assert isinstance(params, Params)
+
+    params_seeds = params['prng_seedcore*']
+    assert isinstance(params_seeds, Params)
+    assert list(params_seeds) == [key for key in params if
+                                  key.startswith('prng_seedcore')]
+    params_seeds['prng_seedcore_input_prox'] = -1
+    assert params['prng_seedcore_input_prox'] != -1
+    params['prng_*'] = 3
+    assert set(params['prng_seedcore*'].values()) == {3}
+    with pytest.raises(KeyError, match='L4Pyr'):
+        params['L4Pyr*']
+
+    # the keys matching a pattern follow the keys that are added
+    params['prng_seedcore_extra'] = 0
+    assert 'prng_seedcore_extra' in params['prng_seedcore*']
+    params.pop('prng_seedcore_extra')
+    params.update({'prng_seedcore_other': 0})
+    assert 'prng_seedcore_extra' not in params['prng_seedcore*']
+    assert 'prng_seedcore_other' in params['prng_seedcore*']
+
+    # copies do not share mutable values
+    params['sim_prefix'] = ['default']
+    params_copy = params.copy()
+    params_copy['sim_prefix'].append('copy')
+    params_copy['prng_*'] = 4
+    assert params['sim_prefix'] == ['default']
+    assert set(params['prng_seedcore*'].values()) == {0, 3}
+    assert pickle.loads(pickle.dumps(params)) == params
+
+
+def test_params_fingerprint_diff():
+    """Test the fingerprint and differences of parameters."""
+    params_fname = op.join(hnn_core_root, 'param', 'default.json')
+    params = read_params(params_fname)
+    fingerprint = params.fingerprint()
+    assert len(fingerprint) == 64
+    assert params.diff(params.copy()) == dict()
+
+    # the order of the keys and the types of numbers and sequences
+    params_other = Params(dict(reversed(list(params.items()))))
+    params_other['N_pyr_x'] = float(params['N_pyr_x'])
+    params_other['sync_evinput'] = int(params['sync_evinput'])
+    assert params_other.fingerprint() == fingerprint
+    assert params_other.diff(params) == dict()
+    params['sim_prefix'] = ('default', 1)
+    params_other['sim_prefix'] = ['default', 1.]
+    assert params_other.fingerprint() == params.fingerprint()
+
+    params_other.update({'dipole_scalefctr': 1., 'prng_seedcore_extpois': 5,
+                         'gbar_L2Pyr_L2Basket': 1., 't_evprox_1': 10.,
+                         'L5Pyr_soma_L': 10., 'N_pyr_y': 3})
+    assert params_other.fingerprint() != params.fingerprint()
+    changes = params.diff(params_other)
+    assert list(changes.items()) == [
+        ('N_pyr_y', 'topology'), ('L5Pyr_soma_L', 'biophysics'),
+        ('gbar_L2Pyr_L2Basket', 'weights'), ('t_evprox_1', 'feeds'),
+        ('prng_seedcore_extpois', 'seeds'), ('dipole_scalefctr', 'postproc')]
+    del params_other['N_pyr_y']
+    assert params.diff(params_other)['N_pyr_y'] == 'topology'
+
+    # changing the number of trials needs a simulation
+    params_other = params.copy()
+    params_other.update({'N_trials': params['N_trials'] + 1,
+                         'dipole_smooth_win': 0})
+    assert list(params.diff(params_other).items()) == [
+        ('N_trials', 'trials'), ('dipole_smooth_win', 'postproc')]
+
+
 def test_read_legacy_params():
     """Test reading of legacy .param file."""
     param_url = ('https://raw.githubusercontent.com/hnnsolver/'
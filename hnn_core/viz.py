@@ -3,8 +3,13 @@
 # Authors: Mainak Jas <mainak.jas@telecom-paristech.fr>
 #          Sam Neymotin <samnemo@gmail.com>
 
+from itertools import chain
+
 import numpy as np
 
+# the number of time bins of a spike raster drawn as a density image
+_N_RASTER_BINS = 2000
+
 
 def plot_dipole(dpl, ax=None, layer='agg', show=True):
     """Simple layer-specific plot function.
@@ -47,7 +52,59 @@ def plot_dipole(dpl, ax=None, layer='agg', show=True):
     return ax.get_figure()
 
 
-def plot_hist_input(net, ax=None, show=True):
+def _select_trials(trials, trial_idx):
+    """Select trials from a list of lists."""
+    if trial_idx is None:
+        return trials
+    if isinstance(trial_idx, (int, np.integer)):
+        trial_idx = [trial_idx]
+    for idx in trial_idx:
+        if not -len(trials) <= idx < len(trials):
+            raise ValueError('trial_idx must be between 0 and %d. Got %d'
+                             % (len(trials) - 1, idx))
+    return [trials[idx] for idx in trial_idx]
+
+
+def _flatten_spikes(times, others, trial_idx=None, tmin=None, tmax=None):
+    """Concatenate the spikes of trials within a time window.
+
+    Parameters
+    ----------
+    times : list of list of float
+        The spike times of each trial.
+    others : list of list of list
+        Other properties of each spike (e.g., gids or types), organized like
+        times.
+    trial_idx : int | list of int | None
+        The trials to keep. If None, all trials are kept.
+    tmin, tmax : float | None
+        The time window (in ms) to keep. If None, the window is not bounded.
+
+    Returns
+    -------
+    times : array, shape (n_spikes,)
+        The spike times.
+    others : list of array, shape (n_spikes,)
+        The other properties of the spikes.
+    """
+    times = np.fromiter(chain.from_iterable(_select_trials(times,
+                                                           trial_idx)),
+                        dtype=float)
+    others = [np.array(list(chain.from_iterable(
+        _select_trials(other, trial_idx)))) for other in others]
+    if tmin is not None or tmax is not None:
+        mask = np.ones(len(times), dtype=bool)
+        if tmin is not None:
+            mask &= times >= tmin
+        if tmax is not None:
+            mask &= times <= tmax
+        times = times[mask]
+        others = [other[mask] for other in others]
+    return times, others
+
+
+def plot_hist_input(net, ax=None, show=True, trial_idx=None, tmin=None,
+                    tmax=None):
     """Plot the histogram of input.
 
     Parameters
@@ -57,6 +114,12 @@ def plot_hist_input(net, ax=None, show=True):
         a new figure is created.
     show : bool
         If True, show the figure.
+    trial_idx : int | list of int | None
+        The trials to plot. If None, all trials are plotted.
+    tmin : float | None
+        The start of the time window (in ms). If None, 0.
+    tmax : float | None
+        The end of the time window (in ms). If None, params['tstop'].
 
     Returns
     -------
@@ -64,27 +127,36 @@ def plot_hist_input(net, ax=None, show=True):
         The matplotlib figure handle.
     """
     import matplotlib.pyplot as plt
-    spikes = np.array(sum(net.spikes.times, []))
-    gids = np.array(sum(net.spikes.gids, []))
-    valid_gids = np.r_[[v for (k, v) in net.gid_dict.items()
-                        if k.startswith('evprox')]]
-    mask_evprox = np.in1d(gids, valid_gids)
-    valid_gids = np.r_[[v for (k, v) in net.gid_dict.items()
-                        if k.startswith('evdist')]]
-    mask_evdist = np.in1d(gids, valid_gids)
-    bins = np.linspace(0, net.params['tstop'], 50)
+
+    tmin = 0. if tmin is None else tmin
+    tmax = net.params['tstop'] if tmax is None else tmax
+    spikes, (gids,) = _flatten_spikes(net.spikes.times, [net.spikes.gids],
+                                      trial_idx, tmin, tmax)
+    bins = np.linspace(tmin, tmax, 50)
+
+    # the spikes are binned before plotting, one bar per bin
+    counts = dict()
+    for prefix in ('evprox', 'evdist'):
+        mask = np.zeros(len(gids), dtype=bool)
+        for src_type, src_gids in net.gid_dict.items():
+            if src_type.startswith(prefix) and len(src_gids) > 0:
+                mask |= (gids >= src_gids[0]) & (gids <= src_gids[-1])
+        counts[prefix], _ = np.histogram(spikes[mask], bins)
 
     if ax is None:
         fig, ax = plt.subplots(1, 1)
-    ax.hist(spikes[mask_evprox], bins, color='r', label='Proximal')
-    ax.hist(spikes[mask_evdist], bins, color='g', label='Distal')
+    ax.hist(bins[:-1], bins, weights=counts['evprox'], color='r',
+            label='Proximal')
+    ax.hist(bins[:-1], bins, weights=counts['evdist'], color='g',
+            label='Distal')
     plt.legend()
     if show:
         plt.show()
     return ax.get_figure()
 
 
-def plot_spikes_raster(spikes, ax=None, show=True):
+def plot_spikes_raster(spikes, ax=None, show=True, trial_idx=None,
+                       tmin=None, tmax=None, max_spikes=50000):
     """Plot the aggregate spiking activity according to cell type.
 
     Parameters
@@ -96,6 +168,17 @@ def plot_spikes_raster(spikes, ax=None, show=True):
         a new figure is created.
     show : bool
         If True, show the figure.
+    trial_idx : int | list of int | None
+        The trials to plot. If None, all trials are plotted.
+    tmin : float | None
+        The start of the time window (in ms). If None, 0.
+    tmax : float | None
+        The end of the time window (in ms). If None, the last spike time.
+    max_spikes : int
+        If more spikes are plotted, they are binned in time and drawn as an
+        image of the spike density of each cell, with one row per gid and
+        the cells grouped by type, instead of one line per spike. The
+        density is normalized to the maximum of each type.
 
     Returns
     -------
@@ -104,22 +187,56 @@ def plot_spikes_raster(spikes, ax=None, show=True):
     """
 
     import matplotlib.pyplot as plt
-    spike_times = np.array(sum(spikes._times, []))
-    spike_types = np.array(sum(spikes._types, []))
+    from matplotlib.colors import LinearSegmentedColormap
+
+    tmin = 0. if tmin is None else tmin
+    spike_times, (spike_types, spike_gids) = _flatten_spikes(
+        spikes._times, [spikes._types, spikes._gids], trial_idx, tmin, tmax)
+    spike_types = spike_types.astype(str)
     cell_types = ['L5Pyr', 'L5_basket', 'L2_pyramidal', 'L2_basket']
+    colors = ['r', 'b', 'g', 'w']
     spike_times_cell = [spike_times[spike_types == cell_type]
                         for cell_type in cell_types]
 
     if ax is None:
         fig, ax = plt.subplots(1, 1)
 
-    ax.eventplot(spike_times_cell, colors=['r', 'b', 'g', 'w'])
-    ax.legend(cell_types, ncol=2)
+    if len(spike_times) > max_spikes:
+        if tmax is None:
+            tmax = spike_times.max()
+        bins = np.linspace(tmin, tmax, _N_RASTER_BINS + 1)
+        # the gids of a cell type are contiguous, one row per gid from the
+        # first to the last that spiked, stacked in the order of cell_types
+        row = 0
+        for cell_type, times, color in zip(cell_types, spike_times_cell,
+                                           colors):
+            if len(times) == 0:
+                continue
+            gids = spike_gids[spike_types == cell_type]
+            gid_min, gid_max = gids.min(), gids.max()
+            counts, _, _ = np.histogram2d(
+                gids, times, [np.arange(gid_min, gid_max + 2) - 0.5, bins])
+            cmap = LinearSegmentedColormap.from_list(cell_type,
+                                                     ['k', color])
+            n_rows = gid_max - gid_min + 1
+            ax.imshow(counts, aspect='auto',
+                      origin='lower', cmap=cmap, vmin=0.,
+                      vmax=counts.max(), interpolation='nearest',
+                      extent=(tmin, tmax, row - 0.5, row + n_rows - 0.5))
+            row += n_rows
+        ax.legend(handles=[plt.Line2D([], [], color=color) for color in
+                           colors], labels=cell_types, ncol=2)
+        ax.set_ylim((-0.5, max(row, 1) - 0.5))
+    else:
+        ax.eventplot(spike_times_cell, colors=colors)
+        ax.legend(cell_types, ncol=2)
+        ax.set_ylim((-1, 4.5))
     ax.set_facecolor('k')
     ax.set_xlabel('Time (ms)')
     ax.get_yaxis().set_visible(False)
-    ax.set_ylim((-1, 4.5))
-    ax.set_xlim(left=0)
+    ax.set_xlim(left=tmin)
+    if tmax is not None:
+        ax.set_xlim(right=tmax)
 
     if show:
         plt.show()